@@ -1,10 +1,10 @@
 import aiohttp
 import asyncio
 import os
-import random
-from datetime import datetime
+import time
 import logging
 import sunetnextcloud
+import sunetperformance
 
 logger = logging.getLogger("TestLogger")
 logging.basicConfig(
@@ -33,48 +33,110 @@ if g_max_frontendserver is None:
 else:
     g_max_frontendserver = int(g_max_frontendserver)
 
-async def make_request(session, url, serverid, ocsheaders):
+# closed: a fixed number of workers send the next call as soon as the previous one returns
+# open: calls arrive at a fixed rate, latency is measured from the scheduled arrival time
+g_loadtestmode = os.environ.get("NextcloudLoadtestMode", "closed")
+if g_loadtestmode not in ["closed", "open"]:
+    logger.warning(f"Unknown load test mode {g_loadtestmode}, using closed as default")
+    g_loadtestmode = "closed"
+
+# Number of workers, which is the upper limit of calls in flight in both modes
+g_loadtestconcurrency = int(os.environ.get("NextcloudLoadtestConcurrency", 50))
+# Arrival rate in calls per second for the open model
+g_loadtestrate = float(os.environ.get("NextcloudLoadtestRate", 100))
+# Calls waiting for a worker, the producer blocks when the queue is full
+g_loadtestqueue = int(os.environ.get("NextcloudLoadtestQueue", 1000))
+
+
+async def make_request(session, url, fe, scheduled, latencies, errors):
+    startTime = time.perf_counter()
+    if scheduled is None:
+        scheduled = startTime
     try:
-        session.cookie_jar.update_cookies({"SERVERID": serverid})
-        startTime = datetime.now()
-        async with session.get(url, headers=ocsheaders) as response:
-            response_text = await response.text()
-        elapsed_time = (datetime.now() - startTime).total_seconds()
-        return elapsed_time, response_text
+        async with session.get(url, headers=drv.ocsheaders) as response:
+            await response.read()
+            if response.status != 200:
+                raise Exception(f"HTTP {response.status}")
+        latencies[fe].record(time.perf_counter() - scheduled)
     except Exception as e:
-        logger.error(f'Exception for {serverid}: {e}')
-        return 0, None
-
-async def run_concurrent_calls(calls, url, ocsheaders, nodebaseurl):
-    totalTime = 0
-    async with aiohttp.ClientSession() as session:
-        tasks = []
-        for call in range(calls):
-            fe = random.randint(g_min_frontendserver,g_max_frontendserver)
-            serverid = f"node{fe}.{nodebaseurl}"
-            task = make_request(session, url, serverid, ocsheaders)
-            tasks.append(task)
-
-        results = await asyncio.gather(*tasks)
-        for elapsed_time, response_text in results:
-            totalTime += elapsed_time
-            # json response
-            # logger.info(response_text)
-
-    return totalTime
+        logger.error(f"Exception for fe{fe}: {e}")
+        errors[fe] += 1
+
+
+async def worker(queue, sessions, url, latencies, errors):
+    while True:
+        item = await queue.get()
+        if item is None:
+            queue.task_done()
+            return
+        fe, scheduled = item
+        await make_request(sessions[fe], url, fe, scheduled, latencies, errors)
+        queue.task_done()
+
+
+async def produce(queue, calls, frontends, rate):
+    startTime = time.perf_counter()
+    for call in range(calls):
+        fe = frontends[call % len(frontends)]
+        scheduled = None
+        if rate is not None:
+            scheduled = startTime + call / rate
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        await queue.put((fe, scheduled))
+    for w in range(g_loadtestconcurrency):
+        await queue.put(None)
 
+
+async def run_load(calls, url, auth, nodebaseurl):
+    """Send calls to url spread round robin over the frontends, each frontend with its own session pinned by SERVERID
+    Returns the latency histogram and error count per frontend and the wall clock time of the run
+    """
+    frontends = list(range(g_min_frontendserver, g_max_frontendserver + 1))
+    latencies = {fe: sunetperformance.LatencyHistogram() for fe in frontends}
+    errors = {fe: 0 for fe in frontends}
+    rate = g_loadtestrate if g_loadtestmode == "open" else None
+    queue = asyncio.Queue(maxsize=g_loadtestqueue)
+
+    sessions = {}
+    for fe in frontends:
+        sessions[fe] = aiohttp.ClientSession(
+            auth=aiohttp.BasicAuth(*auth),
+            cookies={"SERVERID": f"node{fe}.{nodebaseurl}"},
+            connector=aiohttp.TCPConnector(limit=g_loadtestconcurrency),
+        )
+    startTime = time.perf_counter()
+    try:
+        workers = [
+            asyncio.create_task(worker(queue, sessions, url, latencies, errors))
+            for w in range(g_loadtestconcurrency)
+        ]
+        await produce(queue, calls, frontends, rate)
+        await asyncio.gather(*workers)
+    finally:
+        for session in sessions.values():
+            await session.close()
+    wallTime = time.perf_counter() - startTime
+    return latencies, errors, wallTime
+
+
+drv.prefetch_credentials(["ocsuser", "ocsuserapppassword"])
 message = "\n"
 for fullnode in drv.nodestotest:
-    nodeuser = drv.get_ocsuser(fullnode)
-    nodepwd = drv.get_ocsuserapppassword(fullnode)
-    nodebaseurl = drv.get_node_base_url(fullnode)
-    url = drv.get_users_url(fullnode)
-    logger.info(f'Testing {url} with {g_loadtestcalls} calls on fe{g_min_frontendserver} to fe{g_max_frontendserver}')
-    url = url.replace("$USERNAME$", nodeuser)
-    url = url.replace("$PASSWORD$", nodepwd)
-    message += f"{g_loadtestcalls} calls to {nodebaseurl:<30}"
-
-    totalTime = asyncio.run(run_concurrent_calls(g_loadtestcalls, url, drv.ocsheaders, nodebaseurl))
-    message += f"Total: {totalTime:<3.1f}s - Per call: {totalTime/g_loadtestcalls:<3.1f}s \n"
-
-logger.info(f'{message}')
+    endpoints = drv.get_endpoints(fullnode)
+    nodebaseurl = endpoints.host
+    url = endpoints.users
+    logger.info(
+        f"Testing {url} with {g_loadtestcalls} calls on fe{g_min_frontendserver} to fe{g_max_frontendserver}, {g_loadtestmode} model"
+    )
+
+    latencies, errors, wallTime = asyncio.run(
+        run_load(g_loadtestcalls, url, drv.get_ocs_auth(fullnode), nodebaseurl)
+    )
+    completed = sum(histogram.count for histogram in latencies.values())
+    message += f"{g_loadtestcalls} calls to {nodebaseurl:<30} - {g_loadtestmode} model - {completed / wallTime:.1f} calls/s in {wallTime:.1f}s\n"
+    for fe, histogram in latencies.items():
+        message += f"   fe{fe}: {errors[fe]} failed - {histogram.summary()}\n"
+
+logger.info(f"{message}")
@@ -2,13 +2,11 @@
 Author: Richard Freitag <freitag@sunet.se>
 """
 
-from webdav3.client import Client
 import logging
 import threading
-import time
 import sys
-from datetime import datetime
 import sunetnextcloud
+import sunetwebdav
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(format = '%(asctime)s - %(module)s.%(funcName)s - %(levelname)s: %(message)s',
@@ -26,11 +24,7 @@ nodepwd = drv.get_seleniumuserpassword(fullnode)
 url = drv.get_webdav_url(fullnode, nodeuser)
 url = url.replace('files','trashbin')
 
-maxDeletes = 13                                           # Number of files to delete simultaneously
-
-WebDavPerformance_timeout = 30
-davPerformanceResults = []
-testThreadsRunning = 0
+maxDeletes = 13                                           # Number of files to delete simultaneously if the trashbin cannot be emptied at once
 
 def excepthook(args):
     logger.error(f'Threading exception: {args}')
@@ -41,45 +35,9 @@ threading.excepthook = excepthook
 logger.info(f'TestID: {fullnode}')
 logger.info(f'URL: {url}')
 
-options = {
-'webdav_hostname': url,
-'webdav_login' : nodeuser,
-'webdav_password' : nodepwd,
-'webdav_timeout': WebDavPerformance_timeout
-}
-
-client = Client(options)
-# logger.info(client.list())
-# client.mkdir('performance')
-
-davElements = client.list('trash')
-numFiles = len(davElements)
-logger.info(f'Remove {numFiles} elements from trash for {fullnode}')
-davElements.pop(0)
-startTime = datetime.now()
-
-for i in range(0,numFiles,maxDeletes):
-    x = i
-    logger.info(f'Batch delete {len(davElements[x:x+maxDeletes])} elements on {fullnode}')
-    for element in davElements[x:x+maxDeletes]:
-        targetdeletefile = f'trash/{element}'
-        # logger.info(f'Delete {targetdeletefile}')
-        t = threading.Thread(target=client.clean, args=[targetdeletefile])
-        t.start()
-    while threading.active_count() > 1:
-        time.sleep(0.01)
-
-deleteTime = (datetime.now() - startTime).total_seconds()
-
-lText = f'{fullnode} '
-rText = f'Delete: {deleteTime:.1f}s at {deleteTime/numFiles:.2f} s/file - {numFiles/deleteTime:.2f} files/s' 
-
-message = f'{lText : <16}{rText : <40}'
-logger.info(f'{message}')
-davPerformanceResults.append(message)
-
-logger.info(f'Results for {numFiles} with max {maxDeletes} concurrent deletes')
-for message in davPerformanceResults:
-    logger.info(f'{message}')
+session = sunetwebdav.get_webdav_session(drv, fullnode, nodeuser, nodepwd)
+cleaner = sunetwebdav.TrashbinCleaner(session, url, concurrency=maxDeletes)
+cleaner.empty()
+logger.info(f'{fullnode : <16}{cleaner.report()}')
 
 logger.info('Done')
\ No newline at end of file
@@ -2,8 +2,6 @@
 Author: Richard Freitag <freitag@sunet.se>
 """
 
-import tempfile
-import os
 from webdav3.client import Client
 from webdav3.exceptions import WebDavException
 import logging
@@ -12,6 +10,11 @@ import time
 import sys
 from datetime import datetime
 
+import requests
+from requests.adapters import HTTPAdapter
+
+import sunetwebdav
+
 nodeuser = 'admin'                                          # replace with your username
 nodepwd = 'adminpassword'                                   # replace with your password
 url = 'http://localhost:8080/remote.php/dav/files/admin/'   # webdav url for the user
@@ -19,7 +22,7 @@ url = 'http://localhost:8080/remote.php/dav/files/admin/'   # webdav url for the
 numFiles = 10000                                            # Total number of files to upload and delete
 maxUploads = 1000                                           # Number of files to upload simultaneously
 maxDeletes = 1000                                           # Number of files to delete simultaneously
-fileSizeInBytes = 1024                                      # File size will be filled with randomly generated content
+fileSizeInBytes = 1024                                      # File size will be filled with seeded pseudo-random content
 
 WebDavPerformance_timeout = 30
 davPerformanceResults = []
@@ -55,15 +58,22 @@ client.verify = False
 logger.info(client.list())
 client.mkdir('performance')
 
-logger.info('Generate local files')
 files = []
+sources = {}
 for i in range(0,numFiles):
     filename = f'{fullnode}{str(i)}.bin'
-    pathname = f'{tempfile.gettempdir()}/{filename}'
-    with open(pathname, 'wb') as fout:
-        fout.write(os.urandom(fileSizeInBytes))
+    sources[filename] = sunetwebdav.RandomUploadSource(fileSizeInBytes, seed=filename)
+    # Checksum the content for the OC-Checksum header before the uploads are timed
+    sunetwebdav.checksum_headers(sources[filename])
     files.append(filename)
 
+def uploadSourceAsync(source, remote_path):
+    # Like client.upload_async, but streams generated content instead of reading a local file
+    def upload():
+        sunetwebdav.upload_source(client, source, remote_path)
+        decreaseUploadCount()
+    threading.Thread(target=upload).start()
+
 startTime = datetime.now()
 logger.info(f'Async upload of {maxUploads} files concurrently')
 try:
@@ -73,7 +83,7 @@ try:
         for file in files[x:x+maxUploads]:
             try:
                 testThreadsRunning += 1
-                client.upload_async(remote_path=f'performance/{file}',local_path=f'{tempfile.gettempdir()}/{file}', callback=decreaseUploadCount)
+                uploadSourceAsync(sources[file], f'performance/{file}')
             except WebDavException as exception:
                 logger.info(f'Error uploading {filename}: {exception}')
                 testThreadsRunning -= 1
@@ -86,25 +96,19 @@ except Exception as error:
 # Calculate time to upload
 uploadTime = (endTime - startTime).total_seconds()
 
-# Remove the temporary files
-logger.info('Remove temporary files')
-for i in range(0,numFiles):
-    filename = f'{tempfile.gettempdir()}/{fullnode}{str(i)}.bin'
-    os.remove(filename)
-
 davElements = client.list('performance')
 logger.info(f'{davElements}')
 # davElements.pop(0)
 startTime = datetime.now()
 
-for i in range(0,len(davElements),maxDeletes):
-    x = i
-    logger.info(f'Batch delete {davElements[x:x+maxDeletes]}')
-    for element in davElements[x:x+maxDeletes]:
-        t = threading.Thread(target=client.clean, args=['performance/' + element])
-        t.start()
-    while threading.active_count() > 1:
-        time.sleep(0.01)
+session = requests.Session()
+session.auth = (nodeuser, nodepwd)
+session.verify = False
+session.mount('http://', HTTPAdapter(pool_maxsize=maxDeletes))
+session.mount('https://', HTTPAdapter(pool_maxsize=maxDeletes))
+deleteEngine = sunetwebdav.DeleteEngine(session, url, maxDeletes)
+deleteEngine.delete(['performance/' + element for element in davElements])
+logger.info(deleteEngine.report())
 
 deleteTime = (datetime.now() - startTime).total_seconds()
 
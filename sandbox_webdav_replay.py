@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""Record WebDAV traces from the request timings of a test run and replay them
+Author: Richard Freitag <freitag@sunet.se>
+record turns the request timings written by sunetnextcloud (NextcloudTestTimingFile) into a compact trace,
+replay sends the requests of a trace to a target, by default the local docker instance, and reports the latencies.
+"""
+
+import argparse
+import json
+import logging
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import sunetwebdav
+
+logger = logging.getLogger("TestLogger")
+logging.basicConfig(
+    format="%(asctime)s - %(module)s.%(funcName)s - %(levelname)s: %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+    level=logging.INFO,
+)
+
+parser = argparse.ArgumentParser(
+    description="Record and replay WebDAV traces", formatter_class=argparse.ArgumentDefaultsHelpFormatter
+)
+subparsers = parser.add_subparsers(dest="command", required=True)
+recordParser = subparsers.add_parser("record", help="Write the WebDAV requests of a timing file to a trace")
+recordParser.add_argument("timings", help="Request timings as JSON lines")
+recordParser.add_argument("trace", help="Trace file, compressed if it ends with .gz")
+recordParser.add_argument("--node", help="Only trace requests to this node")
+replayParser = subparsers.add_parser("replay", help="Replay a trace")
+replayParser.add_argument("trace", help="Trace file")
+replayParser.add_argument("--url", default="http://localhost:8080", help="Nextcloud base url")
+replayParser.add_argument("--user", default="admin", help="User to replay the trace as")
+replayParser.add_argument("--password", default="adminpassword", help="Password or app password of the user")
+replayParser.add_argument("--scale", type=float, default=1.0, help="Time scale, 10 replays ten times as fast")
+replayParser.add_argument(
+    "--concurrency", type=int, default=sunetwebdav.g_replayConcurrency, help="Maximum number of requests in flight"
+)
+args = parser.parse_args()
+
+if args.command == "record":
+    with open(args.timings) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    if args.node is not None:
+        records = [record for record in records if record.get("node") == args.node]
+    count = sunetwebdav.write_trace(args.trace, records)
+    logger.info(f"Traced {count} of {len(records)} requests to {args.trace}")
+else:
+    entries = sunetwebdav.read_trace(args.trace)
+    session = requests.Session()
+    # One keep-alive connection per request in flight, so replay latencies do not include new handshakes
+    session.mount("http://", HTTPAdapter(pool_maxsize=args.concurrency))
+    session.mount("https://", HTTPAdapter(pool_maxsize=args.concurrency))
+    session.auth = (args.user, args.password)
+    replayer = sunetwebdav.TraceReplayer(
+        session, args.url.rstrip("/"), args.user, timeScale=args.scale, concurrency=args.concurrency
+    )
+    logger.info(f"Replaying {len(entries)} requests from {args.trace} against {args.url}")
+    replayer.replay(entries)
+    logger.info(replayer.report())
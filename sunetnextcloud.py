@@ -2,69 +2,193 @@
 Author: Richard Freitag <freitag@sunet.se>
 TestTarget is a helper class containing node-information, as well as for saving and retrieving node-local usernames/passwords.
 expected.yaml contains expected results when retrieving status.php from a Sunet Drive node
+SeleniumHelper is implemented in sunetselenium and only imported when a test uses it.
+decode_ocs parses OCS replies, with orjson if it is installed, and raises OcsError with the status codes.
 """
 
+import asyncio
+import atexit
+import hashlib
+import inspect
+import json
 import logging
 import os
+import pickle
 import random
+import socket
 import string
 import sys
+import threading
 import time
 import unittest
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from enum import Enum
+from urllib.parse import urlsplit
 
-import HtmlTestRunner
-import pyotp
 import requests
-import xmlrunner
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.connection import HTTPConnection, HTTPSConnection
+from requests.packages.urllib3.connectionpool import (
+    HTTPConnectionPool,
+    HTTPSConnectionPool,
+)
+from requests.packages.urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+from requests.packages.urllib3.util.connection import allowed_gai_family
+from requests.packages.urllib3.util.retry import Retry
 import yaml
-from selenium import webdriver
-from selenium.common.exceptions import TimeoutException
-from selenium.webdriver import EdgeOptions, FirefoxOptions
-from selenium.webdriver.chrome.options import Options as ChromeOptions
-from selenium.webdriver.common.by import By
-from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.safari.options import Options as SafariOptions
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.support.ui import WebDriverWait
+
+try:
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:
+    from yaml import SafeLoader as YamlLoader
 
 g_requestTimeout = 30
 
-# Change to local directory
-abspath = os.path.abspath(__file__)
-dname = os.path.dirname(abspath)
-os.chdir(dname)
+# JSON parser for OCS replies, orjson.loads if orjson is installed, chosen on the first reply
+g_jsonLoads = None
+
+# Files next to this module are looked up relative to it, independent of the working directory
+g_basedir = os.path.dirname(os.path.abspath(__file__))
 
 logger = logging.getLogger(__name__)
-logging.basicConfig(
-    format="%(asctime)s - %(module)s.%(funcName)s - %(levelname)s: %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S",
-    level=logging.INFO,
-)
 
 target_env = os.environ.get("NextcloudTestTarget")
 if target_env == "localhost":
-    g_expectedFile = "expected_localhost.yaml"
+    g_expectedFile = os.path.join(g_basedir, "expected_localhost.yaml")
 elif target_env == "custom":
-    g_expectedFile = "expected_custom.yaml"
+    g_expectedFile = os.path.join(g_basedir, "expected_custom.yaml")
 else:
-    g_expectedFile = "expected.yaml"
-
-use_driver_service = False
-if os.environ.get("SELENIUM_DRIVER_SERVICE") == "True":
-    use_driver_service = True
-
-geckodriver_path = "/usr/bin/geckodriver"
-if not os.path.isfile(geckodriver_path):
-    geckodriver_path = "/snap/bin/geckodriver"
+    g_expectedFile = os.path.join(g_basedir, "expected.yaml")
 
-opsbase = "sunet-drive-ops/"
+opsbase = os.path.join(g_basedir, "sunet-drive-ops/")
 opsCommonFile = opsbase + "/global/overlay/etc/hiera/data/common.yaml"
 # opsCosmosDbFile = opsbase + "/global/overlay/etc/puppet/cosmos-db.yaml"
 
 ocsheaders = {"OCS-APIRequest": "true"}
 
+# Connection pools are shared between all sessions handed out by TestTarget.get_session
+g_sessionPoolSize = 10
+g_sessionPoolConnections = 4  # Node url and the direct node1-3 frontend urls
+# Sessions retry failed connections only, so checks see every 5xx reply as it was sent.
+# Callers that want to ride out a flaky frontend opt in with retries=g_sessionStatusRetries
+g_sessionRetries = Retry(
+    total=3, connect=3, read=0, status=0, backoff_factor=0.1, status_forcelist=(), raise_on_status=False
+)
+g_sessionStatusRetries = Retry(
+    total=5, backoff_factor=0.1, status_forcelist=[500, 502, 503, 504]
+)
+g_sessionAdapters = {}
+g_sessionLock = threading.Lock()
+
+# Timing records of every request sent through a TestTarget session, kept in a ring buffer
+# and appended as JSON lines to g_timingFile when the process exits. Recording is off unless
+# NextcloudTestTimingFile is set, a relative file is placed next to this module. A buffer size of 0 disables recording.
+g_timingFile = os.environ.get("NextcloudTestTimingFile")
+if g_timingFile:
+    g_timingFile = os.path.join(g_basedir, g_timingFile)
+    g_timingBufferSize = int(os.environ.get("NextcloudTestTimingBuffer", 100000))
+else:
+    g_timingBufferSize = 0
+g_requestTimings = deque(maxlen=max(g_timingBufferSize, 1))
+# DNS, connect and TLS times of a connection opened by the current thread's request
+g_connectTimings = threading.local()
+g_endpointKinds = [
+    ("/status.php", "status"),
+    ("/ocs/", "ocs"),
+    ("/remote.php/", "webdav"),
+    ("/.well-known/", "wellknown"),
+    ("/login", "login"),
+]
+
+# Parsed yaml files, keyed on absolute path and invalidated when the mtime changes
+g_configCache = {}
+g_configLock = threading.Lock()
+# Optional directory for pickled snapshots of parsed yaml files, shared between processes
+g_configSnapshotDir = os.environ.get("NextcloudTestConfigCache")
+g_opsCommonFileMissing = False
+
+# Concurrency limits for run_node_checks, for the whole environment and per host
+g_runnerConcurrency = int(os.environ.get("NextcloudTestConcurrency", 32))
+g_runnerHostConcurrency = int(os.environ.get("NextcloudTestHostConcurrency", 4))
+
+# Credential kinds: environment variable prefix and suffix around the node or user id,
+# and the NodeCredentials.ps1 function used to look them up on Windows
+g_credentialKinds = {
+    "ocsuser": ("NEXTCLOUD_OCS_USER_", "", "Get-OcsUser"),
+    "ocsuserpassword": ("NEXTCLOUD_OCS_PASSWORD_", "", "Get-OcsPassword"),
+    "ocsuserapppassword": ("NEXTCLOUD_OCS_APP_PASSWORD_", "", "Get-OcsAppPassword"),
+    "seleniumuser": ("NEXTCLOUD_SELENIUM_USER_", "", "Get-SeleniumUser"),
+    "seleniumuserpassword": (
+        "NEXTCLOUD_SELENIUM_PASSWORD_",
+        "",
+        "Get-SeleniumUserPassword",
+    ),
+    "seleniumuserapppassword": (
+        "NEXTCLOUD_SELENIUM_APP_PASSWORD_",
+        "",
+        "Get-SeleniumUserAppPassword",
+    ),
+    "seleniumusertotpsecret": (
+        "NEXTCLOUD_SELENIUM_SECRET_",
+        "",
+        "Get-SeleniumMfaUserTotpSecret",
+    ),
+    "seleniummfauser": ("NEXTCLOUD_SELENIUM_MFA_USER_", "", "Get-SeleniumMfaUser"),
+    "seleniummfauserpassword": (
+        "NEXTCLOUD_SELENIUM_MFA_PASSWORD_",
+        "",
+        "Get-SeleniumMfaUserPassword",
+    ),
+    "seleniummfauserapppassword": (
+        "NEXTCLOUD_SELENIUM_MFA_APP_PASSWORD_",
+        "",
+        "Get-SeleniumMfaUserAppPassword",
+    ),
+    "seleniummfausertotpsecret": (
+        "NEXTCLOUD_SELENIUM_MFA_SECRET_",
+        "",
+        "Get-SeleniumMfaUserTotpSecret",
+    ),
+    "jupyteruser": ("NEXTCLOUD_JUPYTER_USER_", "", "Get-SeleniumMfaUser"),
+    "jupyteruserpassword": (
+        "NEXTCLOUD_JUPYTER_PASSWORD_",
+        "",
+        "Get-SeleniumUserPassword",
+    ),
+    "samlusername": ("NEXTCLOUD_SAML_USER_", "", "Get-SamlUserName"),
+    "samluseralias": ("NEXTCLOUD_SAML_USER_", "_ALIAS", "Get-SamlUserName"),
+    "samluserpassword": ("NEXTCLOUD_SAML_PASSWORD_", "", "Get-SamlUserPassword"),
+    "samlusertotpsecret": (
+        "NEXTCLOUD_SELENIUM_SAML_MFA_SECRET_",
+        "",
+        "Get-SamlUserTotpSecret",
+    ),
+}
+# Resolved credentials, keyed on platform, target, kind and node or user id
+g_credentialCache = {}
+
+# Endpoint tables per node, keyed on the target and the url parts they are built from
+g_endpointTables = {}
+
+
+def configure_logging(level=logging.INFO):
+    """Set up the log format used by all tests, this does nothing if logging is already configured"""
+    logging.basicConfig(
+        format="%(asctime)s - %(module)s.%(funcName)s - %(levelname)s: %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+        level=level,
+    )
+
+
+def __getattr__(name):
+    # Selenium and pyotp are slow to import, only load them for tests that drive a browser
+    if name == "SeleniumHelper":
+        from sunetselenium import SeleniumHelper
+
+        return SeleniumHelper
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 def get_value(env, raiseException=True):
     value = os.environ.get(env)
@@ -80,39 +204,595 @@ def get_value(env, raiseException=True):
     return value
 
 
-class TestTarget(object):
-    with open(g_expectedFile, "r") as stream:
-        expectedResults = yaml.safe_load(stream)
-
-    if os.path.exists(opsCommonFile):
-        with open(opsCommonFile, "r") as stream:
-            opsCommonConfig = yaml.safe_load(stream)
-    else:
-        logger.warning(
-            f"File {opsCommonFile} not found, you should check out the ops repo to test against expected values!"
+def _config_snapshot_file(path):
+    digest = hashlib.sha1(path.encode("utf-8")).hexdigest()
+    return os.path.join(g_configSnapshotDir, f"{digest}.pickle")
+
+
+def _load_config_snapshot(path, mtime, size):
+    snapshotFile = _config_snapshot_file(path)
+    try:
+        with open(snapshotFile, "rb") as stream:
+            snapshot = pickle.load(stream)
+    except FileNotFoundError:
+        return None
+    except Exception as error:
+        logger.warning(f"Ignoring unreadable config snapshot {snapshotFile}: {error}")
+        return None
+    if (
+        snapshot.get("path") != path
+        or snapshot.get("mtime") != mtime
+        or snapshot.get("size") != size
+    ):
+        return None
+    return snapshot.get("data")
+
+
+def _save_config_snapshot(path, mtime, size, data):
+    snapshotFile = _config_snapshot_file(path)
+    tmpFile = f"{snapshotFile}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(g_configSnapshotDir, exist_ok=True)
+        with open(tmpFile, "wb") as stream:
+            pickle.dump(
+                {"path": path, "mtime": mtime, "size": size, "data": data},
+                stream,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+        os.replace(tmpFile, snapshotFile)
+    except Exception as error:
+        logger.warning(f"Unable to write config snapshot {snapshotFile}: {error}")
+
+
+def load_yaml(path, prepare=None):
+    """Parse a yaml file once per process, it is parsed again only if its mtime or size changed.
+    The returned data is shared between all callers and must not be modified.
+    prepare(data) is called once on the cached data, e.g. to sort lists in place, before it is returned.
+    If NextcloudTestConfigCache is set, parsed files are also pickled to that directory
+    so other test processes can skip the yaml parsing.
+    """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    with g_configLock:
+        cached = g_configCache.get(path)
+        if cached is not None and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+            if prepare is not None and prepare not in cached[3]:
+                prepare(cached[2])
+                cached[3].add(prepare)
+            return cached[2]
+
+    data = None
+    if g_configSnapshotDir:
+        data = _load_config_snapshot(path, stat.st_mtime_ns, stat.st_size)
+    if data is None:
+        with open(path, "r") as stream:
+            data = yaml.load(stream, Loader=YamlLoader)
+        if g_configSnapshotDir:
+            _save_config_snapshot(path, stat.st_mtime_ns, stat.st_size, data)
+
+    prepared = set()
+    if prepare is not None:
+        prepare(data)
+        prepared.add(prepare)
+    with g_configLock:
+        g_configCache[path] = (stat.st_mtime_ns, stat.st_size, data, prepared)
+    return data
+
+
+def sort_node_lists(expectedResults):
+    expectedResults["global"]["allnodes"].sort()
+    expectedResults["global"]["fullnodes"].sort()
+    expectedResults["global"]["multinodes"].sort()
+
+
+def get_expected_results():
+    return load_yaml(g_expectedFile, sort_node_lists)
+
+
+def get_ops_common_config():
+    global g_opsCommonFileMissing
+    if not os.path.exists(opsCommonFile):
+        if not g_opsCommonFileMissing:
+            logger.warning(
+                f"File {opsCommonFile} not found, you should check out the ops repo to test against expected values!"
+            )
+            g_opsCommonFileMissing = True
+        return None
+    return load_yaml(opsCommonFile)
+
+
+class ExpectedResult(object):
+    """Class attribute of TestTarget that is looked up in the expected results on first access,
+    so that importing this module does not parse any yaml.
+    The value is stored on the instance, so every TestTarget resolves it only once.
+    """
+
+    def __init__(self, *keys, loader=get_expected_results):
+        self.keys = keys
+        self.loader = loader
+        self.name = None
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner=None):
+        value = self.loader()
+        for key in self.keys:
+            value = value[key]
+        if instance is not None and self.name is not None:
+            instance.__dict__[self.name] = value
+        return value
+
+
+class TimedConnectionMixin(object):
+    """Measures name resolution, TCP connect and TLS handshake of new connections
+    The result is left in g_connectTimings for the request that caused the connection
+    """
+
+    def _new_conn(self):
+        # The host name is resolved once and its addresses are tried in order, as urllib3 does,
+        # so there is no second lookup and the connect time holds only the TCP handshakes
+        start = time.perf_counter()
+        try:
+            addresses = socket.getaddrinfo(self._dns_host, self.port, allowed_gai_family(), socket.SOCK_STREAM)
+        except OSError:
+            return super()._new_conn()  # Raises the name resolution error of urllib3
+        resolved = time.perf_counter()
+        error = None
+        for family, socktype, proto, _, address in addresses:
+            sock = socket.socket(family, socktype, proto)
+            try:
+                for option in self.socket_options or ():
+                    sock.setsockopt(*option)
+                # Anything else is the default timeout sentinel of urllib3
+                if self.timeout is None or isinstance(self.timeout, (int, float)):
+                    sock.settimeout(self.timeout)
+                if self.source_address:
+                    sock.bind(self.source_address)
+                sock.connect(address)
+            except socket.timeout:
+                sock.close()
+                error = ConnectTimeoutError(
+                    self, f"Connection to {self.host} timed out. (connect timeout={self.timeout})"
+                )
+            except OSError as e:
+                sock.close()
+                error = NewConnectionError(self, f"Failed to establish a new connection: {e}")
+            else:
+                g_connectTimings.dns = resolved - start
+                g_connectTimings.connect = time.perf_counter() - resolved
+                return sock
+        raise error
+
+    def connect(self):
+        start = time.perf_counter()
+        super().connect()
+        elapsed = time.perf_counter() - start
+        dns = getattr(g_connectTimings, "dns", 0.0)
+        connect = getattr(g_connectTimings, "connect", 0.0)
+        if isinstance(self, HTTPSConnection):
+            tls = max(elapsed - dns - connect, 0.0)
+        else:
+            tls = None
+        g_connectTimings.opened = (dns, connect, tls)
+
+
+class TimedHTTPConnection(TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(TimedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+def get_endpoint_kind(path):
+    for marker, kind in g_endpointKinds:
+        if marker in path:
+            return kind
+    return "other"
+
+
+def get_frontend(request, response):
+    """Return the SERVERID the request was pinned to or the one the load balancer assigned"""
+    if response is not None and "SERVERID" in response.cookies:
+        return response.cookies.get("SERVERID")
+    for cookie in request.headers.get("Cookie", "").split(";"):
+        name, sep, value = cookie.strip().partition("=")
+        if name == "SERVERID":
+            return value
+    return None
+
+
+def record_request_timing(node, request, response, start, timestamp, error=None):
+    total = time.perf_counter() - start
+    opened = getattr(g_connectTimings, "opened", None)
+    g_connectTimings.opened = None
+    url = urlsplit(request.url)
+    record = {
+        "time": round(timestamp, 3),
+        "node": node,
+        "frontend": get_frontend(request, response),
+        "kind": get_endpoint_kind(url.path),
+        "method": request.method,
+        "host": url.hostname,
+        "path": url.path,
+        "sent": int(request.headers.get("Content-Length", 0)),
+        "depth": request.headers.get("Depth"),
+        "destination": None,
+        "status": None,
+        "bytes": None,
+        "reused": None,
+        "dns": None,
+        "connect": None,
+        "tls": None,
+        "ttfb": None,
+        "total": total,
+        "error": error,
+    }
+    if "Destination" in request.headers:
+        record["destination"] = urlsplit(request.headers["Destination"]).path
+    if opened is not None:
+        record["dns"], record["connect"], record["tls"] = opened
+    if response is not None:
+        record["reused"] = opened is None
+        record["status"] = response.status_code
+        # elapsed runs from sending the request to the parsed headers, on a new connection it includes opening it
+        ttfb = response.elapsed.total_seconds()
+        if opened is not None:
+            ttfb -= sum(timing for timing in opened if timing is not None)
+        record["ttfb"] = max(ttfb, 0.0)
+        received = response.raw.tell() if hasattr(response.raw, "tell") else 0
+        if received == 0:
+            received = int(response.headers.get("Content-Length", 0))
+        record["bytes"] = received
+    g_requestTimings.append(record)
+
+
+def export_request_timings(path=None):
+    """Append the recorded request timings to path as JSON lines and empty the buffer"""
+    if path is None:
+        path = g_timingFile
+    if not path or len(g_requestTimings) == 0:
+        return 0
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    count = 0
+    with open(path, "a") as f:
+        while g_requestTimings:
+            f.write(json.dumps(g_requestTimings.popleft()) + "\n")
+            count += 1
+    return count
+
+
+atexit.register(export_request_timings)
+
+
+class TimedSession(requests.Session):
+    """Session that records the timings of every request it sends in g_requestTimings"""
+
+    def __init__(self, node=None):
+        super().__init__()
+        self.node = node
+
+    def send(self, request, **kwargs):
+        if g_timingBufferSize <= 0:
+            return super().send(request, **kwargs)
+        g_connectTimings.opened = None
+        timestamp = time.time()
+        start = time.perf_counter()
+        response = None
+        error = None
+        try:
+            response = super().send(request, **kwargs)
+            return response
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            record_request_timing(
+                self.node, request, response, start, timestamp, error
+            )
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter whose connection pool outlives the sessions it is mounted on,
+    closing a session keeps the keep-alive connections for the next session to the same node.
+    The connections are only timed when request timings are recorded.
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        if g_timingBufferSize <= 0:
+            return
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": TimedHTTPConnectionPool,
+            "https": TimedHTTPSConnectionPool,
+        }
+
+    def close(self):
+        pass
+
+    def close_pool(self):
+        super().close()
+
+
+def get_pooled_adapter(node, poolsize=None, retries=None):
+    """Return the shared adapter of node, there is one per pool size and retry policy"""
+    if poolsize is None:
+        poolsize = g_sessionPoolSize
+    if retries is None:
+        retries = g_sessionRetries
+    key = (node, poolsize, retries)
+    with g_sessionLock:
+        adapter = g_sessionAdapters.get(key)
+        if adapter is None:
+            adapter = PooledHTTPAdapter(
+                pool_connections=g_sessionPoolConnections,
+                pool_maxsize=poolsize,
+                max_retries=retries,
+            )
+            g_sessionAdapters[key] = adapter
+        return adapter
+
+
+def close_pooled_adapters():
+    with g_sessionLock:
+        for adapter in g_sessionAdapters.values():
+            adapter.close_pool()
+        g_sessionAdapters.clear()
+
+
+class NodeEndpoints(
+    namedtuple(
+        "NodeEndpoints",
+        [
+            "node",
+            "host",
+            "url",
+            "status",
+            "capabilities",
+            "apps",
+            "appconfig",
+            "users",
+            "groups",
+            "shares",
+            "apppassword",
+            "webdav",
+            "frontends",
+            "multinodeusers",
+        ],
+    )
+):
+    """Immutable table of the endpoint urls of a node, built once by TestTarget.get_endpoints
+    The urls never contain credentials, pass them with auth=TestTarget.get_ocs_auth(node) instead
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def build(cls, node, host, multinodehost=None):
+        url = "https://" + host
+        ocs = url + "/ocs/v2.php"
+        if multinodehost is not None:
+            multinodeusers = "https://" + multinodehost + "/ocs/v2.php/cloud/users"
+        else:
+            multinodeusers = None
+        return cls(
+            node=node,
+            host=host,
+            url=url,
+            status=url + "/status.php",
+            capabilities=ocs + "/cloud/capabilities",
+            apps=ocs + "/cloud/apps",
+            appconfig=ocs + "/apps/provisioning_api/api/v1/config/apps",
+            users=ocs + "/cloud/users",
+            groups=ocs + "/cloud/groups",
+            shares=ocs + "/apps/files_sharing/api/v1/shares",
+            apppassword=ocs + "/core/apppassword",
+            webdav=url + "/remote.php/dav/files",
+            frontends=tuple(f"https://node{fe}.{host}" for fe in range(1, 4)),
+            multinodeusers=multinodeusers,
         )
 
-    baseurl = expectedResults["global"]["baseUrl"]
-    testprefix = expectedResults["global"]["testPrefix"]
-    nodeprefix = expectedResults["global"]["nodePrefix"]
-    docprefix = expectedResults["global"]["docPrefix"]
-    indexsuffix = expectedResults["global"]["indexSuffix"]
-    ocsheaders = ocsheaders
+    def app(self, app):
+        return self.apps + "/" + app
 
-    # default target is test, unless overwritten by initializing with 'prod'
-    targetprefix = "." + testprefix
+    def app_config_keys(self, app):
+        return self.appconfig + "/" + app
+
+    def app_config_value(self, app, key):
+        return self.appconfig + "/" + app + "/" + key
+
+    def user(self, user):
+        return self.users + "/" + user
+
+    def disable_user(self, user):
+        return self.users + "/" + user + "/disable"
+
+    def group(self, group):
+        return self.groups + "/" + group
+
+    def frontend_users(self, fe):
+        return self.frontends[fe - 1] + "/ocs/v2.php/cloud/users"
+
+    def webdav_root(self, user):
+        return self.webdav + "/" + user + "/"
+
+
+class OcsError(Exception):
+    """An OCS reply that could not be used, status is the HTTP status and statuscode the OCS status code"""
+
+    def __init__(self, message, url=None, status=None, statuscode=None):
+        super().__init__(message)
+        self.url = url
+        self.status = status
+        self.statuscode = statuscode
+
+
+class OcsDecodeError(OcsError):
+    """The reply is no JSON or has no ocs meta and data"""
+
+
+class OcsStatusError(OcsError):
+    """The reply is valid, but its meta status is not ok"""
 
-    nodestotest = None
-    allnodes = expectedResults["global"]["allnodes"]
-    fullnodes = expectedResults["global"]["fullnodes"]
-    redundantnodes = expectedResults["global"]["redundantnodes"]
-    multinodes = expectedResults["global"]["multinodes"]
-    aliasnodes = expectedResults["global"]["aliasnodes"]
-    browsers = expectedResults["global"]["testBrowsers"]
 
-    allnodes.sort()
-    fullnodes.sort()
-    multinodes.sort()
+class OcsReply(namedtuple("OcsReply", ["status", "statuscode", "meta", "data"])):
+    """The unwrapped meta and data of an OCS reply together with the HTTP and OCS status codes"""
+
+    __slots__ = ()
+
+
+def json_loads(content):
+    """Parse JSON from bytes or str with orjson if it is installed, otherwise with json"""
+    global g_jsonLoads
+    if g_jsonLoads is None:
+        try:
+            import orjson
+
+            g_jsonLoads = orjson.loads
+        except ImportError:
+            g_jsonLoads = json.loads
+    return g_jsonLoads(content)
+
+
+def decode_ocs(response, check=True):
+    """Return the OcsReply of a requests response, parsed from the raw body without decoding it to text first
+    Raises OcsDecodeError if the body is no OCS reply and, if check is set, OcsStatusError if the status is not ok
+    """
+    try:
+        ocs = json_loads(response.content)["ocs"]
+        meta = ocs["meta"]
+        data = ocs["data"]
+    except (ValueError, TypeError, KeyError) as error:
+        raise OcsDecodeError(
+            f"No OCS reply from {response.url} with status {response.status_code}: {error}",
+            response.url,
+            response.status_code,
+        ) from error
+    reply = OcsReply(response.status_code, meta.get("statuscode"), meta, data)
+    if check and meta.get("status") != "ok":
+        raise OcsStatusError(
+            f"OCS status {reply.statuscode} from {response.url}: {meta.get('message')}",
+            response.url,
+            response.status_code,
+            reply.statuscode,
+        )
+    return reply
+
+
+class CheckResult(object):
+    """Outcome of a single check executed by run_node_checks"""
+
+    def __init__(self, node, passed, error=None, failures=None, elapsed=0.0):
+        self.node = node
+        self.passed = passed
+        self.error = error
+        self.failures = failures if failures is not None else []
+        self.elapsed = elapsed
+
+    def __repr__(self):
+        return f"CheckResult({self.node}, passed={self.passed}, error={self.error}, elapsed={self.elapsed:.2f}s)"
+
+
+async def _run_node_check(check, node, loop, executor, semaphore, hostSemaphore):
+    # The host slot is taken first, so a task waiting for a busy host does not hold a global slot
+    async with hostSemaphore, semaphore:
+        startTime = time.perf_counter()
+        try:
+            if inspect.iscoroutinefunction(check):
+                value = await check(node)
+            else:
+                value = await loop.run_in_executor(executor, check, node)
+        except Exception as error:
+            elapsed = time.perf_counter() - startTime
+            logger.error(f"Check failed for {node}: {error}")
+            return CheckResult(node, False, f"{type(error).__name__}: {error}", [f"{node}: {error}"], elapsed)
+        elapsed = time.perf_counter() - startTime
+
+    if isinstance(value, list):
+        error = "; ".join(value) if len(value) > 0 else None
+        return CheckResult(node, len(value) == 0, error, value, elapsed)
+    if value:
+        return CheckResult(node, True, elapsed=elapsed)
+    return CheckResult(node, False, f"Check returned {value}", [node], elapsed)
+
+
+async def _run_node_checks(check, nodes, concurrency, hostConcurrency, host):
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+    hostSemaphores = {}
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        tasks = []
+        for node in nodes:
+            hostKey = node if host is None else host(node)
+            if hostKey not in hostSemaphores:
+                hostSemaphores[hostKey] = asyncio.Semaphore(hostConcurrency)
+            hostSemaphore = hostSemaphores[hostKey]
+            tasks.append(_run_node_check(check, node, loop, executor, semaphore, hostSemaphore))
+        return await asyncio.gather(*tasks)
+
+
+def get_node_host(drv, node):
+    """Return the server that answers for node, the shared server of a multinode customer or the node host"""
+    if drv.is_multinode(node):
+        return drv.get_multinode(node)
+    return drv.get_endpoints(node).host
+
+
+def run_node_checks(check, nodes, concurrency=None, hostConcurrency=None, host=None):
+    """Run check(node) for every node and return a list of CheckResult in the order of nodes
+    check is either a coroutine function or a blocking function, which is run in a worker thread.
+    It returns True/False, or a list of failure messages that is empty if the check passed.
+    Raised exceptions are caught and reported as a failed result.
+    At most concurrency checks run at the same time, and at most hostConcurrency per host(node),
+    by default the server of the node, so multinode customers on the same server share the limit
+    """
+    if host is None:
+        drv = TestTarget()
+        host = lambda node: get_node_host(drv, node)
+    if concurrency is None:
+        concurrency = g_runnerConcurrency
+    if hostConcurrency is None:
+        hostConcurrency = g_runnerHostConcurrency
+    startTime = time.perf_counter()
+    results = asyncio.run(
+        _run_node_checks(check, list(nodes), concurrency, hostConcurrency, host)
+    )
+    failed = len([result for result in results if not result.passed])
+    logger.info(
+        f"{len(results)} checks done in {time.perf_counter() - startTime:.1f}s, {failed} failed"
+    )
+    return results
+
+
+class TestTarget(object):
+    expectedResults = ExpectedResult()
+    opsCommonConfig = ExpectedResult(loader=get_ops_common_config)
+
+    baseurl = ExpectedResult("global", "baseUrl")
+    testprefix = ExpectedResult("global", "testPrefix")
+    nodeprefix = ExpectedResult("global", "nodePrefix")
+    docprefix = ExpectedResult("global", "docPrefix")
+    indexsuffix = ExpectedResult("global", "indexSuffix")
+    ocsheaders = ocsheaders
+
+    nodestotest = None
+    allnodes = ExpectedResult("global", "allnodes")
+    fullnodes = ExpectedResult("global", "fullnodes")
+    redundantnodes = ExpectedResult("global", "redundantnodes")
+    multinodes = ExpectedResult("global", "multinodes")
+    aliasnodes = ExpectedResult("global", "aliasnodes")
+    browsers = ExpectedResult("global", "testBrowsers")
 
     target = "test"
     platform = sys.platform
@@ -125,11 +805,10 @@ class TestTarget(object):
 
     def __init__(self, target=None, loglevel=logging.INFO):
         global target_env
+        configure_logging()
         logging.getLogger().setLevel(loglevel)
         logger.info(f"Using test results file: {g_expectedFile}")
-        abspath = os.path.abspath(__file__)
-        dname = os.path.dirname(abspath)
-        logger.info(f"Working directory is {dname}")
+        logger.info(f"Working directory is {os.getcwd()}")
         customers_env = os.environ.get("NextcloudTestCustomers")
         if customers_env is not None:
             customers_env = customers_env.split(",")
@@ -140,11 +819,17 @@ class TestTarget(object):
         testrunner = os.environ.get("NextcloudTestRunner")
         testfilesize = os.environ.get("NextcloudTestFileSize")
         testgridaddress = os.environ.get("NextcloudTestGridAddress")
+        testpoolsize = os.environ.get("NextcloudTestPoolSize")
 
         if testgridaddress is None:
             logger.info("Using default grid address http://127.0.0.1:4444/wd/hub")
             self.testgridaddress = "http://127.0.0.1:4444/wd/hub"
 
+        if testpoolsize is None:
+            self.poolsize = g_sessionPoolSize
+        else:
+            self.poolsize = int(testpoolsize)
+
         if testfilesize is None:
             logger.info("Using default file size M")
             self.testfilesize = "M"
@@ -182,6 +867,8 @@ class TestTarget(object):
             sys.exit()
 
         sys.stdout.flush()
+        # default target is test, unless overwritten by initializing with 'prod'
+        self.targetprefix = "." + self.testprefix
         if testtarget == "prod":
             self.target = "prod"
             self.targetprefix = ""
@@ -239,6 +926,57 @@ class TestTarget(object):
             prefix = node + "." + self.nodeprefix
         return prefix
 
+    def get_serverid(self, node, fe):
+        return f"node{fe}.{self.get_node_base_url(node)}"
+
+    def get_session(self, node, fe=None, retries=None, poolsize=None):
+        """Return a session using the shared keep-alive connection pool for node
+        If fe is given, the session is pinned to that frontend through the SERVERID cookie
+        Each call returns a new session, so cookies are never shared between users or threads
+        retries replaces the default urllib3 Retry, which only retries failed connections, and poolsize the number
+        of connections kept per host, callers that retry on their own or send many requests at once pass them
+        Requests sent through the session are recorded in g_requestTimings
+        """
+        session = TimedSession(node)
+        adapter = get_pooled_adapter(node, poolsize if poolsize is not None else self.poolsize, retries)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.verify = self.verify
+        if fe is not None:
+            session.cookies.set("SERVERID", self.get_serverid(node, fe))
+        return session
+
+    def get_endpoints(self, node):
+        """Return the immutable NodeEndpoints for node, built once per node and target"""
+        key = (
+            self.target,
+            node,
+            self.nodeprefix,
+            self.targetprefix,
+            self.delimiter,
+            self.baseurl,
+        )
+        endpoints = g_endpointTables.get(key)
+        if endpoints is None:
+            multinodehost = None
+            if self.is_multinode(node):
+                multinodehost = (
+                    self.get_multinode(node)
+                    + "."
+                    + self.get_base_url()
+                    + ":"
+                    + str(self.get_multinode_port(node))
+                )
+            endpoints = NodeEndpoints.build(
+                node, self.get_node_base_url(node), multinodehost
+            )
+            g_endpointTables[key] = endpoints
+        return endpoints
+
+    def get_ocs_auth(self, node):
+        """Return the (user, app password) tuple of the ocs user of node, to be passed as auth to requests"""
+        return (self.get_ocsuser(node), self.get_ocsuserapppassword(node))
+
     def is_multinode(self, node):
         try:
             self.opsCommonConfig["multinode_mapping"][node]["server"]
@@ -907,288 +1645,102 @@ class TestTarget(object):
             + "/ocs/v2.php/core/getapppassword-onetime"
         )
 
-    def get_ocsuser(self, node, raiseException=True):
+    def get_credential_env(self, kind, subject):
+        prefix, suffix, cmdlet = g_credentialKinds[kind]
+        return prefix + subject.upper() + suffix + "_" + self.target.upper()
+
+    def get_credential(self, kind, subject, raiseException=True):
+        """Return the credential of kind for a node or user id
+        Values are resolved once per process and target and then served from g_credentialCache
+        """
+        key = (self.platform, self.target, kind, subject)
+        value = g_credentialCache.get(key)
+        if value is not None:
+            return value
+
         if self.platform == "win32":
-            usercmd = (
-                'powershell -command "& { . ./NodeCredentials.ps1; Get-OcsUser '
-                + node
+            cmd = (
+                'powershell -command "& { . ./NodeCredentials.ps1; '
+                + g_credentialKinds[kind][2]
+                + " "
+                + subject
                 + " "
                 + self.target
                 + ' }"'
             )
-            process = os.popen(usercmd)
-            user = process.read()
+            process = os.popen(cmd)
+            value = process.read()
             process.close()
-            return user
         elif self.platform == "linux":
-            env = "NEXTCLOUD_OCS_USER_" + node.upper() + "_" + self.target.upper()
-            return get_value(env, raiseException)
+            value = get_value(self.get_credential_env(kind, subject), raiseException)
         else:
             raise NotImplementedError
 
-    def get_seleniumuser(self, node, raiseException=True):
-        if self.platform == "win32":
-            usercmd = (
-                'powershell -command "& { . ./NodeCredentials.ps1; Get-SeleniumUser '
-                + node
-                + " "
-                + self.target
-                + ' }"'
+        if value is not None:
+            g_credentialCache[key] = value
+        return value
+
+    def prefetch_credentials(self, kinds, nodes=None):
+        """Resolve the credentials of kinds for nodes, by default nodestotest, before any request is made
+        Raises a single exception listing every missing credential instead of failing one node at a time
+        """
+        if nodes is None:
+            nodes = self.nodestotest
+        missing = []
+        for kind in kinds:
+            for node in nodes:
+                if self.platform == "linux":
+                    env = self.get_credential_env(kind, node)
+                    if not os.environ.get(env):
+                        missing.append(env)
+                        continue
+                if not self.get_credential(kind, node, raiseException=False):
+                    missing.append(f"{kind} for {node}")
+
+        if len(missing) > 0:
+            raise Exception(
+                f"{len(missing)} credentials are not set or empty: {', '.join(missing)}"
             )
-            process = os.popen(usercmd)
-            user = process.read()
-            process.close()
-            return user
-        elif self.platform == "linux":
-            env = "NEXTCLOUD_SELENIUM_USER_" + node.upper() + "_" + self.target.upper()
-            return get_value(env, raiseException)
-        else:
-            raise NotImplementedError
+        logger.info(f"Resolved {len(kinds) * len(nodes)} credentials for {len(nodes)} nodes")
+
+    def get_ocsuser(self, node, raiseException=True):
+        return self.get_credential("ocsuser", node, raiseException)
+
+    def get_seleniumuser(self, node, raiseException=True):
+        return self.get_credential("seleniumuser", node, raiseException)
 
     def get_seleniummfauser(self, node, raiseException=True):
-        if self.platform == "win32":
-            usercmd = (
-                'powershell -command "& { . ./NodeCredentials.ps1; Get-SeleniumMfaUser '
-                + node
-                + " "
-                + self.target
-                + ' }"'
-            )
-            process = os.popen(usercmd)
-            user = process.read()
-            process.close()
-            return user
-        elif self.platform == "linux":
-            env = (
-                "NEXTCLOUD_SELENIUM_MFA_USER_"
-                + node.upper()
-                + "_"
-                + self.target.upper()
-            )
-            return get_value(env, raiseException)
-        else:
-            raise NotImplementedError
+        return self.get_credential("seleniummfauser", node, raiseException)
 
     def get_jupyteruser(self, node):
-        if self.platform == "win32":
-            usercmd = (
-                'powershell -command "& { . ./NodeCredentials.ps1; Get-SeleniumMfaUser '
-                + node
-                + " "
-                + self.target
-                + ' }"'
-            )
-            process = os.popen(usercmd)
-            user = process.read()
-            process.close()
-            return user
-        elif self.platform == "linux":
-            env = "NEXTCLOUD_JUPYTER_USER_" + node.upper() + "_" + self.target.upper()
-            return get_value(env)
-        else:
-            raise NotImplementedError
+        return self.get_credential("jupyteruser", node)
 
     def get_ocsuserpassword(self, node, raiseException=True):
-        if self.platform == "win32":
-            pwdcmd = (
-                'powershell -command "& { . ./NodeCredentials.ps1; Get-OcsPassword '
-                + node
-                + " "
-                + self.target
-                + ' }"'
-            )
-            process = os.popen(pwdcmd)
-            pwd = process.read()
-            process.close()
-            return pwd
-        elif self.platform == "linux":
-            env = "NEXTCLOUD_OCS_PASSWORD_" + node.upper() + "_" + self.target.upper()
-            return get_value(env, raiseException)
-        else:
-            raise NotImplementedError
+        return self.get_credential("ocsuserpassword", node, raiseException)
 
     def get_seleniumuserpassword(self, node, raiseException=True):
-        if self.platform == "win32":
-            pwdcmd = (
-                'powershell -command "& { . ./NodeCredentials.ps1; Get-SeleniumUserPassword '
-                + node
-                + " "
-                + self.target
-                + ' }"'
-            )
-            process = os.popen(pwdcmd)
-            pwd = process.read()
-            process.close()
-            return pwd
-        elif self.platform == "linux":
-            env = (
-                "NEXTCLOUD_SELENIUM_PASSWORD_"
-                + node.upper()
-                + "_"
-                + self.target.upper()
-            )
-            return get_value(env, raiseException)
-        else:
-            raise NotImplementedError
+        return self.get_credential("seleniumuserpassword", node, raiseException)
 
     def get_seleniummfauserpassword(self, node, raiseException=True):
-        if self.platform == "win32":
-            pwdcmd = (
-                'powershell -command "& { . ./NodeCredentials.ps1; Get-SeleniumMfaUserPassword '
-                + node
-                + " "
-                + self.target
-                + ' }"'
-            )
-            process = os.popen(pwdcmd)
-            pwd = process.read()
-            process.close()
-            return pwd
-        elif self.platform == "linux":
-            env = (
-                "NEXTCLOUD_SELENIUM_MFA_PASSWORD_"
-                + node.upper()
-                + "_"
-                + self.target.upper()
-            )
-            return get_value(env, raiseException)
-        else:
-            raise NotImplementedError
+        return self.get_credential("seleniummfauserpassword", node, raiseException)
 
     def get_jupyteruserpassword(self, node):
-        if self.platform == "win32":
-            pwdcmd = (
-                'powershell -command "& { . ./NodeCredentials.ps1; Get-SeleniumUserPassword '
-                + node
-                + " "
-                + self.target
-                + ' }"'
-            )
-            process = os.popen(pwdcmd)
-            pwd = process.read()
-            process.close()
-            return pwd
-        elif self.platform == "linux":
-            env = (
-                "NEXTCLOUD_JUPYTER_PASSWORD_" + node.upper() + "_" + self.target.upper()
-            )
-            return get_value(env)
-        else:
-            raise NotImplementedError
+        return self.get_credential("jupyteruserpassword", node)
 
     def get_ocsuserapppassword(self, node, raiseException=True):
-        if self.platform == "win32":
-            pwdcmd = (
-                'powershell -command "& { . ./NodeCredentials.ps1; Get-OcsAppPassword '
-                + node
-                + " "
-                + self.target
-                + ' }"'
-            )
-            process = os.popen(pwdcmd)
-            pwd = process.read()
-            process.close()
-            return pwd
-        elif self.platform == "linux":
-            env = (
-                "NEXTCLOUD_OCS_APP_PASSWORD_" + node.upper() + "_" + self.target.upper()
-            )
-            return get_value(env, raiseException)
-        else:
-            raise NotImplementedError
+        return self.get_credential("ocsuserapppassword", node, raiseException)
 
     def get_seleniumuserapppassword(self, node, raiseException=True):
-        if self.platform == "win32":
-            pwdcmd = (
-                'powershell -command "& { . ./NodeCredentials.ps1; Get-SeleniumUserAppPassword '
-                + node
-                + " "
-                + self.target
-                + ' }"'
-            )
-            process = os.popen(pwdcmd)
-            pwd = process.read()
-            process.close()
-            return pwd
-        elif self.platform == "linux":
-            env = (
-                "NEXTCLOUD_SELENIUM_APP_PASSWORD_"
-                + node.upper()
-                + "_"
-                + self.target.upper()
-            )
-            return get_value(env, raiseException)
-        else:
-            raise NotImplementedError
+        return self.get_credential("seleniumuserapppassword", node, raiseException)
 
     def get_seleniummfauserapppassword(self, node, raiseException=True):
-        if self.platform == "win32":
-            pwdcmd = (
-                'powershell -command "& { . ./NodeCredentials.ps1; Get-SeleniumMfaUserAppPassword '
-                + node
-                + " "
-                + self.target
-                + ' }"'
-            )
-            process = os.popen(pwdcmd)
-            pwd = process.read()
-            process.close()
-            return pwd
-        elif self.platform == "linux":
-            env = (
-                "NEXTCLOUD_SELENIUM_MFA_APP_PASSWORD_"
-                + node.upper()
-                + "_"
-                + self.target.upper()
-            )
-            return get_value(env, raiseException)
-        else:
-            raise NotImplementedError
+        return self.get_credential("seleniummfauserapppassword", node, raiseException)
 
     def get_seleniumusertotpsecret(self, node, raiseException=True):
-        if self.platform == "win32":
-            pwdcmd = (
-                'powershell -command "& { . ./NodeCredentials.ps1; Get-SeleniumMfaUserTotpSecret '
-                + node
-                + " "
-                + self.target
-                + ' }"'
-            )
-            process = os.popen(pwdcmd)
-            pwd = process.read()
-            process.close()
-            return pwd
-        elif self.platform == "linux":
-            env = (
-                "NEXTCLOUD_SELENIUM_SECRET_" + node.upper() + "_" + self.target.upper()
-            )
-            return get_value(env, raiseException)
-        else:
-            raise NotImplementedError
+        return self.get_credential("seleniumusertotpsecret", node, raiseException)
 
     def get_seleniummfausertotpsecret(self, node, raiseException=True):
-        if self.platform == "win32":
-            pwdcmd = (
-                'powershell -command "& { . ./NodeCredentials.ps1; Get-SeleniumMfaUserTotpSecret '
-                + node
-                + " "
-                + self.target
-                + ' }"'
-            )
-            process = os.popen(pwdcmd)
-            pwd = process.read()
-            process.close()
-            return pwd
-        elif self.platform == "linux":
-            env = (
-                "NEXTCLOUD_SELENIUM_MFA_SECRET_"
-                + node.upper()
-                + "_"
-                + self.target.upper()
-            )
-            return get_value(env, raiseException)
-        else:
-            raise NotImplementedError
+        return self.get_credential("seleniummfausertotpsecret", node, raiseException)
 
     def save_ocsusercredentials(self, node):
         if self.platform == "win32":
@@ -1251,92 +1803,16 @@ class TestTarget(object):
             raise NotImplementedError
 
     def get_samlusername(self, userid):
-        if self.platform == "win32":
-            usercmd = (
-                'powershell -command "& { . ./NodeCredentials.ps1; Get-SamlUserName '
-                + userid
-                + " "
-                + self.target
-                + ' }"'
-            )
-            process = os.popen(usercmd)
-            user = process.read()
-            process.close()
-            return user
-        elif self.platform == "linux":
-            env = "NEXTCLOUD_SAML_USER_" + userid.upper() + "_" + self.target.upper()
-            return get_value(env)
-        else:
-            raise NotImplementedError
+        return self.get_credential("samlusername", userid)
 
     def get_samluseralias(self, userid):
-        if self.platform == "win32":
-            usercmd = (
-                'powershell -command "& { . ./NodeCredentials.ps1; Get-SamlUserName '
-                + userid
-                + " "
-                + self.target
-                + ' }"'
-            )
-            process = os.popen(usercmd)
-            user = process.read()
-            process.close()
-            return user
-        elif self.platform == "linux":
-            env = (
-                "NEXTCLOUD_SAML_USER_"
-                + userid.upper()
-                + "_ALIAS_"
-                + self.target.upper()
-            )
-            return get_value(env)
-        else:
-            raise NotImplementedError
+        return self.get_credential("samluseralias", userid)
 
     def get_samluserpassword(self, userid):
-        if self.platform == "win32":
-            pwdcmd = (
-                'powershell -command "& { . ./NodeCredentials.ps1; Get-SamlUserPassword '
-                + userid
-                + " "
-                + self.target
-                + ' }"'
-            )
-            process = os.popen(pwdcmd)
-            pwd = process.read()
-            process.close()
-            return pwd
-        elif self.platform == "linux":
-            env = (
-                "NEXTCLOUD_SAML_PASSWORD_" + userid.upper() + "_" + self.target.upper()
-            )
-            return get_value(env)
-        else:
-            raise NotImplementedError
+        return self.get_credential("samluserpassword", userid)
 
     def get_samlusertotpsecret(self, userid):
-        if self.platform == "win32":
-            pwdcmd = (
-                'powershell -command "& { . ./NodeCredentials.ps1; Get-SamlUserTotpSecret '
-                + userid
-                + " "
-                + self.target
-                + ' }"'
-            )
-            process = os.popen(pwdcmd)
-            pwd = process.read()
-            process.close()
-            return pwd
-        elif self.platform == "linux":
-            env = (
-                "NEXTCLOUD_SELENIUM_SAML_MFA_SECRET_"
-                + userid.upper()
-                + "_"
-                + self.target.upper()
-            )
-            return get_value(env)
-        else:
-            raise NotImplementedError
+        return self.get_credential("samlusertotpsecret", userid)
 
     def save_samlusercredentials(self, userid):
         if self.platform == "win32":
@@ -1398,6 +1874,8 @@ class TestTarget(object):
         ts = datetime.strftime(datetime.now(), "%Y%m%d%H%M%S")
         reportName = f"nextcloud-{self.expectedResults[self.target]['status']['version']}-{filename}-{ts}.xml"
         if self.testrunner == "xml":
+            import xmlrunner
+
             reportFolder = "test-reports/"
             reportFullPath = f"{reportFolder}{reportName}"
             with open(reportFullPath, "wb") as output:
@@ -1407,6 +1885,8 @@ class TestTarget(object):
                 testRunner=unittest.TextTestRunner(resultclass=NumbersTestResult)
             )
         else:
+            import HtmlTestRunner
+
             reportFolder = "test-reports-html/"
             unittest.main(
                 testRunner=HtmlTestRunner.HTMLTestRunner(
@@ -1444,336 +1924,6 @@ class Helper:
         return len(current_parts) >= len(minimum_parts)
 
 
-class SeleniumHelper:
-    class UserType(Enum):
-        SELENIUM = 1
-        SELENIUM_MFA = 2
-        OCS = 3
-        BASIC = 4
-        UNKNOWN = -1
-
-    def __init__(self, browser, nextcloudnode) -> None:
-        self.nextcloudnode = nextcloudnode
-        self.drv = TestTarget()
-        delay = 30
-        self.prepare_driver(browser)
-        self.wait = WebDriverWait(self.driver, delay)
-        pass
-
-    def prepare_driver(self, browser):
-        try:
-            if browser == "chrome":
-                options = ChromeOptions()
-                options.add_argument("--no-sandbox")
-                options.add_argument("--disable-dev-shm-usage")
-                options.add_argument("--disable-gpu")
-                options.add_argument("--disable-extensions")
-
-                if not self.drv.verify:
-                    options.add_argument("--ignore-certificate-errors")
-                self.driver = webdriver.Chrome(options=options)
-            elif browser == "firefox":
-                if not use_driver_service:
-                    logger.info("Initialize Firefox driver without driver service")
-                    options = FirefoxOptions()
-                    if not self.drv.verify:
-                        options.add_argument("--ignore-certificate-errors")
-                    # options.add_argument("--headless")
-                    self.driver = webdriver.Firefox(options=options)
-                else:
-                    logger.info(
-                        "Initialize Firefox driver using snap geckodriver and driver service"
-                    )
-                    driver_service = webdriver.FirefoxService(
-                        executable_path=geckodriver_path
-                    )
-                    self.driver = webdriver.Firefox(
-                        service=driver_service, options=options
-                    )
-            elif browser == "edge":
-                if not use_driver_service:
-                    logger.info("Initialize Edge driver without driver service")
-                    options = EdgeOptions()
-                    if not self.drv.verify:
-                        options.add_argument("--ignore-certificate-errors")
-                    # options.add_argument("--headless")
-                    self.driver = webdriver.Edge(options=options)
-                else:
-                    logger.info(
-                        "Initialize Edge driver using snap geckodriver and driver service"
-                    )
-                    driver_service = webdriver.FirefoxService(
-                        executable_path=geckodriver_path
-                    )
-                    self.driver = webdriver.Firefox(
-                        service=driver_service, options=options
-                    )
-            elif browser == "firefox_grid":
-                logger.info("Initialize Firefox grid driver")
-                options = FirefoxOptions()
-                # options.add_argument("--no-sandbox")
-                # options.add_argument("--disable-dev-shm-usage")
-                # options.add_argument("--disable-gpu")
-                # options.add_argument("--disable-extensions")
-                if not self.drv.verify:
-                    options.add_argument("--ignore-certificate-errors")
-                self.driver = webdriver.Remote(
-                    command_executor=self.drv.testgridaddress, options=options
-                )
-            elif browser == "chrome_grid":
-                logger.info(f"Initialize Chrome grid driver")
-                if not self.drv.verify:
-                    options.add_argument("--ignore-certificate-errors")
-                options = ChromeOptions()
-                self.driver = webdriver.Remote(
-                    command_executor=self.drv.testgridaddress, options=options
-                )
-            elif browser == "edge_grid":
-                logger.info(f"Initialize Edge grid driver")
-                if not self.drv.verify:
-                    options.add_argument("--ignore-certificate-errors")
-                options = EdgeOptions()
-                self.driver = webdriver.Remote(
-                    command_executor=self.drv.testgridaddress, options=options
-                )
-                logger.info(f"Edge grid driver init done")
-            else:
-                logger.error(f"Unknown browser {browser}")
-                raise Exception(f"Unknown browser {browser}")
-        except Exception as e:
-            logger.error(f"Error initializing driver for {browser}: {e}")
-            raise Exception(f"Error initializing driver for {browser}: {e}")
-        return
-
-    def delete_cookies(self):
-        cookies = self.driver.get_cookies()
-        logger.debug(f"Deleting all cookies: {cookies}")
-        self.driver.delete_all_cookies()
-        logger.info("All cookies deleted")
-        return
-
-    def nodelogin(
-        self,
-        usertype: UserType,
-        username="",
-        password="",
-        apppwd="",
-        totpsecret="",
-        mfaUser=True,
-        skipAppMenuCheck=False,
-        addOtp=False,
-        acceptToS=False,
-    ):
-        nodetotpsecret = ""
-        loginurl = self.drv.get_node_login_url(self.nextcloudnode)
-        if usertype == usertype.SELENIUM:
-            nodeuser = self.drv.get_seleniumuser(self.nextcloudnode)
-            nodepwd = self.drv.get_seleniumuserpassword(self.nextcloudnode)
-            nodetotpsecret = self.drv.get_seleniumusertotpsecret(self.nextcloudnode)
-            isMfaUser = mfaUser
-        elif usertype == usertype.SELENIUM_MFA:
-            nodeuser = self.drv.get_seleniummfauser(self.nextcloudnode)
-            nodepwd = self.drv.get_seleniummfauserpassword(self.nextcloudnode)
-            nodetotpsecret = self.drv.get_seleniummfausertotpsecret(self.nextcloudnode)
-            isMfaUser = mfaUser
-        elif usertype == usertype.OCS:
-            nodeuser = self.drv.get_ocsuser(self.nextcloudnode)
-            nodepwd = self.drv.get_ocsuserpassword(self.nextcloudnode)
-            nodetotpsecret = totpsecret
-            isMfaUser = True
-        elif usertype == usertype.BASIC:
-            nodeuser = username
-            nodepwd = password
-            nodetotpsecret = totpsecret
-            isMfaUser = mfaUser
-        else:
-            logger.error(f"Unknown usertype {usertype}")
-            return False
-
-        loginurl = self.drv.get_node_login_url(self.nextcloudnode)
-
-        try:
-            r = requests.get(loginurl, timeout=g_requestTimeout, verify=False)
-            if "This service is currently unavailable." in r.text:
-                raise Exception(f"{self.nextcloudnode} is not available!")
-        except Exception as error:
-            logger.error(f"Failed to request data from {loginurl}: {error}")
-            return
-
-        self.driver.get(loginurl)
-        if self.driver.current_url != loginurl:
-            logger.warning(f"Retry opening login url: {loginurl}")
-            self.driver.get(loginurl)
-
-        try:
-            logger.info("Enter username and password")
-            currentUrl = self.driver.current_url
-            self.wait.until(EC.element_to_be_clickable((By.ID, "user"))).send_keys(
-                nodeuser
-            )
-            self.wait.until(EC.element_to_be_clickable((By.ID, "password"))).send_keys(
-                nodepwd + Keys.ENTER
-            )
-        except Exception as error:
-            logger.error(f"Error logging in to {loginurl}: {error}")
-
-        if addOtp:
-            logger.info(f"Adding OTP for {username}")
-            totpXpath = '//a[@href="/login/setupchallenge/totp"]'
-            logger.info(f"Locating {totpXpath}")
-            self.wait.until(EC.element_to_be_clickable((By.XPATH, totpXpath)))
-
-            totpselect = self.driver.find_element(By.XPATH, totpXpath)
-            totpselect.click()
-
-            self.wait.until(
-                EC.presence_of_element_located(
-                    (By.CLASS_NAME, "setup-confirmation__secret")
-                )
-            )
-
-            nodetotpsecret = self.driver.find_element(
-                By.CLASS_NAME, "setup-confirmation__secret"
-            ).text.split(" ")[-1]
-            totp = pyotp.TOTP(nodetotpsecret)
-            currentOtp = totp.now()
-
-            self.wait.until(
-                EC.element_to_be_clickable(
-                    (By.XPATH, '//*//input[@placeholder="Authentication code"]')
-                )
-            ).send_keys(currentOtp + Keys.ENTER)
-            logger.info(f"OTP added for {username}")
-            isMfaUser = True
-            self.wait.until(
-                EC.presence_of_element_located((By.CLASS_NAME, "two-factor-provider"))
-            )  # Wait for mfa login button and proceed
-
-        if isMfaUser:
-            retryCount = 0
-            while self.driver.current_url == currentUrl:
-                logger.info(f"Wait for URL change after login")
-                time.sleep(1)
-                retryCount += 1
-                if retryCount > g_requestTimeout:
-                    logger.error(
-                        f"URL did not change after {g_requestTimeout}s: {self.driver.current_url}"
-                    )
-                    raise TimeoutException
-            logger.info(f"MFA login {self.driver.current_url}")
-            totpXpath = '//a[contains(@href,"/challenge/totp")]'
-
-            if "selectchallenge" in self.driver.current_url:
-                logger.info("Select TOTP provider")
-                self.wait.until(EC.element_to_be_clickable((By.XPATH, totpXpath)))
-                totpselect = self.driver.find_element(By.XPATH, totpXpath)
-                totpselect.click()
-            elif "challenge/totp" in self.driver.current_url:
-                logger.info("No need to select TOTP provider")
-            else:
-                logger.error(f"Unexpected url: {self.driver.current_url}")
-
-            currentOtp = 0
-            totpRetry = 0
-            while totpRetry <= 3:
-                totpRetry += 1
-                totp = pyotp.TOTP(nodetotpsecret)
-                currentOtp = totp.now()
-                self.wait.until(
-                    EC.element_to_be_clickable(
-                        (By.XPATH, '//*//input[@placeholder="Authentication code"]')
-                    )
-                ).send_keys(currentOtp + Keys.ENTER)
-                time.sleep(3)  # Replace with proper check at some point
-                if "challenge/totp" in self.driver.current_url:
-                    logger.info("Try again")
-                    while currentOtp == totp.now():
-                        logger.info("Wait for new OTP to be issued")
-                        time.sleep(3)
-                else:
-                    logger.info(f"Logging in to {self.nextcloudnode}")
-                    break
-        else:
-            logger.info("No MFA login")
-
-        if acceptToS:
-            logger.info(f"Try to accept ToS: {acceptToS}")
-            self.wait.until(
-                EC.presence_of_element_located((By.CLASS_NAME, "terms-content"))
-            )  # Wait for the ToS content field
-
-            # Find accept tos button
-            acceptButton = None
-            try:
-                buttons = self.driver.find_elements(By.CLASS_NAME, "button-vue__text")
-                for button in buttons:
-                    if (
-                        "I acknowledge that I have read and agree to the above terms of service"
-                        in button.text
-                    ):
-                        acceptButton = button
-            except Exception as error:
-                logger.error(f"Unable to find create new app button: {error}")
-                return None
-
-            acceptButton.click()
-
-        try:
-            if skipAppMenuCheck:
-                logger.info("Skip app menu check!")
-                return True
-            self.wait.until(EC.presence_of_element_located((By.CLASS_NAME, "app-menu")))
-            logger.info("App menu is ready!")
-        except TimeoutException:
-            logger.info("Loading of app menu took too much time!")
-
-        if len(nodetotpsecret) > 0:
-            return nodetotpsecret
-        else:
-            return ""
-
-    def create_app_password(self):
-        settingsUrl = self.drv.get_settings_user_security_url(self.nextcloudnode)
-        logger.info(f"Open user security settings: {settingsUrl}")
-        self.driver.get(settingsUrl)
-        self.wait.until(
-            EC.element_to_be_clickable(
-                (By.XPATH, '//*//input[@placeholder="App name"]')
-            )
-        ).send_keys("__testautomation__")
-
-        # Find create new app button
-        createButton = None
-        try:
-            buttons = self.driver.find_elements(By.CLASS_NAME, "button-vue__text")
-            for button in buttons:
-                if "Create new app password" in button.text:
-                    createButton = button
-        except Exception as error:
-            logger.error(f"Unable to find create new app button: {error}")
-            return None
-
-        createButton.click()
-
-        self.wait.until(
-            EC.presence_of_element_located(
-                (By.XPATH, '//*//input[@placeholder="Password"]')
-            )
-        )
-        time.sleep(2)
-        pwdField = self.driver.find_element(
-            By.XPATH, '//*//input[@placeholder="Password"]'
-        )
-        appPwd = pwdField.get_attribute("value")
-        # Click on close icon and return the password
-        self.wait.until(
-            EC.element_to_be_clickable((By.CLASS_NAME, "close-icon"))
-        ).click()
-        return appPwd
-
-
-# Override TextTestResult to count subtests as test executions
-# Credits: https://stackoverflow.com/questions/45007346/count-subtests-in-python-unittests-separately
 class NumbersTestResult(unittest.TextTestResult):
     def addSubTest(self, test, subtest, outcome):
         # handle failures calling base class
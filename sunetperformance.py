@@ -0,0 +1,298 @@
+"""Sunet Drive performance helpers shared by the performance tests and load test sandboxes
+Author: Richard Freitag <freitag@sunet.se>
+LatencyHistogram is a compact log-bucketed latency histogram in the style of HdrHistogram.
+RateLimiter spaces calls shared by many threads to a fixed rate.
+ResultStore keeps benchmark results in an append-only SQLite database and flags regressions against earlier runs.
+"""
+
+import os
+import sqlite3
+import statistics
+import threading
+import time
+from array import array
+from contextlib import contextmanager
+
+g_histogramSubBucketBits = 7  # 64 sub-buckets per power of two, about 1.6% relative precision
+g_histogramHighestValue = 3600 * 1000 * 1000  # Highest trackable latency, one hour in microseconds
+
+# Benchmark results are appended to this SQLite file, an empty value keeps them in memory for the run only
+g_resultStoreFile = os.environ.get(
+    "NextcloudTestResultStore", os.path.join("test-reports", "performance-results.sqlite")
+)
+# Number of earlier results of the same test, node, frontend and metric that form the baseline
+g_regressionWindow = int(os.environ.get("NextcloudTestRegressionWindow", 20))
+g_regressionMinSamples = 5
+# A result is a regression if its robust z-score against the baseline exceeds the threshold
+# and it is worse than the baseline median by at least the relative tolerance
+g_regressionThreshold = float(os.environ.get("NextcloudTestRegressionThreshold", 3.5))
+g_regressionTolerance = float(os.environ.get("NextcloudTestRegressionTolerance", 0.1))
+g_resultStore = None
+g_resultStoreLock = threading.Lock()
+
+
+class LatencyHistogram(object):
+    """Latency histogram with logarithmic buckets, backed by a single array of counts
+    Values are recorded in seconds and stored with microsecond resolution. Values below 128us are exact,
+    larger values fall into one of 64 linear sub-buckets per power of two.
+    Histograms with the same layout can be merged, so every thread or process can record into its own
+    histogram and the results are added up for the report. to_dict and from_dict transfer a histogram
+    between processes.
+    """
+
+    def __init__(self, subBucketBits=g_histogramSubBucketBits, highestValue=g_histogramHighestValue):
+        self.subBucketBits = subBucketBits
+        self.highestValue = highestValue
+        self.counts = array("Q", [0]) * (self._index(highestValue) + 1)
+        self.count = 0
+        self.sum = 0
+        self.min = None
+        self.max = 0
+        self.lock = threading.Lock()
+
+    def _index(self, value):
+        subBucketCount = 1 << self.subBucketBits
+        if value < subBucketCount:
+            return value
+        exponent = value.bit_length() - self.subBucketBits
+        mantissa = value >> exponent
+        return subBucketCount + (exponent - 1) * (subBucketCount >> 1) + mantissa - (subBucketCount >> 1)
+
+    def _value(self, index):
+        """Return the middle of the value range covered by index in microseconds"""
+        subBucketCount = 1 << self.subBucketBits
+        if index < subBucketCount:
+            return index
+        exponent = (index - subBucketCount) // (subBucketCount >> 1) + 1
+        mantissa = (index - subBucketCount) % (subBucketCount >> 1) + (subBucketCount >> 1)
+        return (mantissa << exponent) + (1 << exponent) // 2
+
+    def record(self, seconds):
+        value = min(max(int(seconds * 1000000), 0), self.highestValue)
+        index = self._index(value)
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+            if self.min is None or value < self.min:
+                self.min = value
+            if value > self.max:
+                self.max = value
+
+    @contextmanager
+    def time(self):
+        """Record the time spent in the with block"""
+        startTime = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.record(time.perf_counter() - startTime)
+
+    def merge(self, other):
+        if (other.subBucketBits, other.highestValue) != (self.subBucketBits, self.highestValue):
+            raise ValueError("Histograms with different layouts cannot be merged")
+        with self.lock:
+            for index, count in enumerate(other.counts):
+                if count:
+                    self.counts[index] += count
+            self.count += other.count
+            self.sum += other.sum
+            if other.min is not None and (self.min is None or other.min < self.min):
+                self.min = other.min
+            self.max = max(self.max, other.max)
+        return self
+
+    def percentile(self, p):
+        """Return the latency in seconds below which p percent of the recorded values fall"""
+        if self.count == 0:
+            return 0.0
+        if p >= 100:
+            return self.max / 1000000
+        rank = max(int(p / 100 * self.count + 0.5), 1)
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(self._value(index), self.max) / 1000000
+        return self.max / 1000000
+
+    def mean(self):
+        if self.count == 0:
+            return 0.0
+        return self.sum / self.count / 1000000
+
+    def summary(self):
+        """One line report of the latency percentiles in milliseconds"""
+        return (
+            f"p50 {self.percentile(50) * 1000:.0f}ms - p90 {self.percentile(90) * 1000:.0f}ms - "
+            f"p99 {self.percentile(99) * 1000:.0f}ms - max {self.max / 1000:.0f}ms ({self.count} calls)"
+        )
+
+    def to_dict(self):
+        return {
+            "subBucketBits": self.subBucketBits,
+            "highestValue": self.highestValue,
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min,
+            "max": self.max,
+            "counts": {index: count for index, count in enumerate(self.counts) if count},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls(data["subBucketBits"], data["highestValue"])
+        for index, count in data["counts"].items():
+            histogram.counts[int(index)] = count
+        histogram.count = data["count"]
+        histogram.sum = data["sum"]
+        histogram.min = data["min"]
+        histogram.max = data["max"]
+        return histogram
+
+    def __getstate__(self):
+        return self.to_dict()
+
+    def __setstate__(self, state):
+        self.__dict__.update(LatencyHistogram.from_dict(state).__dict__)
+
+
+class RateLimiter(object):
+    """Let at most rate calls per second pass wait, shared by any number of threads
+    Every call gets the next free slot 1/rate seconds after the previous one, so a burst is spread out evenly
+    instead of passing at once. A rate of None or 0 does not limit.
+    """
+
+    def __init__(self, rate=None):
+        self.rate = rate
+        self.next = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        """Block until the next slot, returns the seconds spent waiting"""
+        if not self.rate:
+            return 0.0
+        with self.lock:
+            now = time.perf_counter()
+            slot = max(now, self.next)
+            self.next = slot + 1 / self.rate
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+
+class Regression(object):
+    """A result that is significantly worse than the rolling baseline of earlier runs"""
+
+    def __init__(self, test, node, frontend, metric, value, median, score, samples):
+        self.test = test
+        self.node = node
+        self.frontend = frontend
+        self.metric = metric
+        self.value = value
+        self.median = median
+        self.score = score
+        self.samples = samples
+
+    def __str__(self):
+        where = self.node if self.frontend is None else f"{self.node} ({self.frontend})"
+        return (
+            f"{self.test} - {where} - {self.metric}: {self.value:.3f} against a median of {self.median:.3f} "
+            f"over the last {self.samples} runs, score {self.score:.1f}"
+        )
+
+
+class ResultStore(object):
+    """Append-only SQLite store of benchmark results
+    Every result is keyed on test, node, frontend, Nextcloud version, metric and timestamp.
+    add compares a new result against the last g_regressionWindow results of the same test, node, frontend and metric
+    before storing it and returns a Regression if the new result is significantly worse.
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            path = g_resultStoreFile
+        if not path:
+            path = ":memory:"
+        elif os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "id INTEGER PRIMARY KEY, timestamp REAL NOT NULL, test TEXT NOT NULL, node TEXT NOT NULL, "
+                "frontend TEXT, version TEXT, metric TEXT NOT NULL, value REAL NOT NULL, count INTEGER)"
+            )
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS results_series ON results (test, node, frontend, metric, timestamp)"
+            )
+
+    def history(self, test, node, metric, frontend=None, limit=None):
+        """Return the last limit values of a series, newest first"""
+        if limit is None:
+            limit = g_regressionWindow
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT value FROM results WHERE test = ? AND node = ? AND frontend IS ? AND metric = ? "
+                "ORDER BY timestamp DESC LIMIT ?",
+                (test, node, frontend, metric, limit),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def find_regression(self, test, node, metric, value, frontend=None, lowerIsBetter=True):
+        """Compare value against the rolling baseline using the median and the median absolute deviation"""
+        baseline = self.history(test, node, metric, frontend)
+        if len(baseline) < g_regressionMinSamples:
+            return None
+        median = statistics.median(baseline)
+        deviation = statistics.median([abs(v - median) for v in baseline])
+        change = value - median if lowerIsBetter else median - value
+        if change <= abs(median) * g_regressionTolerance:
+            return None
+        if deviation == 0:
+            score = float("inf")
+        else:
+            score = 0.6745 * change / deviation
+        if score <= g_regressionThreshold:
+            return None
+        return Regression(test, node, frontend, metric, value, median, score, len(baseline))
+
+    def add(self, test, node, metric, value, frontend=None, version=None, count=None, lowerIsBetter=True):
+        """Store a result, returns a Regression if it is significantly worse than the baseline, otherwise None"""
+        regression = self.find_regression(test, node, metric, value, frontend, lowerIsBetter)
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT INTO results (timestamp, test, node, frontend, version, metric, value, count) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (time.time(), test, node, frontend, version, metric, value, count),
+            )
+        return regression
+
+    def add_histogram(self, test, node, name, histogram, frontend=None, version=None):
+        """Store p50, p90, p99 and max of a LatencyHistogram in seconds, returns the list of regressions"""
+        if histogram.count == 0:
+            return []
+        regressions = []
+        for label, p in [("p50", 50), ("p90", 90), ("p99", 99), ("max", 100)]:
+            regression = self.add(
+                test, node, f"{name} {label}", histogram.percentile(p), frontend, version, histogram.count
+            )
+            if regression is not None:
+                regressions.append(regression)
+        return regressions
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+def get_result_store():
+    """Return the result store shared by all tests of this process"""
+    global g_resultStore
+    with g_resultStoreLock:
+        if g_resultStore is None:
+            g_resultStore = ResultStore()
+        return g_resultStore
@@ -0,0 +1,364 @@
+"""Selenium support for Sunet Drive tests
+Author: Richard Freitag <freitag@sunet.se>
+SeleniumHelper prepares local and grid browser drivers and logs in to Sunet Drive nodes.
+It lives in its own module so that selenium and pyotp are only imported by the tests that drive a browser,
+sunetnextcloud.SeleniumHelper imports it on first use.
+"""
+
+import os
+import time
+from enum import Enum
+
+import pyotp
+import requests
+from selenium import webdriver
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver import EdgeOptions, FirefoxOptions
+from selenium.webdriver.chrome.options import Options as ChromeOptions
+from selenium.webdriver.common.by import By
+from selenium.webdriver.common.keys import Keys
+from selenium.webdriver.safari.options import Options as SafariOptions
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+
+from sunetnextcloud import TestTarget, g_requestTimeout, logger
+
+use_driver_service = False
+if os.environ.get("SELENIUM_DRIVER_SERVICE") == "True":
+    use_driver_service = True
+
+geckodriver_path = "/usr/bin/geckodriver"
+if not os.path.isfile(geckodriver_path):
+    geckodriver_path = "/snap/bin/geckodriver"
+
+
+class SeleniumHelper:
+    class UserType(Enum):
+        SELENIUM = 1
+        SELENIUM_MFA = 2
+        OCS = 3
+        BASIC = 4
+        UNKNOWN = -1
+
+    def __init__(self, browser, nextcloudnode) -> None:
+        self.nextcloudnode = nextcloudnode
+        self.drv = TestTarget()
+        delay = 30
+        self.prepare_driver(browser)
+        self.wait = WebDriverWait(self.driver, delay)
+        pass
+
+    def prepare_driver(self, browser):
+        try:
+            if browser == "chrome":
+                options = ChromeOptions()
+                options.add_argument("--no-sandbox")
+                options.add_argument("--disable-dev-shm-usage")
+                options.add_argument("--disable-gpu")
+                options.add_argument("--disable-extensions")
+
+                if not self.drv.verify:
+                    options.add_argument("--ignore-certificate-errors")
+                self.driver = webdriver.Chrome(options=options)
+            elif browser == "firefox":
+                if not use_driver_service:
+                    logger.info("Initialize Firefox driver without driver service")
+                    options = FirefoxOptions()
+                    if not self.drv.verify:
+                        options.add_argument("--ignore-certificate-errors")
+                    # options.add_argument("--headless")
+                    self.driver = webdriver.Firefox(options=options)
+                else:
+                    logger.info(
+                        "Initialize Firefox driver using snap geckodriver and driver service"
+                    )
+                    driver_service = webdriver.FirefoxService(
+                        executable_path=geckodriver_path
+                    )
+                    self.driver = webdriver.Firefox(
+                        service=driver_service, options=options
+                    )
+            elif browser == "edge":
+                if not use_driver_service:
+                    logger.info("Initialize Edge driver without driver service")
+                    options = EdgeOptions()
+                    if not self.drv.verify:
+                        options.add_argument("--ignore-certificate-errors")
+                    # options.add_argument("--headless")
+                    self.driver = webdriver.Edge(options=options)
+                else:
+                    logger.info(
+                        "Initialize Edge driver using snap geckodriver and driver service"
+                    )
+                    driver_service = webdriver.FirefoxService(
+                        executable_path=geckodriver_path
+                    )
+                    self.driver = webdriver.Firefox(
+                        service=driver_service, options=options
+                    )
+            elif browser == "firefox_grid":
+                logger.info("Initialize Firefox grid driver")
+                options = FirefoxOptions()
+                # options.add_argument("--no-sandbox")
+                # options.add_argument("--disable-dev-shm-usage")
+                # options.add_argument("--disable-gpu")
+                # options.add_argument("--disable-extensions")
+                if not self.drv.verify:
+                    options.add_argument("--ignore-certificate-errors")
+                self.driver = webdriver.Remote(
+                    command_executor=self.drv.testgridaddress, options=options
+                )
+            elif browser == "chrome_grid":
+                logger.info(f"Initialize Chrome grid driver")
+                if not self.drv.verify:
+                    options.add_argument("--ignore-certificate-errors")
+                options = ChromeOptions()
+                self.driver = webdriver.Remote(
+                    command_executor=self.drv.testgridaddress, options=options
+                )
+            elif browser == "edge_grid":
+                logger.info(f"Initialize Edge grid driver")
+                if not self.drv.verify:
+                    options.add_argument("--ignore-certificate-errors")
+                options = EdgeOptions()
+                self.driver = webdriver.Remote(
+                    command_executor=self.drv.testgridaddress, options=options
+                )
+                logger.info(f"Edge grid driver init done")
+            else:
+                logger.error(f"Unknown browser {browser}")
+                raise Exception(f"Unknown browser {browser}")
+        except Exception as e:
+            logger.error(f"Error initializing driver for {browser}: {e}")
+            raise Exception(f"Error initializing driver for {browser}: {e}")
+        return
+
+    def delete_cookies(self):
+        cookies = self.driver.get_cookies()
+        logger.debug(f"Deleting all cookies: {cookies}")
+        self.driver.delete_all_cookies()
+        logger.info("All cookies deleted")
+        return
+
+    def nodelogin(
+        self,
+        usertype: UserType,
+        username="",
+        password="",
+        apppwd="",
+        totpsecret="",
+        mfaUser=True,
+        skipAppMenuCheck=False,
+        addOtp=False,
+        acceptToS=False,
+    ):
+        nodetotpsecret = ""
+        loginurl = self.drv.get_node_login_url(self.nextcloudnode)
+        if usertype == usertype.SELENIUM:
+            nodeuser = self.drv.get_seleniumuser(self.nextcloudnode)
+            nodepwd = self.drv.get_seleniumuserpassword(self.nextcloudnode)
+            nodetotpsecret = self.drv.get_seleniumusertotpsecret(self.nextcloudnode)
+            isMfaUser = mfaUser
+        elif usertype == usertype.SELENIUM_MFA:
+            nodeuser = self.drv.get_seleniummfauser(self.nextcloudnode)
+            nodepwd = self.drv.get_seleniummfauserpassword(self.nextcloudnode)
+            nodetotpsecret = self.drv.get_seleniummfausertotpsecret(self.nextcloudnode)
+            isMfaUser = mfaUser
+        elif usertype == usertype.OCS:
+            nodeuser = self.drv.get_ocsuser(self.nextcloudnode)
+            nodepwd = self.drv.get_ocsuserpassword(self.nextcloudnode)
+            nodetotpsecret = totpsecret
+            isMfaUser = True
+        elif usertype == usertype.BASIC:
+            nodeuser = username
+            nodepwd = password
+            nodetotpsecret = totpsecret
+            isMfaUser = mfaUser
+        else:
+            logger.error(f"Unknown usertype {usertype}")
+            return False
+
+        loginurl = self.drv.get_node_login_url(self.nextcloudnode)
+
+        try:
+            r = requests.get(loginurl, timeout=g_requestTimeout, verify=False)
+            if "This service is currently unavailable." in r.text:
+                raise Exception(f"{self.nextcloudnode} is not available!")
+        except Exception as error:
+            logger.error(f"Failed to request data from {loginurl}: {error}")
+            return
+
+        self.driver.get(loginurl)
+        if self.driver.current_url != loginurl:
+            logger.warning(f"Retry opening login url: {loginurl}")
+            self.driver.get(loginurl)
+
+        try:
+            logger.info("Enter username and password")
+            currentUrl = self.driver.current_url
+            self.wait.until(EC.element_to_be_clickable((By.ID, "user"))).send_keys(
+                nodeuser
+            )
+            self.wait.until(EC.element_to_be_clickable((By.ID, "password"))).send_keys(
+                nodepwd + Keys.ENTER
+            )
+        except Exception as error:
+            logger.error(f"Error logging in to {loginurl}: {error}")
+
+        if addOtp:
+            logger.info(f"Adding OTP for {username}")
+            totpXpath = '//a[@href="/login/setupchallenge/totp"]'
+            logger.info(f"Locating {totpXpath}")
+            self.wait.until(EC.element_to_be_clickable((By.XPATH, totpXpath)))
+
+            totpselect = self.driver.find_element(By.XPATH, totpXpath)
+            totpselect.click()
+
+            self.wait.until(
+                EC.presence_of_element_located(
+                    (By.CLASS_NAME, "setup-confirmation__secret")
+                )
+            )
+
+            nodetotpsecret = self.driver.find_element(
+                By.CLASS_NAME, "setup-confirmation__secret"
+            ).text.split(" ")[-1]
+            totp = pyotp.TOTP(nodetotpsecret)
+            currentOtp = totp.now()
+
+            self.wait.until(
+                EC.element_to_be_clickable(
+                    (By.XPATH, '//*//input[@placeholder="Authentication code"]')
+                )
+            ).send_keys(currentOtp + Keys.ENTER)
+            logger.info(f"OTP added for {username}")
+            isMfaUser = True
+            self.wait.until(
+                EC.presence_of_element_located((By.CLASS_NAME, "two-factor-provider"))
+            )  # Wait for mfa login button and proceed
+
+        if isMfaUser:
+            retryCount = 0
+            while self.driver.current_url == currentUrl:
+                logger.info(f"Wait for URL change after login")
+                time.sleep(1)
+                retryCount += 1
+                if retryCount > g_requestTimeout:
+                    logger.error(
+                        f"URL did not change after {g_requestTimeout}s: {self.driver.current_url}"
+                    )
+                    raise TimeoutException
+            logger.info(f"MFA login {self.driver.current_url}")
+            totpXpath = '//a[contains(@href,"/challenge/totp")]'
+
+            if "selectchallenge" in self.driver.current_url:
+                logger.info("Select TOTP provider")
+                self.wait.until(EC.element_to_be_clickable((By.XPATH, totpXpath)))
+                totpselect = self.driver.find_element(By.XPATH, totpXpath)
+                totpselect.click()
+            elif "challenge/totp" in self.driver.current_url:
+                logger.info("No need to select TOTP provider")
+            else:
+                logger.error(f"Unexpected url: {self.driver.current_url}")
+
+            currentOtp = 0
+            totpRetry = 0
+            while totpRetry <= 3:
+                totpRetry += 1
+                totp = pyotp.TOTP(nodetotpsecret)
+                currentOtp = totp.now()
+                self.wait.until(
+                    EC.element_to_be_clickable(
+                        (By.XPATH, '//*//input[@placeholder="Authentication code"]')
+                    )
+                ).send_keys(currentOtp + Keys.ENTER)
+                time.sleep(3)  # Replace with proper check at some point
+                if "challenge/totp" in self.driver.current_url:
+                    logger.info("Try again")
+                    while currentOtp == totp.now():
+                        logger.info("Wait for new OTP to be issued")
+                        time.sleep(3)
+                else:
+                    logger.info(f"Logging in to {self.nextcloudnode}")
+                    break
+        else:
+            logger.info("No MFA login")
+
+        if acceptToS:
+            logger.info(f"Try to accept ToS: {acceptToS}")
+            self.wait.until(
+                EC.presence_of_element_located((By.CLASS_NAME, "terms-content"))
+            )  # Wait for the ToS content field
+
+            # Find accept tos button
+            acceptButton = None
+            try:
+                buttons = self.driver.find_elements(By.CLASS_NAME, "button-vue__text")
+                for button in buttons:
+                    if (
+                        "I acknowledge that I have read and agree to the above terms of service"
+                        in button.text
+                    ):
+                        acceptButton = button
+            except Exception as error:
+                logger.error(f"Unable to find create new app button: {error}")
+                return None
+
+            acceptButton.click()
+
+        try:
+            if skipAppMenuCheck:
+                logger.info("Skip app menu check!")
+                return True
+            self.wait.until(EC.presence_of_element_located((By.CLASS_NAME, "app-menu")))
+            logger.info("App menu is ready!")
+        except TimeoutException:
+            logger.info("Loading of app menu took too much time!")
+
+        if len(nodetotpsecret) > 0:
+            return nodetotpsecret
+        else:
+            return ""
+
+    def create_app_password(self):
+        settingsUrl = self.drv.get_settings_user_security_url(self.nextcloudnode)
+        logger.info(f"Open user security settings: {settingsUrl}")
+        self.driver.get(settingsUrl)
+        self.wait.until(
+            EC.element_to_be_clickable(
+                (By.XPATH, '//*//input[@placeholder="App name"]')
+            )
+        ).send_keys("__testautomation__")
+
+        # Find create new app button
+        createButton = None
+        try:
+            buttons = self.driver.find_elements(By.CLASS_NAME, "button-vue__text")
+            for button in buttons:
+                if "Create new app password" in button.text:
+                    createButton = button
+        except Exception as error:
+            logger.error(f"Unable to find create new app button: {error}")
+            return None
+
+        createButton.click()
+
+        self.wait.until(
+            EC.presence_of_element_located(
+                (By.XPATH, '//*//input[@placeholder="Password"]')
+            )
+        )
+        time.sleep(2)
+        pwdField = self.driver.find_element(
+            By.XPATH, '//*//input[@placeholder="Password"]'
+        )
+        appPwd = pwdField.get_attribute("value")
+        # Click on close icon and return the password
+        self.wait.until(
+            EC.element_to_be_clickable((By.CLASS_NAME, "close-icon"))
+        ).click()
+        return appPwd
+
+
+# Override TextTestResult to count subtests as test executions
+# Credits: https://stackoverflow.com/questions/45007346/count-subtests-in-python-unittests-separately
@@ -0,0 +1,1232 @@
+"""Sunet Drive WebDAV helpers shared by the WebDAV tests and sandboxes
+Author: Richard Freitag <freitag@sunet.se>
+DeleteEngine deletes WebDAV resources with a fixed number of workers over one pooled keep-alive session.
+ChunkedUploader uploads large files with the Nextcloud chunking v2 protocol, like the desktop client does.
+RandomUploadSource generates seeded pseudo-random file content while it is uploaded, so tests need no temporary files.
+IntegrityChecker verifies uploaded files against a streaming checksum of their source.
+DirectoryCache creates folder paths with one MKCOL per missing folder and remembers the folders that exist.
+TreeWalker lists WebDAV trees with concurrent PROPFINDs and parses the responses incrementally.
+TrashbinCleaner empties a trashbin with a single DELETE and falls back to the DeleteEngine.
+WebdavBenchmark measures PUT, GET, PROPFIND, COPY, MOVE and DELETE for one file size and concurrency.
+DownloadBenchmark measures streaming, ranged parallel and many small file downloads.
+SyncClient runs nextcloudcmd as a subprocess and measures the sync from its output.
+write_trace turns recorded request timings into a WebDAV trace that TraceReplayer replays against another target.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import subprocess
+import threading
+import time
+import uuid
+import xml.etree.ElementTree as ET
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from email.utils import parsedate_to_datetime
+from urllib.parse import quote, unquote, urlparse
+
+import requests
+from requests.packages.urllib3.util.retry import Retry
+
+import sunetperformance
+
+logger = logging.getLogger(__name__)
+
+# Sessions of the WebDAV engines only retry opening a connection, the engines own all other retries
+g_sessionRetries = Retry(total=2, connect=2, read=0, status=0, backoff_factor=0.1, status_forcelist=(), raise_on_status=False)
+
+# Number of concurrent DELETE requests, keep NextcloudTestPoolSize at least as large to reuse all connections
+g_deleteConcurrency = int(os.environ.get("NextcloudWebdavDeleteConcurrency", 8))
+# Locked (423) and unavailable (503) resources are retried with exponential backoff
+g_deleteRetries = int(os.environ.get("NextcloudWebdavDeleteRetries", 5))
+g_deleteRetryStatus = [423, 503]
+g_deleteBackoff = 0.5
+g_deleteTimeout = 30
+
+# bulk: empty the whole trashbin with a single DELETE, items: delete every item with the DeleteEngine
+g_trashbinMode = os.environ.get("NextcloudWebdavTrashbinMode", "bulk")
+# Emptying a large trashbin in one request takes a while on the server
+g_trashbinTimeout = 600
+
+# Chunk size in MB for chunked uploads, Nextcloud accepts 5 MB to 5 GB per chunk except for the last one
+g_chunkSize = int(os.environ.get("NextcloudWebdavChunkSize", 10)) * 1024 * 1024
+g_chunkConcurrency = int(os.environ.get("NextcloudWebdavChunkConcurrency", 4))
+g_chunkRetries = int(os.environ.get("NextcloudWebdavChunkRetries", 3))
+g_chunkTimeout = 300
+# Assembling the chunks of a large file on the server takes a while
+g_assembleTimeout = 3600
+
+# Generated content is produced in blocks of this size, every block is seeded on its own so any range can be generated
+g_sourceBlockSize = 1024 * 1024
+
+# Checksum of uploaded content, any hashlib algorithm or xxh64, xxh3_64 and xxh3_128 if xxhash is installed
+g_checksumAlgorithm = os.environ.get("NextcloudWebdavChecksum", "sha256")
+# Verification of uploads, none, download: download and hash the file, propfind: compare with the checksum stored
+# by the server in oc:checksums, auto: use the stored checksum if there is a usable one, otherwise download
+g_verifyMode = os.environ.get("NextcloudWebdavVerify", "none")
+g_verifyTimeout = 3600
+g_checksumsRequest = """<?xml version="1.0" encoding="utf-8" ?>
+<d:propfind xmlns:d="DAV:" xmlns:oc="http://owncloud.org/ns">
+  <d:prop><oc:checksums/></d:prop>
+</d:propfind>"""
+
+# Operations measured by WebdavBenchmark, in the order they run on the same set of files
+g_benchmarkOperations = ["PUT", "GET", "PROPFIND", "COPY", "MOVE", "DELETE"]
+
+# Sync client used by SyncClient and the time a single sync may take
+g_nextcloudcmd = os.environ.get("NextcloudCmd", "nextcloudcmd")
+g_syncTimeout = int(os.environ.get("NextcloudSyncTimeout", 3600))
+# Phase lines of the sync engine, e.g. "#### Discovery end ########## 47 ms"
+g_syncPhaseLine = re.compile(r"#### (.+?) #*\s*(\d+)\s*ms")
+g_syncErrorLine = re.compile(r"\[ (critical|fatal) |Sync error|SyncFileStatus::StatusError", re.IGNORECASE)
+
+# Folder caches keyed on the webdav url of a node and user, kept for the whole test run
+g_directoryCaches = {}
+g_directoryCachesLock = threading.Lock()
+
+# WebDAV requests below remote.php/dav/<area>/<user>/ are traced without the user, so a trace can be replayed as another user
+g_tracePath = re.compile(r"^/remote\.php/dav/(files|uploads|trashbin|versions)/[^/]+/(.*)$")
+g_traceVersion = 1
+g_replayMethods = ["GET", "HEAD", "PUT", "MKCOL", "PROPFIND", "COPY", "MOVE", "DELETE"]
+g_replayConcurrency = int(os.environ.get("NextcloudReplayConcurrency", 32))
+
+# Depth of the PROPFIND requests of the tree walker, 1: one request per folder, infinity: one request for the whole tree
+g_walkDepth = os.environ.get("NextcloudWebdavWalkDepth", "1")
+# Number of folders listed concurrently with depth 1
+g_walkConcurrency = int(os.environ.get("NextcloudWebdavWalkConcurrency", 8))
+g_walkTimeout = 300
+g_walkRequest = """<?xml version="1.0" encoding="utf-8" ?>
+<d:propfind xmlns:d="DAV:" xmlns:oc="http://owncloud.org/ns">
+  <d:prop>
+    <d:resourcetype/>
+    <d:getetag/>
+    <d:getlastmodified/>
+    <d:getcontentlength/>
+    <oc:fileid/>
+    <oc:size/>
+  </d:prop>
+</d:propfind>"""
+
+
+def new_hash(algorithm=None):
+    """Return a new hash object for algorithm, xxhash is only imported when one of its algorithms is used"""
+    if algorithm is None:
+        algorithm = g_checksumAlgorithm
+    if algorithm.startswith("xxh"):
+        import xxhash
+
+        return getattr(xxhash, algorithm)()
+    return hashlib.new(algorithm)
+
+
+def checksum(source, algorithm=None):
+    """Return the hex checksum of source, a local path or a RandomUploadSource, reading it block by block"""
+    if algorithm is None:
+        algorithm = g_checksumAlgorithm
+    if isinstance(source, RandomUploadSource):
+        if source.digest is None or source.algorithm != algorithm:
+            copy = RandomUploadSource(source.size, source.seed, algorithm).range(source.start, source.length)
+            for data in copy:
+                pass
+            if source.algorithm == algorithm:
+                source.digest = copy.digest
+            return copy.digest
+        return source.digest
+    digest = new_hash(algorithm)
+    with open(source, "rb") as f:
+        for data in iter(lambda: f.read(g_sourceBlockSize), b""):
+            digest.update(data)
+    return digest.hexdigest()
+
+
+def checksum_headers(source, algorithm=None):
+    """Return the OC-Checksum header for an upload of source, e.g. SHA256:<hex>, the server stores it in oc:checksums
+    It is only computed when IntegrityChecker compares with the stored checksums, otherwise no header is sent.
+    The checksum of a RandomUploadSource is kept, so computing the header ahead of a timed upload makes it free.
+    """
+    if g_verifyMode not in ["propfind", "auto"]:
+        return {}
+    if algorithm is None:
+        algorithm = g_checksumAlgorithm
+    return {"OC-Checksum": f"{algorithm.upper()}:{checksum(source, algorithm)}"}
+
+
+def upload_source(client, source, remotePath):
+    """Upload source with a webdav3 Client like Client.upload_to, with the OC-Checksum header if one is needed"""
+    headers = checksum_headers(source)
+    if len(headers) == 0:
+        client.upload_to(buff=source, remote_path=remotePath)
+        return
+    from webdav3.exceptions import RemoteParentNotFound
+    from webdav3.urn import Urn
+
+    urn = Urn(remotePath)
+    if not client.check(urn.parent()):
+        raise RemoteParentNotFound(urn.path())
+    client.execute_request(
+        action="upload",
+        path=urn.quote(),
+        data=source,
+        headers_ext=[f"{name}: {value}" for name, value in headers.items()],
+    )
+
+
+def get_webdav_session(drv, node, user, password, fe=None):
+    """Return a pooled session of TestTarget drv for node, authenticated as user and optionally pinned to frontend fe
+    The session only retries connections that could not be opened, every status reaches the caller,
+    so the engines back off on 423 and 503 themselves and benchmarks see the server errors
+    """
+    session = drv.get_session(node, fe, g_sessionRetries)
+    session.auth = (user, password)
+    return session
+
+
+class DeleteResult(object):
+    """Outcome of deleting a single WebDAV resource"""
+
+    def __init__(self, path, status=None, attempts=0, elapsed=0.0, error=None):
+        self.path = path
+        self.status = status
+        self.attempts = attempts
+        self.elapsed = elapsed
+        self.error = error
+
+    @property
+    def passed(self):
+        # A resource that is already gone counts as deleted
+        return self.status in [200, 204, 404]
+
+    def __repr__(self):
+        return f"DeleteResult({self.path}, status={self.status}, attempts={self.attempts}, error={self.error})"
+
+
+class DeleteEngine(object):
+    """Delete WebDAV resources below baseurl with a fixed pool of workers sharing session
+    Paths are relative to baseurl, the webdav url of a user ending with a slash.
+    Every delete is retried on 423 and 503 and on connection errors, the latency of every item
+    goes into a LatencyHistogram and report() summarizes the last run.
+    """
+
+    def __init__(self, session, baseurl, concurrency=None, retries=None, timeout=g_deleteTimeout):
+        self.session = session
+        self.baseurl = baseurl
+        self.concurrency = concurrency if concurrency is not None else g_deleteConcurrency
+        self.retries = retries if retries is not None else g_deleteRetries
+        self.timeout = timeout
+        self.results = []
+        self.elapsed = 0.0
+        self.histogram = sunetperformance.LatencyHistogram()
+
+    def delete_one(self, path):
+        url = self.baseurl + quote(path)
+        result = DeleteResult(path)
+        startTime = time.perf_counter()
+        while True:
+            result.attempts += 1
+            retryAfter = None
+            try:
+                r = self.session.delete(url, timeout=self.timeout)
+                result.status = r.status_code
+                result.error = None
+                if r.status_code not in g_deleteRetryStatus:
+                    break
+                retryAfter = r.headers.get("Retry-After")
+            except requests.exceptions.RequestException as error:
+                result.error = str(error)
+            if result.attempts > self.retries:
+                break
+            delay = g_deleteBackoff * 2 ** (result.attempts - 1)
+            if retryAfter is not None and retryAfter.isdigit():
+                delay = max(delay, int(retryAfter))
+            time.sleep(delay)
+        result.elapsed = time.perf_counter() - startTime
+        self.histogram.record(result.elapsed)
+        if not result.passed:
+            logger.error(
+                f"Unable to delete {path} after {result.attempts} attempts: {result.status} {result.error or ''}"
+            )
+        return result
+
+    def delete(self, paths):
+        """Delete all paths and return a DeleteResult per path in the same order"""
+        paths = list(paths)
+        self.histogram = sunetperformance.LatencyHistogram()
+        startTime = time.perf_counter()
+        if len(paths) == 0:
+            self.results = []
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.concurrency, len(paths))) as executor:
+                self.results = list(executor.map(self.delete_one, paths))
+        self.elapsed = time.perf_counter() - startTime
+        return self.results
+
+    @property
+    def failed(self):
+        return [result for result in self.results if not result.passed]
+
+    def report(self):
+        """One line summary of the last delete run"""
+        count = len(self.results)
+        retries = sum(result.attempts - 1 for result in self.results)
+        rate = count / self.elapsed if self.elapsed > 0 else 0.0
+        return (
+            f"Deleted {count - len(self.failed)} of {count} items in {self.elapsed:.1f}s with {self.concurrency} workers - "
+            f"{rate:.2f} items/s - {retries} retries - {self.histogram.summary()}"
+        )
+
+
+class RandomUploadSource(object):
+    """Deterministic pseudo-random file content of size bytes that is generated while it is sent
+    The same seed always gives the same bytes. The source can be passed as data to requests or to
+    webdav3 Client.upload_to and is sent with a Content-Length, since its length is known up front.
+    Iterating the source computes the checksum of the content on the fly, it is available in digest afterwards.
+    """
+
+    def __init__(self, size, seed=0, algorithm=None):
+        self.size = size
+        self.seed = seed
+        self.algorithm = algorithm if algorithm is not None else g_checksumAlgorithm
+        self.start = 0
+        self.length = size
+        self.digest = None
+
+    def __len__(self):
+        return self.length
+
+    def __repr__(self):
+        return f"RandomUploadSource({self.size}, seed={self.seed!r}, start={self.start}, length={self.length})"
+
+    def block(self, index):
+        blockStart = index * g_sourceBlockSize
+        blockLength = min(g_sourceBlockSize, self.size - blockStart)
+        return hashlib.shake_128(f"{self.seed}:{index}".encode()).digest(blockLength)
+
+    def range(self, offset, length):
+        """Return a source for length bytes of this content starting at offset, e.g. for a single chunk"""
+        source = RandomUploadSource(self.size, self.seed, self.algorithm)
+        source.start = offset
+        source.length = min(length, self.size - offset)
+        return source
+
+    def __iter__(self):
+        digest = new_hash(self.algorithm)
+        position = self.start
+        end = self.start + self.length
+        while position < end:
+            index = position // g_sourceBlockSize
+            blockStart = index * g_sourceBlockSize
+            data = self.block(index)[position - blockStart : end - blockStart]
+            digest.update(data)
+            position += len(data)
+            yield data
+        self.digest = digest.hexdigest()
+
+    def write(self, path):
+        """Write the content to a local file, for clients like nextcloudcmd that only upload from disk"""
+        with open(path, "wb") as f:
+            for data in self:
+                f.write(data)
+
+
+class ChunkResult(object):
+    """Outcome of uploading a single chunk"""
+
+    def __init__(self, index, offset, size):
+        self.index = index
+        self.offset = offset
+        self.size = size
+        self.status = None
+        self.attempts = 0
+        self.elapsed = 0.0
+        self.error = None
+
+    @property
+    def passed(self):
+        return self.status in [201, 204]
+
+    @property
+    def throughput(self):
+        """Chunk throughput in MB/s"""
+        return self.size / 1024 / 1024 / self.elapsed if self.elapsed > 0 else 0.0
+
+
+class ChunkedUploader(object):
+    """Upload files with the Nextcloud chunking v2 protocol
+    The file is split into chunks of chunkSize bytes which are sent with up to concurrency parallel PUTs to
+    remote.php/dav/uploads/<user>/<upload id>/<chunk number> and assembled on the server with a final MOVE.
+    Failed chunks are retried on their own, so a single bad chunk does not restart the whole file.
+    nodeurl is the node url without path, e.g. TestTarget.get_endpoints(node).url
+    """
+
+    def __init__(self, session, nodeurl, user, chunkSize=None, concurrency=None, retries=None):
+        self.session = session
+        self.user = user
+        self.filesurl = f"{nodeurl}/remote.php/dav/files/{quote(user)}/"
+        self.uploadsurl = f"{nodeurl}/remote.php/dav/uploads/{quote(user)}/"
+        self.chunkSize = chunkSize if chunkSize is not None else g_chunkSize
+        self.concurrency = concurrency if concurrency is not None else g_chunkConcurrency
+        self.retries = retries if retries is not None else g_chunkRetries
+        self.chunks = []
+        self.size = 0
+        self.elapsed = 0.0
+        self.histogram = sunetperformance.LatencyHistogram()
+
+    def upload_chunk(self, uploadurl, destination, source, chunk):
+        if isinstance(source, RandomUploadSource):
+            data = source.range(chunk.offset, chunk.size)
+        else:
+            with open(source, "rb") as f:
+                f.seek(chunk.offset)
+                data = f.read(chunk.size)
+        headers = {"Destination": destination, "OC-Total-Length": str(self.size)}
+        startTime = time.perf_counter()
+        while True:
+            chunk.attempts += 1
+            try:
+                r = self.session.put(
+                    f"{uploadurl}/{chunk.index}",
+                    data=data,
+                    headers=headers,
+                    timeout=g_chunkTimeout,
+                )
+                chunk.status = r.status_code
+                chunk.error = None
+                if chunk.passed:
+                    break
+            except requests.exceptions.RequestException as error:
+                chunk.error = str(error)
+            if chunk.attempts > self.retries:
+                break
+            logger.warning(f"Retrying chunk {chunk.index} of {destination}: {chunk.status} {chunk.error or ''}")
+            time.sleep(g_deleteBackoff * 2 ** (chunk.attempts - 1))
+        chunk.elapsed = time.perf_counter() - startTime
+        self.histogram.record(chunk.elapsed)
+        return chunk
+
+    def upload(self, source, remotePath):
+        """Upload source to remotePath relative to the files of the user, returns True if the file was assembled
+        source is the path of a local file or a RandomUploadSource
+        """
+        if isinstance(source, RandomUploadSource):
+            self.size = len(source)
+        else:
+            self.size = os.path.getsize(source)
+        self.histogram = sunetperformance.LatencyHistogram()
+        self.chunks = []
+        for index, offset in enumerate(range(0, max(self.size, 1), self.chunkSize)):
+            self.chunks.append(ChunkResult(index + 1, offset, min(self.chunkSize, self.size - offset)))
+
+        destination = self.filesurl + quote(remotePath)
+        uploadurl = self.uploadsurl + f"upload-{uuid.uuid4().hex}"
+        # The server stores the checksum sent with the MOVE that assembles the file
+        assembleHeaders = {"Destination": destination, "OC-Total-Length": str(self.size), "Overwrite": "T"}
+        assembleHeaders.update(checksum_headers(source))
+        startTime = time.perf_counter()
+        r = self.session.request(
+            "MKCOL", uploadurl, headers={"Destination": destination}, timeout=g_chunkTimeout
+        )
+        if r.status_code != 201:
+            logger.error(f"Unable to create upload directory for {remotePath}: {r.status_code}")
+            self.elapsed = time.perf_counter() - startTime
+            return False
+
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(self.chunks))) as executor:
+            list(executor.map(lambda chunk: self.upload_chunk(uploadurl, destination, source, chunk), self.chunks))
+
+        failed = [chunk for chunk in self.chunks if not chunk.passed]
+        if len(failed) > 0:
+            logger.error(f"{len(failed)} chunks of {remotePath} failed, aborting upload: {[chunk.index for chunk in failed]}")
+            self.session.delete(uploadurl, timeout=g_chunkTimeout)
+            self.elapsed = time.perf_counter() - startTime
+            return False
+
+        r = self.session.request(
+            "MOVE",
+            f"{uploadurl}/.file",
+            headers=assembleHeaders,
+            timeout=g_assembleTimeout,
+        )
+        self.elapsed = time.perf_counter() - startTime
+        if r.status_code not in [201, 204]:
+            logger.error(f"Unable to assemble {remotePath}: {r.status_code}")
+            self.session.delete(uploadurl, timeout=g_chunkTimeout)
+            return False
+        return True
+
+    def report(self):
+        """One line summary of the last upload including the per-chunk throughput"""
+        megabytes = self.size / 1024 / 1024
+        rate = megabytes / self.elapsed if self.elapsed > 0 else 0.0
+        retries = sum(chunk.attempts - 1 for chunk in self.chunks)
+        chunkRates = sorted(chunk.throughput for chunk in self.chunks if chunk.passed)
+        if len(chunkRates) > 0:
+            chunkText = f"chunk MB/s min {chunkRates[0]:.1f} - median {chunkRates[len(chunkRates) // 2]:.1f} - max {chunkRates[-1]:.1f}"
+        else:
+            chunkText = "no chunks uploaded"
+        return (
+            f"Uploaded {megabytes:.1f} MB in {len(self.chunks)} chunks of {self.chunkSize / 1024 / 1024:g} MB "
+            f"with {self.concurrency} workers in {self.elapsed:.1f}s - {rate:.1f} MB/s - {retries} retries - "
+            f"{chunkText} - {self.histogram.summary()}"
+        )
+
+
+class VerifyResult(object):
+    """Outcome of verifying a single uploaded file"""
+
+    def __init__(self, path, algorithm, method, expected=None, actual=None, error=None):
+        self.path = path
+        self.algorithm = algorithm
+        self.method = method
+        self.expected = expected
+        self.actual = actual
+        self.error = error
+
+    @property
+    def passed(self):
+        return self.error is None and self.expected is not None and self.expected == self.actual
+
+    def __repr__(self):
+        return (
+            f"VerifyResult({self.path}, {self.method} {self.algorithm}, expected={self.expected}, "
+            f"actual={self.actual}, error={self.error})"
+        )
+
+
+class IntegrityChecker(object):
+    """Verify uploaded files below baseurl against their source without holding a file in memory
+    Downloads are hashed while they are streamed, the checksum of the source is computed the same way.
+    The propfind mode compares with the checksums the server stores in oc:checksums, which only exist
+    if the uploading client sent an OC-Checksum header, like the desktop client and nextcloudcmd do.
+    WebdavBenchmark, ChunkedUploader and upload_source send it whenever this mode or auto is configured.
+    It saves the download but is only as strong as the checksum validation on upload, download is the end to end check.
+    """
+
+    def __init__(self, session, baseurl, mode=None, algorithm=None):
+        self.session = session
+        self.baseurl = baseurl
+        self.mode = mode if mode is not None else g_verifyMode
+        self.algorithm = algorithm if algorithm is not None else g_checksumAlgorithm
+        self.results = []
+
+    def stored_checksums(self, remotePath):
+        """Return the checksums of remotePath stored on the server as a dict of lower case type and value"""
+        r = self.session.request(
+            "PROPFIND",
+            self.baseurl + quote(remotePath),
+            data=g_checksumsRequest,
+            headers={"Depth": "0"},
+            timeout=g_deleteTimeout,
+        )
+        if r.status_code != 207:
+            raise Exception(f"PROPFIND of {remotePath} failed with status {r.status_code}")
+        checksums = {}
+        for element in ET.fromstring(r.content).iter("{http://owncloud.org/ns}checksum"):
+            for entry in (element.text or "").split():
+                kind, separator, value = entry.partition(":")
+                if separator:
+                    checksums[kind.lower()] = value.lower()
+        return checksums
+
+    def download_checksum(self, remotePath, algorithm=None):
+        """Download remotePath and return its hex checksum, the content is hashed while it is received"""
+        digest = new_hash(algorithm if algorithm is not None else self.algorithm)
+        with self.session.get(self.baseurl + quote(remotePath), stream=True, timeout=g_verifyTimeout) as r:
+            if r.status_code != 200:
+                raise Exception(f"Download of {remotePath} failed with status {r.status_code}")
+            for data in r.iter_content(g_sourceBlockSize):
+                digest.update(data)
+        return digest.hexdigest()
+
+    def verify(self, remotePath, source):
+        """Compare remotePath with source, a local path or a RandomUploadSource, returns a VerifyResult"""
+        result = VerifyResult(remotePath, self.algorithm, self.mode)
+        try:
+            if self.mode in ["propfind", "auto"]:
+                try:
+                    checksums = self.stored_checksums(remotePath)
+                except Exception as error:
+                    if self.mode == "propfind":
+                        raise
+                    logger.warning(f"Falling back to download: {error}")
+                    checksums = {}
+                # Prefer the configured algorithm, otherwise use any stored type that hashlib knows
+                usable = [kind for kind in checksums if kind == self.algorithm]
+                usable += [kind for kind in checksums if kind in hashlib.algorithms_available]
+                if len(usable) > 0:
+                    result.method = "propfind"
+                    result.algorithm = usable[0]
+                    result.actual = checksums[usable[0]]
+                elif self.mode == "propfind":
+                    result.error = f"No usable checksum stored for {remotePath}: {checksums}"
+            if result.actual is None and result.error is None:
+                result.method = "download"
+                result.actual = self.download_checksum(remotePath)
+            if result.error is None:
+                result.expected = checksum(source, result.algorithm)
+        except Exception as error:
+            result.error = str(error)
+        if not result.passed:
+            logger.error(f"Integrity check failed: {result}")
+        self.results.append(result)
+        return result
+
+    @property
+    def failed(self):
+        return [result for result in self.results if not result.passed]
+
+
+class DavEntry(namedtuple("DavEntry", ["path", "isdir", "fileid", "size", "etag", "mtime"])):
+    """A resource listed by TreeWalker, path is relative to the base url and folders end with a slash,
+    mtime is a unix timestamp
+    """
+
+    __slots__ = ()
+
+
+class TreeWalker(object):
+    """List the WebDAV tree below baseurl, the webdav url of a user ending with a slash
+    Multistatus responses are parsed with iterparse while they are received and every resource is yielded
+    as a DavEntry as soon as its response element is complete, so large folders never become a DOM in memory.
+    With depth 1 every folder is one PROPFIND and up to concurrency folders are listed at the same time,
+    with depth infinity the whole tree is a single PROPFIND, if the server allows it.
+    """
+
+    def __init__(self, session, baseurl, depth=None, concurrency=None, timeout=g_walkTimeout):
+        self.session = session
+        self.baseurl = baseurl
+        self.basepath = unquote(urlparse(baseurl).path)
+        self.depth = depth if depth is not None else g_walkDepth
+        self.concurrency = concurrency if concurrency is not None else g_walkConcurrency
+        self.timeout = timeout
+        self.requests = 0
+
+    def _entry(self, response):
+        href = unquote(response.findtext("{DAV:}href", ""))
+        path = href[len(self.basepath) :] if href.startswith(self.basepath) else href
+        isdir = response.find(".//{DAV:}resourcetype/{DAV:}collection") is not None
+        size = response.findtext(".//{http://owncloud.org/ns}size") or response.findtext(".//{DAV:}getcontentlength")
+        modified = response.findtext(".//{DAV:}getlastmodified")
+        return DavEntry(
+            path,
+            isdir,
+            response.findtext(".//{http://owncloud.org/ns}fileid"),
+            int(size) if size else None,
+            response.findtext(".//{DAV:}getetag"),
+            parsedate_to_datetime(modified).timestamp() if modified else None,
+        )
+
+    def propfind(self, path, depth):
+        """Yield a DavEntry for path and its members down to depth, including path itself"""
+        self.requests += 1
+        with self.session.request(
+            "PROPFIND",
+            self.baseurl + quote(path),
+            data=g_walkRequest,
+            headers={"Depth": str(depth)},
+            stream=True,
+            timeout=self.timeout,
+        ) as r:
+            if r.status_code != 207:
+                raise Exception(f"PROPFIND of {path} with depth {depth} failed with status {r.status_code}")
+            r.raw.decode_content = True
+            root = None
+            for event, element in ET.iterparse(r.raw, events=("start", "end")):
+                if root is None:
+                    root = element
+                elif event == "end" and element.tag == "{DAV:}response":
+                    yield self._entry(element)
+                    # Drop the finished response, so memory does not grow with the size of the folder
+                    root.clear()
+
+    def list(self, path=""):
+        """Return the members of the folder path without the folder itself, like webdav3 Client.list"""
+        folder = path.strip("/")
+        return [entry for entry in self.propfind(path, 1) if entry.path.strip("/") != folder]
+
+    def walk(self, path=""):
+        """Yield a DavEntry for every resource below path, folders before their members"""
+        folder = path.strip("/")
+        if self.depth == "infinity":
+            for entry in self.propfind(path, "infinity"):
+                if entry.path.strip("/") != folder:
+                    yield entry
+            return
+        executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        try:
+            pending = {executor.submit(self.list, path)}
+            while len(pending) > 0:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    for entry in future.result():
+                        yield entry
+                        if entry.isdir:
+                            pending.add(executor.submit(self.list, entry.path))
+        finally:
+            # A consumer that stops early does not wait for the folders that are still queued
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+class DirectoryCache(object):
+    """Create folders below baseurl, the webdav url of a user ending with a slash, and remember which folders exist
+    A folder is known after a MKCOL answered 201 Created or 405 Method Not Allowed, which Nextcloud sends for an
+    existing folder, or after it was seen in a PROPFIND through add. ensure only sends a MKCOL for folders that are
+    not known yet, so uploading many files into the same deep path costs one MKCOL per new folder.
+    Threads that need the same folder at the same time wait for the one MKCOL that creates it.
+    """
+
+    def __init__(self, session, baseurl, timeout=g_walkTimeout):
+        self.session = session
+        self.baseurl = baseurl
+        self.timeout = timeout
+        self.known = {""}
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.created = 0
+
+    def add(self, entries):
+        """Remember the folders among entries, a list of DavEntry as returned by TreeWalker"""
+        with self.lock:
+            for entry in entries:
+                if entry.isdir:
+                    self.known.add(entry.path.strip("/"))
+
+    def forget(self, path):
+        """Forget path and every folder below it, after it was deleted or moved away"""
+        folder = path.strip("/")
+        with self.lock:
+            self.known = {known for known in self.known if known != folder and not known.startswith(f"{folder}/")}
+            self.known.add("")
+
+    def _mkcol(self, folder):
+        while True:
+            with self.lock:
+                if folder in self.known:
+                    return
+                event = self.pending.get(folder)
+                if event is None:
+                    event = self.pending[folder] = threading.Event()
+                    break
+            # Another thread is creating the folder, check again once it is done
+            event.wait()
+        try:
+            with self.lock:
+                self.requests += 1
+            r = self.session.request("MKCOL", self.baseurl + quote(folder), timeout=self.timeout)
+            if r.status_code not in [201, 405]:
+                raise Exception(f"MKCOL of {folder} failed with status {r.status_code}")
+            with self.lock:
+                if r.status_code == 201:
+                    self.created += 1
+                self.known.add(folder)
+        finally:
+            with self.lock:
+                del self.pending[folder]
+            event.set()
+
+    def ensure(self, path):
+        """Create the folder path and all its missing parents, folders that are known already cost no request"""
+        folder = ""
+        for name in path.strip("/").split("/"):
+            if name == "":
+                continue
+            folder = f"{folder}/{name}" if folder else name
+            self._mkcol(folder)
+
+    def report(self):
+        return f"{len(self.known) - 1} folders known - {self.created} created with {self.requests} MKCOL requests"
+
+
+def get_directory_cache(session, baseurl):
+    """Return the DirectoryCache of baseurl, the webdav url of a user, created on first use with session
+    Every test of a node and user shares the cache, so callers forget folders they delete
+    """
+    baseurl = baseurl.rstrip("/") + "/"
+    with g_directoryCachesLock:
+        cache = g_directoryCaches.get(baseurl)
+        if cache is None:
+            cache = DirectoryCache(session, baseurl)
+            g_directoryCaches[baseurl] = cache
+        return cache
+
+
+class TrashbinCleaner(object):
+    """Empty the trashbin of a user, trashurl is the trashbin url of the user ending with a slash
+    e.g. https://<host>/remote.php/dav/trashbin/<user>/
+    In bulk mode the whole bin is removed with a single DELETE on trash, so the server deletes everything in one go.
+    If the server refuses that, or in items mode, every item is deleted on its own with a DeleteEngine.
+    """
+
+    def __init__(self, session, trashurl, mode=None, concurrency=None):
+        self.session = session
+        self.trashurl = trashurl
+        self.mode = mode if mode is not None else g_trashbinMode
+        self.method = self.mode
+        self.engine = DeleteEngine(session, trashurl, concurrency)
+        self.items = []
+        self.removed = 0
+        self.elapsed = 0.0
+
+    def empty(self):
+        """Empty the trashbin, returns True if every item is gone"""
+        startTime = time.perf_counter()
+        self.items = [entry.path for entry in TreeWalker(self.session, self.trashurl).list("trash/")]
+        self.method = self.mode
+        self.removed = 0
+        if self.mode == "bulk" and len(self.items) > 0:
+            try:
+                r = self.session.delete(self.trashurl + "trash", timeout=g_trashbinTimeout)
+                if r.status_code in [200, 204]:
+                    self.removed = len(self.items)
+                else:
+                    logger.warning(f"Emptying the trashbin failed with status {r.status_code}, deleting item by item")
+                    self.method = "items"
+            except requests.exceptions.RequestException as error:
+                logger.warning(f"Emptying the trashbin failed: {error}, deleting item by item")
+                self.method = "items"
+        if self.method == "items" and len(self.items) > 0:
+            self.engine.delete(self.items)
+            self.removed = len(self.items) - len(self.engine.failed)
+        self.elapsed = time.perf_counter() - startTime
+        return self.removed == len(self.items)
+
+    def report(self):
+        """One line summary of the last run"""
+        rate = self.removed / self.elapsed if self.elapsed > 0 else 0.0
+        text = (
+            f"Removed {self.removed} of {len(self.items)} trashbin items with {self.method} delete "
+            f"in {self.elapsed:.1f}s - {rate:.2f} items/s"
+        )
+        if self.method == "items":
+            text += f" - {self.engine.histogram.summary()}"
+        return text
+
+
+class BenchmarkResult(object):
+    """Latency histogram and throughput of one operation of a WebdavBenchmark run"""
+
+    def __init__(self, operation, size, concurrency):
+        self.operation = operation
+        self.size = size
+        self.concurrency = concurrency
+        self.histogram = sunetperformance.LatencyHistogram()
+        self.count = 0
+        self.failed = 0
+        self.bytes = 0
+        self.elapsed = 0.0
+
+    @property
+    def operationsPerSecond(self):
+        return self.count / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def megabytesPerSecond(self):
+        return self.bytes / 1024 / 1024 / self.elapsed if self.elapsed > 0 else 0.0
+
+
+class WebdavBenchmark(object):
+    """Measure WebDAV operations on a set of files of one size with a fixed number of concurrent requests
+    Every run uploads count files of size bytes of generated content into a new folder below baseurl, runs the
+    operations in the order of g_benchmarkOperations on them and removes the folder again.
+    PUT and DELETE always run, since the other operations need the files, but only the requested ones are returned.
+    """
+
+    def __init__(self, session, baseurl, folder, concurrency, timeout=g_chunkTimeout):
+        self.session = session
+        self.baseurl = baseurl
+        self.folder = folder.strip("/")
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.headers = {}
+
+    def _url(self, path):
+        return self.baseurl + quote(path)
+
+    def _measure(self, operation, size, paths, request):
+        result = BenchmarkResult(operation, size, self.concurrency)
+        if len(paths) == 0:
+            # e.g. files: 0 in benchmarks.yaml, there is nothing to measure
+            return result
+
+        def timed(path):
+            startTime = time.perf_counter()
+            try:
+                passed, transferred = request(path)
+            except requests.exceptions.RequestException as error:
+                logger.error(f"{operation} {path} failed: {error}")
+                passed, transferred = False, 0
+            result.histogram.record(time.perf_counter() - startTime)
+            return passed, transferred
+
+        startTime = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(paths))) as executor:
+            outcomes = list(executor.map(timed, paths))
+        result.elapsed = time.perf_counter() - startTime
+        result.count = len(outcomes)
+        result.failed = sum(1 for passed, transferred in outcomes if not passed)
+        result.bytes = sum(transferred for passed, transferred in outcomes)
+        return result
+
+    def prepare(self, size, paths):
+        """Compute the OC-Checksum headers of the files before their PUT is timed"""
+        for path in paths:
+            self.headers[path] = checksum_headers(RandomUploadSource(size, seed=path))
+
+    def put(self, path, size):
+        r = self.session.put(
+            self._url(path), data=RandomUploadSource(size, seed=path), headers=self.headers.get(path), timeout=self.timeout
+        )
+        return r.status_code in [201, 204], size
+
+    def get(self, path):
+        with self.session.get(self._url(path), stream=True, timeout=self.timeout) as r:
+            transferred = sum(len(data) for data in r.iter_content(g_sourceBlockSize))
+            return r.status_code == 200, transferred
+
+    def propfind(self, path):
+        r = self.session.request(
+            "PROPFIND", self._url(path), data=g_walkRequest, headers={"Depth": "0"}, timeout=self.timeout
+        )
+        return r.status_code == 207, 0
+
+    def copy(self, path, destination):
+        r = self.session.request(
+            "COPY",
+            self._url(path),
+            headers={"Destination": self._url(destination), "Overwrite": "T"},
+            timeout=self.timeout,
+        )
+        return r.status_code in [201, 204], 0
+
+    def move(self, path, destination):
+        r = self.session.request(
+            "MOVE",
+            self._url(path),
+            headers={"Destination": self._url(destination), "Overwrite": "T"},
+            timeout=self.timeout,
+        )
+        return r.status_code in [201, 204], 0
+
+    def delete(self, path):
+        r = self.session.delete(self._url(path), timeout=self.timeout)
+        return r.status_code == 204, 0
+
+    def run(self, size, count, operations=None):
+        """Run the operations on count files of size bytes, returns a BenchmarkResult per requested operation"""
+        if operations is None:
+            operations = g_benchmarkOperations
+        folder = f"{self.folder}/{size}-{self.concurrency}-{uuid.uuid4().hex[:8]}"
+        paths = [f"{folder}/{index}.bin" for index in range(count)]
+        self.session.request("MKCOL", self._url(self.folder), timeout=self.timeout)
+        r = self.session.request("MKCOL", self._url(folder), timeout=self.timeout)
+        if r.status_code != 201:
+            raise Exception(f"Unable to create benchmark folder {folder}: {r.status_code}")
+
+        results = []
+        try:
+            self.prepare(size, paths)
+            results.append(self._measure("PUT", size, paths, lambda path: self.put(path, size)))
+            if "GET" in operations:
+                results.append(self._measure("GET", size, paths, self.get))
+            if "PROPFIND" in operations:
+                results.append(self._measure("PROPFIND", size, paths, self.propfind))
+            # MOVE works on the copies, so the originals are left for DELETE
+            if "COPY" in operations or "MOVE" in operations:
+                results.append(self._measure("COPY", size, paths, lambda path: self.copy(path, path + ".copy")))
+            if "MOVE" in operations:
+                results.append(
+                    self._measure("MOVE", size, paths, lambda path: self.move(path + ".copy", path + ".moved"))
+                )
+            results.append(self._measure("DELETE", size, paths, self.delete))
+        finally:
+            self.session.delete(self._url(folder), timeout=self.timeout)
+            self.headers.clear()
+        return [result for result in results if result.operation in operations]
+
+
+class DownloadBenchmark(WebdavBenchmark):
+    """Measure downloads from a folder below baseurl, nothing that is downloaded is written to disk
+    stream: a single GET of one large file, read in blocks and discarded
+    range: the same file fetched as segments with parallel HTTP Range requests
+    storm: GET of many small files with concurrency requests at a time
+    """
+
+    def get_range(self, path, start, end):
+        headers = {"Range": f"bytes={start}-{end}"}
+        with self.session.get(self._url(path), headers=headers, stream=True, timeout=self.timeout) as r:
+            transferred = sum(len(data) for data in r.iter_content(g_sourceBlockSize))
+            return r.status_code == 206 and transferred == end - start + 1, transferred
+
+    def run(self, size, segments, smallSize, smallCount):
+        """Upload one file of size bytes and smallCount files of smallSize bytes, then download them
+        Returns a BenchmarkResult for stream, range and storm
+        """
+        folder = f"{self.folder}/download-{uuid.uuid4().hex[:8]}"
+        largePath = f"{folder}/large.bin"
+        smallPaths = [f"{folder}/{index}.bin" for index in range(smallCount)]
+        self.session.request("MKCOL", self._url(self.folder), timeout=self.timeout)
+        r = self.session.request("MKCOL", self._url(folder), timeout=self.timeout)
+        if r.status_code != 201:
+            raise Exception(f"Unable to create benchmark folder {folder}: {r.status_code}")
+
+        results = []
+        try:
+            self.prepare(size, [largePath])
+            self.prepare(smallSize, smallPaths)
+            upload = self._measure("PUT", size, [largePath], lambda path: self.put(path, size))
+            upload.failed += self._measure("PUT", smallSize, smallPaths, lambda path: self.put(path, smallSize)).failed
+            if upload.failed > 0:
+                raise Exception(f"Unable to upload {upload.failed} files for the download benchmark")
+
+            results.append(self._measure("stream", size, [largePath], self.get))
+            segmentSize = -(-size // segments)
+            ranges = [(start, min(start + segmentSize, size) - 1) for start in range(0, size, segmentSize)]
+            results.append(self._measure("range", size, ranges, lambda span: self.get_range(largePath, *span)))
+            results.append(self._measure("storm", smallSize, smallPaths, self.get))
+        finally:
+            self.session.delete(self._url(folder), timeout=self.timeout)
+            self.headers.clear()
+        return results
+
+
+class SyncResult(object):
+    """Outcome of one nextcloudcmd run"""
+
+    def __init__(self, returncode, elapsed, output, transferred=0):
+        self.returncode = returncode
+        self.elapsed = elapsed
+        self.output = output
+        self.transferred = transferred
+        self.phases = {}
+        for line in output:
+            match = g_syncPhaseLine.search(line)
+            if match is not None:
+                self.phases[match.group(1).strip()] = int(match.group(2))
+        self.errors = [line for line in output if g_syncErrorLine.search(line)]
+
+    @property
+    def passed(self):
+        return self.returncode == 0
+
+    @property
+    def megabytesPerSecond(self):
+        return self.transferred / 1024 / 1024 / self.elapsed if self.elapsed > 0 else 0.0
+
+    def report(self):
+        phases = ", ".join(f"{name} {ms}ms" for name, ms in self.phases.items())
+        return (
+            f"exit code {self.returncode} after {self.elapsed:.1f}s - {self.transferred / 1024 / 1024:.1f} MB at "
+            f"{self.megabytesPerSecond:.1f} MB/s - {len(self.errors)} errors - {phases or 'no phases reported'}"
+        )
+
+
+class SyncClient(object):
+    """Sync localDir with remotePath of user on nodeurl with nextcloudcmd
+    nextcloudcmd runs as a subprocess without a shell, its output is captured line by line, phase lines are
+    logged while the sync runs and the wall clock time, exit code and phase timings end up in a SyncResult.
+    The sync journal in localDir is kept between runs, so later syncs are incremental.
+    """
+
+    def __init__(self, localDir, nodeurl, user, password, remotePath, timeout=None):
+        self.localDir = localDir
+        self.nodeurl = nodeurl
+        self.user = user
+        self.password = password
+        self.remotePath = remotePath
+        self.timeout = timeout if timeout is not None else g_syncTimeout
+
+    def command(self):
+        return [
+            g_nextcloudcmd,
+            "--non-interactive",
+            "--path",
+            self.remotePath,
+            "-u",
+            self.user,
+            "-p",
+            self.password,
+            self.localDir,
+            self.nodeurl,
+        ]
+
+    def sync(self, transferred=0):
+        """Run one sync, transferred is the number of bytes the sync is expected to move, for the throughput"""
+        logger.info(f"Syncing {self.localDir} with {self.remotePath} on {self.nodeurl}")
+        output = []
+        startTime = time.perf_counter()
+        process = subprocess.Popen(
+            self.command(), stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, errors="replace"
+        )
+        timer = threading.Timer(self.timeout, process.kill)
+        timer.start()
+        try:
+            for line in process.stdout:
+                line = line.rstrip()
+                output.append(line)
+                if g_syncPhaseLine.search(line) or g_syncErrorLine.search(line):
+                    logger.info(f"nextcloudcmd: {line}")
+            returncode = process.wait()
+        finally:
+            timer.cancel()
+        elapsed = time.perf_counter() - startTime
+        if elapsed >= self.timeout:
+            logger.error(f"nextcloudcmd killed after {self.timeout}s")
+        result = SyncResult(returncode, elapsed, output, transferred)
+        if not result.passed:
+            logger.error(f"nextcloudcmd failed with exit code {returncode}: {output[-10:]}")
+        return result
+
+
+def trace_path(path):
+    """Return the path of a WebDAV request as area/path without the user, or None for other requests"""
+    if path is None:
+        return None
+    match = g_tracePath.match(path)
+    if match is None:
+        return None
+    return f"{match.group(1)}/{unquote(match.group(2))}"
+
+
+def open_trace(path, mode):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t")
+    return open(path, mode)
+
+
+def write_trace(path, records):
+    """Write the WebDAV requests among records, request timings as recorded by sunetnextcloud, to a trace file
+    The trace has a header line followed by one compact line per request with
+    [offset, method, path, sent, depth, destination, status, duration], the offset in seconds since the first request.
+    Files ending with .gz are compressed. Returns the number of traced requests.
+    """
+    entries = []
+    for record in sorted(records, key=lambda record: record["time"]):
+        tracePath = trace_path(record["path"])
+        if tracePath is None:
+            continue
+        entries.append(
+            [
+                record["time"],
+                record["method"],
+                tracePath,
+                record.get("sent") or 0,
+                record.get("depth"),
+                trace_path(record.get("destination")),
+                record["status"],
+                round(record["total"], 4),
+            ]
+        )
+    startTime = entries[0][0] if len(entries) > 0 else 0
+    with open_trace(path, "w") as f:
+        f.write(json.dumps({"version": g_traceVersion, "requests": len(entries), "start": startTime}) + "\n")
+        for entry in entries:
+            entry[0] = round(entry[0] - startTime, 3)
+            f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+    return len(entries)
+
+
+def read_trace(path):
+    """Return the list of trace entries written by write_trace"""
+    with open_trace(path, "r") as f:
+        header = json.loads(f.readline())
+        if header.get("version") != g_traceVersion:
+            raise Exception(f"Unsupported trace version {header.get('version')} in {path}")
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class TraceReplayer(object):
+    """Replay a WebDAV trace as user against nodeurl
+    Requests are sent at their recorded offset divided by timeScale, so 10 replays ten times as fast,
+    with at most concurrency requests in flight. Latency is measured from the scheduled time, so a target
+    that cannot keep up shows queueing instead of silently slowing the replay down.
+    PUT sends generated content of the recorded size, downloads are discarded.
+    """
+
+    def __init__(self, session, nodeurl, user, timeScale=1.0, concurrency=None, timeout=g_chunkTimeout):
+        self.session = session
+        self.nodeurl = nodeurl
+        self.user = user
+        self.timeScale = timeScale
+        self.concurrency = concurrency if concurrency is not None else g_replayConcurrency
+        self.timeout = timeout
+        self.histograms = {}
+        self.statusMismatches = 0
+        self.errors = 0
+        self.skipped = 0
+        self.elapsed = 0.0
+        self.lock = threading.Lock()
+
+    def url(self, tracePath):
+        area, separator, path = tracePath.partition("/")
+        return f"{self.nodeurl}/remote.php/dav/{area}/{quote(self.user)}/{quote(path)}"
+
+    def send(self, entry):
+        offset, method, tracePath, sent, depth, destination, status, duration = entry
+        headers = {}
+        data = None
+        if depth is not None:
+            headers["Depth"] = depth
+        if destination is not None:
+            headers["Destination"] = self.url(destination)
+        if method == "PUT":
+            data = RandomUploadSource(sent, seed=tracePath)
+        elif method == "PROPFIND":
+            data = g_walkRequest
+        with self.session.request(
+            method, self.url(tracePath), headers=headers, data=data, stream=True, timeout=self.timeout
+        ) as r:
+            for block in r.iter_content(g_sourceBlockSize):
+                pass
+            return r.status_code
+
+    def replay_one(self, entry, scheduled):
+        method = entry[1]
+        try:
+            status = self.send(entry)
+        except requests.exceptions.RequestException as error:
+            logger.error(f"{method} {entry[2]} failed: {error}")
+            status = None
+        latency = time.perf_counter() - scheduled
+        with self.lock:
+            if method not in self.histograms:
+                self.histograms[method] = sunetperformance.LatencyHistogram()
+            if status is None:
+                self.errors += 1
+            elif status != entry[6]:
+                self.statusMismatches += 1
+        self.histograms[method].record(latency)
+
+    def replay(self, entries):
+        """Replay the entries of a trace, returns the histograms of the replayed requests per method"""
+        self.histograms = {}
+        self.statusMismatches = 0
+        self.errors = 0
+        self.skipped = 0
+        startTime = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            for entry in entries:
+                if entry[1] not in g_replayMethods:
+                    self.skipped += 1
+                    continue
+                scheduled = startTime + entry[0] / self.timeScale
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                executor.submit(self.replay_one, entry, scheduled)
+        self.elapsed = time.perf_counter() - startTime
+        return self.histograms
+
+    def report(self):
+        """Summary of the last replay, one line per method"""
+        count = sum(histogram.count for histogram in self.histograms.values())
+        lines = [
+            f"Replayed {count} requests in {self.elapsed:.1f}s at {self.timeScale:g}x with {self.concurrency} workers - "
+            f"{self.errors} errors - {self.statusMismatches} status mismatches - {self.skipped} skipped"
+        ]
+        for method, histogram in sorted(self.histograms.items()):
+            lines.append(f"   {method : <9}{histogram.summary()}")
+        return "\n".join(lines)
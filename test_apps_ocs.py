@@ -1,11 +1,8 @@
 import json
 import logging
 import os
-import threading
-import time
 import unittest
 
-import requests
 import xmlrunner
 import HtmlTestRunner
 import yaml
@@ -13,9 +10,7 @@ import yaml
 import sunetnextcloud
 
 expectedResultsFile = "expected.yaml"
-g_testThreadsRunning = 0
-testThreadRunning = False
-g_testPassed = {}
+g_ocsCredentials = ["ocsuser", "ocsuserapppassword"]
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(
@@ -31,21 +26,18 @@ with open(expectedResultsFile, "r") as stream:
     expectedResults = yaml.safe_load(stream)
 
 
-class ConfiguredAppsInstalled(threading.Thread):
+class ConfiguredAppsInstalled:
     def __init__(self, name):
-        threading.Thread.__init__(self)
         self.name = name
 
     def run(self):
-        global testThreadRunning, logger, g_testPassed, g_testThreadsRunning
-        g_testThreadsRunning += 1
-        logger.info(f"ConfiguredAppsInstalled thread started for node {self.name}")
+        global logger
+        logger.info(f"ConfiguredAppsInstalled check started for node {self.name}")
         drv = sunetnextcloud.TestTarget()
         fullnode = self.name
-        g_testPassed[fullnode] = False
 
         try:
-            session = requests.Session()
+            session = drv.get_session(fullnode)
             nodeuser = drv.get_ocsuser(fullnode)
             nodepwd = drv.get_ocsuserapppassword(fullnode)
             url = drv.get_all_apps_url(fullnode)
@@ -58,59 +50,52 @@ class ConfiguredAppsInstalled(threading.Thread):
             nodepwd = drv.get_ocsuserpassword(fullnode)
         except Exception:
             logger.error(f"Credentials error for {self.name}")
-            g_testThreadsRunning -= 1
-            return
+            return False
 
         try:
             r = session.get(url, headers=ocsheaders)
         except Exception:
             logger.error(f"Error getting {url}")
-            g_testThreadsRunning -= 1
-            return
+            return False
         nodeApps = []
         try:
-            j = json.loads(r.text)
-            nodeApps = j["ocs"]["data"]["apps"]
-            # print(json.dumps(j, indent=4, sort_keys=True))
+            nodeApps = sunetnextcloud.decode_ocs(r).data["apps"]
         except Exception:
             logger.warning(f"No JSON reply received on node {fullnode}")
             # self.logger.warning(r.text)
-            g_testThreadsRunning -= 1
-            return
+            return False
 
         logger.info(
             f"Check if all apps configured in {expectedResultsFile} are installed on {fullnode}"
         )
 
+        foundApps = 0
         for expectedApp in expectedResults["apps"]:
             logger.info(f"Check if {expectedApp} is installed on {fullnode}")
             print()
             try:
                 pos = nodeApps.index(expectedApp)
                 logger.info(f"Found app at {pos}")
-                g_testPassed[fullnode] = True
+                foundApps += 1
             except Exception:
                 logger.warning(f"App {expectedApp} NOT found on {fullnode}")
 
-        logger.info(f"ConfiguredAppsInstalled thread done for node {self.name}")
-        g_testThreadsRunning -= 1
+        logger.info(f"ConfiguredAppsInstalled check done for node {self.name}")
+        return foundApps > 0
 
 
-class InstalledAppsCompatibility(threading.Thread):
+class InstalledAppsCompatibility:
     def __init__(self, name):
-        threading.Thread.__init__(self)
         self.name = name
 
     def run(self):
-        global testThreadRunning, logger, g_testPassed, g_testThreadsRunning
-        g_testThreadsRunning += 1
-        logger.info(f"InstalledAppsCompatibility thread started for node {self.name}")
+        global logger
+        logger.info(f"InstalledAppsCompatibility check started for node {self.name}")
         drv = sunetnextcloud.TestTarget()
         fullnode = self.name
-        g_testPassed[fullnode] = True
 
         try:
-            session = requests.Session()
+            session = drv.get_session(fullnode)
             nodeuser = drv.get_ocsuser(fullnode)
             nodepwd = drv.get_ocsuserapppassword(fullnode)
             url = drv.get_all_apps_url(fullnode)
@@ -120,35 +105,29 @@ class InstalledAppsCompatibility(threading.Thread):
             url = url.replace("$PASSWORD$", nodepwd)
         except Exception:
             logger.error(f"Credentials error for {self.name}")
-            g_testThreadsRunning -= 1
-            return
+            return False
 
         try:
             r = session.get(url, headers=ocsheaders)
         except Exception:
             logger.error(f"Error getting {url}")
-            g_testThreadsRunning -= 1
-            return
+            return False
         nodeApps = []
         try:
-            j = json.loads(r.text)
-            # print(json.dumps(j, indent=4, sort_keys=True))
-            nodeApps = j["ocs"]["data"]["apps"]
+            nodeApps = sunetnextcloud.decode_ocs(r).data["apps"]
             logger.info(
-                f"Apps found on node {fullnode}: {json.dumps(j, indent=4, sort_keys=True)}"
+                f"Apps found on node {fullnode}: {json.dumps(nodeApps, indent=4, sort_keys=True)}"
             )
         except Exception:
             logger.warning(f"No JSON reply received on {fullnode}")
             # self.logger.warning(r.text)
-            g_testPassed[fullnode] = False
-            g_testThreadsRunning -= 1
-            return
+            return False
 
         # We check against this manual exception list until the deployment is clean
         excludeList = expectedResults[drv.target]["ocsapps"]["excluded_apps"]
         expectedVersion = expectedResults[drv.target]["status"]["major_version"]
+        allPassed = True
         for nodeApp in nodeApps:
-            allPassed = True
             try:
                 # appInfo = expectedResults['apps'][nodeApp]
                 clean_url = drv.get_app_url(fullnode, nodeApp)
@@ -160,14 +139,10 @@ class InstalledAppsCompatibility(threading.Thread):
                     r = session.get(secret_url, headers=ocsheaders)
                 except Exception:
                     logger.error(f"Error getting {clean_url}")
-                    g_testThreadsRunning -= 1
-                    g_testPassed[fullnode] = False
-                    return
+                    return False
 
                 try:
-                    j = json.loads(r.text)
-                    # print(json.dumps(j, indent=4, sort_keys=True))
-                    maxVersion = j["ocs"]["data"]["dependencies"]["nextcloud"][
+                    maxVersion = sunetnextcloud.decode_ocs(r).data["dependencies"]["nextcloud"][
                         "@attributes"
                     ]["max-version"]
                     logger.info(f"App {nodeApp} has max version {maxVersion}")
@@ -180,43 +155,36 @@ class InstalledAppsCompatibility(threading.Thread):
                             logger.error(
                                 f"{fullnode} - App {nodeApp} is not supported by Nextcloud {expectedVersion} (max {maxVersion})"
                             )
-                            g_testPassed[fullnode] = False
                             allPassed = False
 
                 except Exception as error:
                     logger.warning(f"No JSON reply received on {fullnode}: {error}")
                     # self.logger.warning(r.text)
-                    g_testPassed[fullnode] = False
-                    g_testThreadsRunning -= 1
-                    return
+                    return False
             except Exception:
                 logger.warning(f"{nodeApp} NOT found on {fullnode}")
 
-        if allPassed == False:
+        if not allPassed:
             logger.error(f"Not all apps compatible with {fullnode}")
-            g_testPassed[fullnode] = False
 
-        logger.info(f"InstalledAppsCompatibility thread done for node {self.name}")
-        g_testThreadsRunning -= 1
+        logger.info(f"InstalledAppsCompatibility check done for node {self.name}")
+        return allPassed
 
 
-class InstalledAppsConfigured(threading.Thread):
+class InstalledAppsConfigured:
     def __init__(self, name, app="all", checkEnabled=False):
-        threading.Thread.__init__(self)
         self.name = name
         self.app = app
         self.checkEnabled = checkEnabled
 
     def run(self):
-        global testThreadRunning, logger, g_testPassed, g_testThreadsRunning
-        g_testThreadsRunning += 1
-        logger.info(f"InstalledAppsConfigured thread started for node {self.name}")
+        global logger
+        logger.info(f"InstalledAppsConfigured check started for node {self.name}")
         drv = sunetnextcloud.TestTarget()
         fullnode = self.name
-        g_testPassed[fullnode] = False
 
         try:
-            session = requests.Session()
+            session = drv.get_session(fullnode)
             nodeuser = drv.get_ocsuser(fullnode)
             nodepwd = drv.get_ocsuserapppassword(fullnode)
             url = drv.get_all_apps_url(fullnode)
@@ -226,71 +194,53 @@ class InstalledAppsConfigured(threading.Thread):
             url = url.replace("$PASSWORD$", nodepwd)
         except Exception:
             logger.error(f"Credentials error for {self.name}")
-            g_testThreadsRunning -= 1
-            return
+            return False
 
         try:
             r = session.get(url, headers=ocsheaders)
         except Exception:
             logger.error(f"Error getting {url}")
-            g_testThreadsRunning -= 1
-            return
+            return False
         nodeApps = []
         try:
-            j = json.loads(r.text)
-            # print(json.dumps(j, indent=4, sort_keys=True))
-            nodeApps = j["ocs"]["data"]["apps"]
+            nodeApps = sunetnextcloud.decode_ocs(r).data["apps"]
             logger.info(
-                f"Apps found on node {fullnode}: {json.dumps(j, indent=4, sort_keys=True)}"
+                f"Apps found on node {fullnode}: {json.dumps(nodeApps, indent=4, sort_keys=True)}"
             )
         except Exception:
             logger.warning(f"No JSON reply received on {fullnode}")
             # self.logger.warning(r.text)
-            g_testThreadsRunning -= 1
-            return
+            return False
 
         if self.app == "all":
             logger.info(
                 f"Check if all installed apps on {fullnode} are found in {expectedResultsFile}"
             )
-            # TODO: Compare application information with expected result
-            for nodeApp in nodeApps:
-                try:
-                    # appInfo = expectedResults['apps'][nodeApp]
-                    g_testPassed[fullnode] = True
-                except Exception:
-                    logger.warning(f"{nodeApp} NOT found on {fullnode}")
-
+            # TODO: Compare application information with expected result, until then any installed app passes
+            # appInfo = expectedResults['apps'][nodeApp]
+            installed = len(nodeApps) > 0
         else:  # Check if specific app is installed/active
-            try:
-                installed = self.app in nodeApps
-                logger.info(f"App {self.app} is installed: {installed} on {fullnode}")
-                g_testPassed[fullnode] = self.app in nodeApps
-            except Exception:
+            installed = self.app in nodeApps
+            logger.info(f"App {self.app} is installed: {installed} on {fullnode}")
+            if not installed:
                 logger.error(f"{self.app} NOT found on {fullnode}")
                 logger.info(f"Apps found are: {nodeApps}")
-                g_testThreadsRunning -= 1
-                return
 
-        logger.info(f"InstalledAppsConfigured thread done for node {self.name}")
-        g_testThreadsRunning -= 1
+        logger.info(f"InstalledAppsConfigured check done for node {self.name}")
+        return installed
 
 
-class NumberOfAppsOnNodes(threading.Thread):
+class NumberOfAppsOnNodes:
     def __init__(self, name):
-        threading.Thread.__init__(self)
         self.name = name
 
     def run(self):
-        global testThreadRunning, logger, g_testPassed, g_testThreadsRunning
-        g_testThreadsRunning += 1
-        logger.info(f"NumberOfAppsOnNode thread started for node {self.name}")
+        global logger
+        logger.info(f"NumberOfAppsOnNode check started for node {self.name}")
         drv = sunetnextcloud.TestTarget()
         fullnode = self.name
-        g_testPassed[fullnode] = False
 
         try:
-            session = requests.Session()
             nodeuser = drv.get_ocsuser(fullnode)
             nodepwd = drv.get_ocsuserapppassword(fullnode)
             url = drv.get_all_apps_url(fullnode)
@@ -303,31 +253,24 @@ class NumberOfAppsOnNodes(threading.Thread):
             nodepwd = drv.get_ocsuserpassword(fullnode)
         except Exception:
             logger.error(f"Credentials error for {self.name}")
-            g_testThreadsRunning -= 1
-            return
+            return False
 
         for fe in range(1, 4):
-            nodebaseurl = drv.get_node_base_url(fullnode)
-            serverid = f"node{fe}.{nodebaseurl}"
-            session.cookies.set("SERVERID", serverid)
+            session = drv.get_session(fullnode, fe)
 
             try:
                 r = session.get(url, headers=ocsheaders)
             except Exception:
                 logger.error(f"Error getting {url}")
-                g_testThreadsRunning -= 1
-                return
+                return False
             nodeApps = []
             try:
-                j = json.loads(r.text)
-                # print(json.dumps(j, indent=4, sort_keys=True))
-                nodeApps = j["ocs"]["data"]["apps"]
+                nodeApps = sunetnextcloud.decode_ocs(r).data["apps"]
                 logger.info(f"Number of apps on {fullnode}: {len(nodeApps)}")
             except Exception:
                 logger.warning(f"No JSON reply received on {fullnode}")
                 logger.warning(r.text)
-                g_testThreadsRunning -= 1
-                return
+                return False
 
             try:
                 numExpectedApps = expectedResults[drv.target]["ocsapps"][fullnode]
@@ -343,15 +286,13 @@ class NumberOfAppsOnNodes(threading.Thread):
                     f"Warn: Number of apps {len(nodeApps)} != {numExpectedApps} for {self.name} on node {fe}"
                 )
                 logger.warning(f"Apps found on node: {nodeApps}")
-                g_testPassed[f"node{fe}.{fullnode}"] = True
             else:
                 logger.info(
                     f"Pass: Number of apps {len(nodeApps)} == {numExpectedApps} for {self.name}"
                 )
-                g_testPassed[f"node{fe}.{fullnode}"] = True
 
         logger.info(f"Test number of apps done for node {self.name}")
-        g_testThreadsRunning -= 1
+        return True
 
 
 class TestAppsOcs(unittest.TestCase):
@@ -362,133 +303,104 @@ class TestAppsOcs(unittest.TestCase):
 
     def test_number_of_apps_on_nodes(self):
         drv = sunetnextcloud.TestTarget()
+        drv.prefetch_credentials(g_ocsCredentials + ["ocsuserpassword"])
 
-        for fullnode in drv.nodestotest:
-            with self.subTest(mynode=fullnode):
-                logger.info(f"TestID: {fullnode}")
-                numberOfAppsOnNodeThread = NumberOfAppsOnNodes(fullnode)
-                numberOfAppsOnNodeThread.start()
-
-        while g_testThreadsRunning > 0:
-            time.sleep(1)
-
-        for fullnode in drv.nodestotest:
-            with self.subTest(mynode=fullnode):
-                for fe in range(1, 4):
-                    self.assertTrue(g_testPassed[f"node{fe}.{fullnode}"])
+        results = sunetnextcloud.run_node_checks(
+            lambda fullnode: NumberOfAppsOnNodes(fullnode).run(),
+            drv.nodestotest,
+        )
+        for result in results:
+            with self.subTest(mynode=result.node):
+                self.assertTrue(result.passed, result.error)
 
     # Test if the apps installed on the node are found in the configuration file
     def test_installed_apps_configured(self):
         drv = sunetnextcloud.TestTarget()
+        drv.prefetch_credentials(g_ocsCredentials)
 
-        for fullnode in drv.nodestotest:
-            with self.subTest(mynode=fullnode):
-                logger.info(f"TestID: {fullnode}")
-                InstalledAppsConfiguredThread = InstalledAppsConfigured(fullnode)
-                InstalledAppsConfiguredThread.start()
-
-        while g_testThreadsRunning > 0:
-            time.sleep(1)
-
-        for fullnode in drv.nodestotest:
-            with self.subTest(mynode=fullnode):
-                self.assertTrue(g_testPassed[fullnode])
+        results = sunetnextcloud.run_node_checks(
+            lambda fullnode: InstalledAppsConfigured(fullnode).run(),
+            drv.nodestotest,
+        )
+        for result in results:
+            with self.subTest(mynode=result.node):
+                self.assertTrue(result.passed, result.error)
 
     # Test if all configured/expected apps are installed on the node
     def test_configured_apps_installed(self):
         drv = sunetnextcloud.TestTarget()
+        drv.prefetch_credentials(g_ocsCredentials + ["ocsuserpassword"])
 
-        for fullnode in drv.nodestotest:
-            with self.subTest(mynode=fullnode):
-                logger.info(f"TestID: {fullnode}")
-                ConfiguredAppsInstalledThread = ConfiguredAppsInstalled(fullnode)
-                ConfiguredAppsInstalledThread.start()
-
-        while g_testThreadsRunning > 0:
-            time.sleep(1)
-
-        for fullnode in drv.nodestotest:
-            with self.subTest(mynode=fullnode):
-                self.assertTrue(g_testPassed[fullnode])
+        results = sunetnextcloud.run_node_checks(
+            lambda fullnode: ConfiguredAppsInstalled(fullnode).run(),
+            drv.nodestotest,
+        )
+        for result in results:
+            with self.subTest(mynode=result.node):
+                self.assertTrue(result.passed, result.error)
 
     # Test if configured apps are compatible with the installed Nextcloud version
     def test_apps_compatibility(self):
         drv = sunetnextcloud.TestTarget()
+        drv.prefetch_credentials(g_ocsCredentials)
 
-        for fullnode in drv.nodestotest:
-            with self.subTest(mynode=fullnode):
-                logger.info(f"TestID: {fullnode}")
-                InstalledAppsConfiguredThread = InstalledAppsCompatibility(fullnode)
-                InstalledAppsConfiguredThread.start()
-
-        while g_testThreadsRunning > 0:
-            time.sleep(1)
-
-        for fullnode in drv.nodestotest:
-            with self.subTest(mynode=fullnode):
-                if {g_testPassed[fullnode]}:
-                    logger.info(f"Passed: {g_testPassed[fullnode]} for {fullnode}")
+        results = sunetnextcloud.run_node_checks(
+            lambda fullnode: InstalledAppsCompatibility(fullnode).run(),
+            drv.nodestotest,
+        )
+        for result in results:
+            with self.subTest(mynode=result.node):
+                if result.passed:
+                    logger.info(f"Passed: {result.passed} for {result.node}")
                 else:
-                    logger.error(f"Failed: {g_testPassed[fullnode]} for {fullnode}")
-                self.assertTrue(g_testPassed[fullnode])
+                    logger.error(f"Failed: {result.passed} for {result.node}")
+                self.assertTrue(result.passed, result.error)
 
     # Test if the apps installed on the node are found in the configuration file
     def test_app_announcementcenter(self):
         drv = sunetnextcloud.TestTarget()
+        drv.prefetch_credentials(g_ocsCredentials)
 
-        for fullnode in drv.nodestotest:
-            with self.subTest(mynode=fullnode):
-                logger.info(f"TestID: {fullnode}")
-                InstalledAppsConfiguredThread = InstalledAppsConfigured(
-                    fullnode, app="announcementcenter", checkEnabled=True
-                )
-                InstalledAppsConfiguredThread.start()
-
-        while g_testThreadsRunning > 0:
-            time.sleep(1)
-
-        for fullnode in drv.nodestotest:
-            with self.subTest(mynode=fullnode):
-                logger.info(f"Passed: {g_testPassed[fullnode]} for {fullnode}")
-                self.assertTrue(g_testPassed[fullnode])
+        results = sunetnextcloud.run_node_checks(
+            lambda fullnode: InstalledAppsConfigured(
+                fullnode, app="announcementcenter", checkEnabled=True
+            ).run(),
+            drv.nodestotest,
+        )
+        for result in results:
+            with self.subTest(mynode=result.node):
+                logger.info(f"Passed: {result.passed} for {result.node}")
+                self.assertTrue(result.passed, result.error)
 
     def test_app_security_guard(self):
         drv = sunetnextcloud.TestTarget()
+        drv.prefetch_credentials(g_ocsCredentials)
 
-        for fullnode in drv.nodestotest:
-            with self.subTest(mynode=fullnode):
-                logger.info(f"TestID: {fullnode}")
-                InstalledAppsConfiguredThread = InstalledAppsConfigured(
-                    fullnode, app="security_guard", checkEnabled=True
-                )
-                InstalledAppsConfiguredThread.start()
-
-        while g_testThreadsRunning > 0:
-            time.sleep(1)
-
-        for fullnode in drv.nodestotest:
-            with self.subTest(mynode=fullnode):
-                logger.info(f"Passed: {g_testPassed[fullnode]} for {fullnode}")
-                self.assertTrue(g_testPassed[fullnode])
+        results = sunetnextcloud.run_node_checks(
+            lambda fullnode: InstalledAppsConfigured(
+                fullnode, app="security_guard", checkEnabled=True
+            ).run(),
+            drv.nodestotest,
+        )
+        for result in results:
+            with self.subTest(mynode=result.node):
+                logger.info(f"Passed: {result.passed} for {result.node}")
+                self.assertTrue(result.passed, result.error)
 
     def test_app_stepupauth(self):
         drv = sunetnextcloud.TestTarget()
+        drv.prefetch_credentials(g_ocsCredentials)
 
-        for fullnode in drv.nodestotest:
-            with self.subTest(mynode=fullnode):
-                logger.info(f"TestID: {fullnode}")
-                InstalledAppsConfiguredThread = InstalledAppsConfigured(
-                    fullnode, app="stepupauth", checkEnabled=True
-                )
-                InstalledAppsConfiguredThread.start()
-
-        while g_testThreadsRunning > 0:
-            time.sleep(1)
-
-        for fullnode in drv.nodestotest:
-            with self.subTest(mynode=fullnode):
-                logger.info(f"Passed: {g_testPassed[fullnode]} for {fullnode}")
-                self.assertTrue(g_testPassed[fullnode])
+        results = sunetnextcloud.run_node_checks(
+            lambda fullnode: InstalledAppsConfigured(
+                fullnode, app="stepupauth", checkEnabled=True
+            ).run(),
+            drv.nodestotest,
+        )
+        for result in results:
+            with self.subTest(mynode=result.node):
+                logger.info(f"Passed: {result.passed} for {result.node}")
+                self.assertTrue(result.passed, result.error)
 
 
 if __name__ == "__main__":
@@ -4,13 +4,13 @@ Author: Richard Freitag <freitag@sunet.se>
 
 import unittest
 import os
-from webdav3.client import Client
 import logging
 from datetime import datetime
 import time
 import threading
 
 import sunetnextcloud
+import sunetwebdav
 
 g_testtarget = os.environ.get('NextcloudTestTarget')
 g_excludeList = ['selenium-system/', 'selenium-personal/', 'projectbucket/']
@@ -40,40 +40,32 @@ class CleanWebDAV(threading.Thread):
         nodepwd = drv.get_seleniumuserapppassword(fullnode)
         url = drv.get_webdav_url(fullnode, nodeuser)
         self.logger.info(url)
-        options = {
-        'webdav_hostname': url,
-        'webdav_login' : nodeuser,
-        'webdav_password' : nodepwd
-        }
 
         try:
-            client = Client(options)
-            client.list()
-            davElements = client.list()
+            session = sunetwebdav.get_webdav_session(drv, fullnode, nodeuser, nodepwd)
+            walker = sunetwebdav.TreeWalker(session, url)
+            davElements = [entry.path for entry in walker.list()]
             self.logger.info(f'DAV elements: {davElements}')
-            davElements.pop(0)
-            self.logger.info(f'After removing first element: {davElements}')
 
             startTime = datetime.now()
-            count = 0
+            paths = []
             for rootElem in davElements:
                 if rootElem in g_excludeList:
                     self.logger.info(f'Cleaning subfolders in : {rootElem}')
-                    subElements = client.list(rootElem)
-                    subElements.pop(0)
-                    for subElement in subElements:
-                        self.logger.info(f'Removing {fullnode} - {drv.target} - {subElement}')
-                        try:
-                            client.clean(rootElem + subElement)
-                            count += 1
-                        except Exception as error:
-                            self.logger.error(f'Could not delete sub element - {fullnode} - {rootElem}\\{subElement}: {error}')
+                    paths.extend(entry.path for entry in walker.list(rootElem))
                 else:
-                    self.logger.info(f'Removing {fullnode} - {drv.target} - {rootElem}')
-                    try:
-                        client.clean(rootElem)
-                    except Exception as error:
-                        self.logger.error(f'Could not delete {fullnode} - {drv.target} - {rootElem}: {error}')
+                    paths.append(rootElem)
+            self.logger.info(f'Removing {fullnode} - {drv.target} - {paths}')
+            deleteEngine = sunetwebdav.DeleteEngine(session, url)
+            deleteEngine.delete(paths)
+            self.logger.info(deleteEngine.report())
+            count = len(paths) - len(deleteEngine.failed)
+
+            # Everything deleted above ends up in the trashbin
+            cleaner = sunetwebdav.TrashbinCleaner(session, url.replace('/remote.php/dav/files/', '/remote.php/dav/trashbin/'))
+            cleaner.empty()
+            self.logger.info(cleaner.report())
+            count += cleaner.removed
 
             totalTime = (datetime.now() - startTime).total_seconds()
             if count == 0:
@@ -3,14 +3,13 @@ Author: Richard Freitag <freitag@sunet.se>
 """
 
 import unittest
-import requests
 from datetime import datetime
 from requests.auth import HTTPBasicAuth
 import os
 from webdav3.client import Client
 import logging
 import sunetnextcloud
-from xml.dom import minidom
+import sunetwebdav
 
 g_maxCheck = 10
 g_testFolder = 'SeleniumCollaboraTest'
@@ -22,14 +21,6 @@ g_filename=datetime.now().strftime("test_file_lock-%Y-%m-%d_%H-%M-%S.txt")
 g_localFile = "temp/" + g_filename
 ocsheaders = { "OCS-APIRequest" : "true" } 
 
-HTTP_MULTI_STATUS = 207
-PROPFIND_REQUEST = '''<?xml version="1.0" encoding="utf-8" ?>
-<d:propfind xmlns:d="DAV:">
-<d:prop xmlns:oc="http://owncloud.org/ns">
-  <oc:fileid/>
-</d:prop>
-</d:propfind>'''
-
 class TestFileLock(unittest.TestCase):
     logger = logging.getLogger(__name__)
     logging.basicConfig(format = '%(asctime)s - %(module)s.%(funcName)s - %(levelname)s: %(message)s',
@@ -57,6 +48,7 @@ class TestFileLock(unittest.TestCase):
                 }
 
                 client = Client(options)
+                client.session = drv.get_session(fullnode)
                 try:
                     result = client.upload_sync(remote_path=g_filename, local_path=g_localFile)
                     self.logger.info(f'Upload successful: {result}')
@@ -92,6 +84,7 @@ class TestFileLock(unittest.TestCase):
                 }
                 # data = { 'userid': nodeuser, 'password': nodepwd}
                 client = Client(options)
+                client.session = drv.get_session(fullnode)
                 try:
                     result = client.upload_sync(remote_path=g_filename, local_path=g_localFile)
                     self.logger.info(f'Upload successful: {result}')
@@ -101,20 +94,16 @@ class TestFileLock(unittest.TestCase):
                 nodeuser = drv.get_seleniumuser(fullnode)
                 nodepwd = drv.get_seleniumuserpassword(fullnode)
 
-                url = drv.get_webdav_url(fullnode, nodeuser) + g_filename
-                session = requests.Session()
-                session.auth = (nodeuser, nodepwd)
-                r = session.request(method='PROPFIND', url=url, data=PROPFIND_REQUEST)
-                if r.status_code == HTTP_MULTI_STATUS:
-                    dom = minidom.parseString(r.text.encode('ascii', 'xmlcharrefreplace'))
-                    response = dom.getElementsByTagName('d:response')[0]
-                    href = response.getElementsByTagName('d:href')[0].firstChild.data
-                    prop_stat = response.getElementsByTagName('d:propstat')[0]
-                    prop = prop_stat.getElementsByTagName('d:prop')[0]
-                    fileid = prop.getElementsByTagName('oc:fileid')[0].firstChild.data
-                    lockUrl = drv.get_file_lock_url(fullnode, fileid)
+                session = sunetwebdav.get_webdav_session(drv, fullnode, nodeuser, nodepwd)
+                walker = sunetwebdav.TreeWalker(session, drv.get_webdav_url(fullnode, nodeuser))
+                try:
+                    entry = list(walker.propfind(g_filename, 0))[0]
+                except Exception as error:
+                    self.logger.error(f'Unable to get the file id of {g_filename}: {error}')
+                else:
+                    lockUrl = drv.get_file_lock_url(fullnode, entry.fileid)
                     r = session.post(lockUrl, headers=ocsheaders, auth = HTTPBasicAuth(nodeuser, nodepwd))
-                    self.logger.info(f'href={href}')
+                    self.logger.info(f'path={entry.path}')
                     self.logger.info(f'Lock status code: {r.status_code}')
                     self.logger.info(f'Lock request response: {r.text}')
 
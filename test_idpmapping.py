@@ -7,7 +7,6 @@ import os
 import unittest
 
 import requests
-import yaml
 
 import sunetnextcloud
 
@@ -41,17 +40,16 @@ logging.basicConfig(
 def get_common_instances():
     global commoninstances
     logger.info(f"Get instances from common.yaml")
-    with open(globalconfigfile, "r") as stream:
-        data = yaml.safe_load(stream)
-        commoninstances = data["fullnodes"] + data["singlenodes"]
-        for entry in data["drive_metadata_files"]:
-            instance = entry[: entry.find("_")]
-            if instance not in commoninstances:
-                commoninstances.append(instance)
-
-        for entry in data["multinode_mapping"]:
-            if entry not in commoninstances:
-                commoninstances.append(entry)
+    data = sunetnextcloud.load_yaml(globalconfigfile)
+    commoninstances = data["fullnodes"] + data["singlenodes"]
+    for entry in data["drive_metadata_files"]:
+        instance = entry[: entry.find("_")]
+        if instance not in commoninstances:
+            commoninstances.append(instance)
+
+    for entry in data["multinode_mapping"]:
+        if entry not in commoninstances:
+            commoninstances.append(entry)
 
 
 def get_swamid_instances():
@@ -0,0 +1,139 @@
+"""Import time benchmark for the Sunet Drive test support module
+Author: Richard Freitag <freitag@sunet.se>
+Imports sunetnextcloud in a fresh interpreter with python -X importtime and fails if the import exceeds its time budget,
+pulls in selenium or the report runners, or has side effects like changing the working directory or configuring logging.
+The budget in milliseconds is set with NextcloudTestImportBudget, the number of runs with NextcloudTestImportRuns.
+"""
+
+import logging
+import os
+import re
+import statistics
+import subprocess
+import sys
+import unittest
+
+import sunetnextcloud
+
+g_importBudget = int(os.environ.get("NextcloudTestImportBudget", 300))
+g_importRuns = int(os.environ.get("NextcloudTestImportRuns", 5))
+g_importModule = "sunetnextcloud"
+# Modules that must only be imported when a browser test or a report runner needs them
+g_lazyModules = ["selenium", "HtmlTestRunner", "xmlrunner", "pyotp", "sunetselenium", "orjson"]
+g_importTimeLine = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)\s*$")
+
+drv = sunetnextcloud.TestTarget()
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    format="%(asctime)s - %(module)s.%(funcName)s - %(levelname)s: %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+    level=logging.INFO,
+)
+
+
+def run_python(code):
+    """Run code in a fresh interpreter from a neutral working directory and return the completed process"""
+    env = os.environ.copy()
+    env["PYTHONPATH"] = os.pathsep.join(
+        [sunetnextcloud.g_basedir] + [p for p in [env.get("PYTHONPATH")] if p]
+    )
+    return subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        cwd=os.path.dirname(sunetnextcloud.g_basedir),
+        env=env,
+    )
+
+
+def measure_import(module):
+    """Import module once, returns its cumulative import time in microseconds,
+    the self time per imported module and the set of imported top level packages
+    """
+    r = run_python(f"import {module}")
+    if r.returncode != 0:
+        raise Exception(f"Importing {module} failed: {r.stderr}")
+
+    cumulative = None
+    selfTimes = {}
+    packages = set()
+    for line in r.stderr.splitlines():
+        match = g_importTimeLine.match(line)
+        if match is None:
+            continue
+        selfTime, cumulativeTime, indent, name = match.groups()
+        selfTimes[name] = int(selfTime)
+        packages.add(name.split(".")[0])
+        # The module itself is reported last and on the outermost level
+        if name == module and len(indent) <= 1:
+            cumulative = int(cumulativeTime)
+    if cumulative is None:
+        raise Exception(f"No import time reported for {module}")
+    return cumulative, selfTimes, packages
+
+
+class TestImportTime(unittest.TestCase):
+    def test_logger(self):
+        logger.info(f"TestID: {self._testMethodName}")
+        pass
+
+    def test_import_budget(self):
+        # Byte-compile once, so the first run does not pay for writing __pycache__
+        measure_import(g_importModule)
+        timings = []
+        for run in range(g_importRuns):
+            cumulative, selfTimes, packages = measure_import(g_importModule)
+            timings.append(cumulative / 1000)
+
+        median = statistics.median(timings)
+        logger.info(
+            f"Import of {g_importModule} took {median:.1f}ms (median of {g_importRuns}, min {min(timings):.1f}ms, max {max(timings):.1f}ms), budget {g_importBudget}ms"
+        )
+        slowest = sorted(selfTimes.items(), key=lambda item: item[1], reverse=True)
+        for name, selfTime in slowest[:10]:
+            logger.info(f"   {selfTime / 1000:7.1f}ms {name}")
+        self.assertLessEqual(median, g_importBudget)
+
+    def test_lazy_modules(self):
+        cumulative, selfTimes, packages = measure_import(g_importModule)
+        for module in g_lazyModules:
+            with self.subTest(mymodule=module):
+                self.assertNotIn(module, packages)
+
+    def test_no_import_side_effects(self):
+        code = (
+            "import logging, os\n"
+            "cwd = os.getcwd()\n"
+            f"import {g_importModule}\n"
+            "assert os.getcwd() == cwd, 'working directory changed'\n"
+            "assert not logging.getLogger().handlers, 'logging configured'\n"
+        )
+        r = run_python(code)
+        if r.returncode != 0:
+            logger.error(r.stderr.splitlines()[-1])
+        self.assertEqual(r.returncode, 0)
+
+
+if __name__ == "__main__":
+    if drv.testrunner == "xml":
+        import xmlrunner
+
+        unittest.main(testRunner=xmlrunner.XMLTestRunner(output="test-reports"))
+    elif drv.testrunner == "txt":
+        unittest.main(
+            testRunner=unittest.TextTestRunner(
+                resultclass=sunetnextcloud.NumbersTestResult
+            )
+        )
+    else:
+        import HtmlTestRunner
+
+        unittest.main(
+            testRunner=HtmlTestRunner.HTMLTestRunner(
+                output="test-reports-html",
+                combine_reports=True,
+                report_name=f"nextcloud-{drv.target}-{drv.expectedResults[drv.target]['status']['version'][-1]}-{os.path.basename(__file__)}",
+                add_timestamp=False,
+            )
+        )
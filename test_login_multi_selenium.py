@@ -22,7 +22,6 @@ from selenium.webdriver.common.by import By
 from selenium.common.exceptions import TimeoutException
 import os
 import logging
-import yaml
 
 drv = sunetnextcloud.TestTarget()
 g_testtarget = os.environ.get('NextcloudTestTarget')
@@ -36,8 +35,7 @@ class TestLoginMultiSelenium(unittest.TestCase):
     logging.basicConfig(format = '%(asctime)s - %(module)s.%(funcName)s - %(levelname)s: %(message)s',
                     datefmt = '%Y-%m-%d %H:%M:%S', level = logging.INFO)
 
-    with open(g_expectedResultsFile, "r") as stream:
-        expectedResults=yaml.safe_load(stream)
+    expectedResults = sunetnextcloud.load_yaml(g_expectedResultsFile)
 
     # Some class names of icons changed from Nextcloud 27 to 28
     drv = sunetnextcloud.TestTarget(g_testtarget)
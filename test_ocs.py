@@ -5,16 +5,12 @@ Author: Richard Freitag <freitag@sunet.se>
 import json
 import logging
 import os
-import threading
 import time
 from datetime import datetime
 import unittest
 from urllib.parse import quote
 
 import HtmlTestRunner
-import requests
-from requests.adapters import HTTPAdapter
-from requests.packages.urllib3.util.retry import Retry
 
 import xmlrunner
 import random
@@ -25,8 +21,6 @@ drv = sunetnextcloud.TestTarget()
 ocsheaders = drv.ocsheaders
 expectedResults = drv.expectedResults
 
-g_testPassed = {}
-g_testThreadsRunning = 0
 g_requestTimeout = 10
 g_maxRandSleep = os.environ.get("NextcloudRandSleep")
 if g_maxRandSleep is None:
@@ -36,6 +30,7 @@ else:
 
 g_userprefix=datetime.now().strftime("%Y_%m_%d_%H_%M_%S")
 g_userCooldown = 3      # Seconds to cool down between create, deactivate, delete
+g_ocsCredentials = ["ocsuser", "ocsuserapppassword"]
 
 logger = logging.getLogger("TestLogger")
 logging.basicConfig(
@@ -45,9 +40,8 @@ logging.basicConfig(
 )
 
 
-class AppVersions(threading.Thread):
+class AppVersions:
     def __init__(self, name, TestOcsCalls, verify=True):
-        threading.Thread.__init__(self)
         self.name = name
         self.TestOcsCalls = TestOcsCalls
         self.verify = verify
@@ -55,18 +49,13 @@ class AppVersions(threading.Thread):
     def run(self):
         global logger
         global expectedResults
-        global g_testPassed
-        global g_testThreadsRunning
-        g_testThreadsRunning += 1
-        logger.info(f"AppVersion thread started for node {self.name}")
+        logger.info(f"AppVersion check started for node {self.name}")
         drv = sunetnextcloud.TestTarget()
         fullnode = self.name
-        g_testPassed[fullnode] = False
-        logger.info(f"Setting passed for {fullnode} to {g_testPassed.get(fullnode)}")
 
         try:
             userSamlFound = False
-            session = requests.Session()
+            session = drv.get_session(fullnode)
             rawurl = drv.get_all_apps_url(fullnode)
             nodeuser = drv.get_ocsuser(fullnode)
             nodepwd = drv.get_ocsuserapppassword(fullnode)
@@ -76,27 +65,23 @@ class AppVersions(threading.Thread):
             url = url.replace("$PASSWORD$", nodepwd)
         except Exception as error:
             logger.error(f"Error getting credentials for {rawurl}:{error}")
-            g_testThreadsRunning -= 1
-            return
+            return False
 
         try:
             r = session.get(url, headers=ocsheaders, verify=self.verify)
         except Exception as error:
             logger.error(f"Error getting apps for {fullnode}:{error}")
-            g_testThreadsRunning -= 1
-            return
+            return False
         # nodeApps = []   # TODO: Check for apps installed on node
         apps = []
         try:
-            j = json.loads(r.text)
-            # print(json.dumps(j, indent=4, sort_keys=True))
-            apps = j["ocs"]["data"]["apps"]
+            reply = sunetnextcloud.decode_ocs(r)
+            # print(json.dumps(reply.data, indent=4, sort_keys=True))
+            apps = reply.data["apps"]
         except Exception as error:
             logger.error(f"No or invalid JSON reply received from {fullnode}:{error}")
             logger.error(r.text)
-            g_testPassed[fullnode] = False
-            g_testThreadsRunning -= 1
-            return
+            return False
 
         if "user_saml" in apps:
             userSamlFound = True
@@ -115,41 +100,33 @@ class AppVersions(threading.Thread):
                 r = session.get(url, headers=ocsheaders, verify=self.verify)
             except Exception as error:
                 logger.error(f"Error getting {rawurl}:{error}")
-                g_testPassed[fullnode] = False
-                g_testThreadsRunning -= 1
-                return
+                return False
 
             try:
-                j = json.loads(r.text)
-                # print(json.dumps(j, indent=4, sort_keys=True))
-                logger.info(j["ocs"]["data"]["id"])
-                logger.info(j["ocs"]["data"]["version"])
+                reply = sunetnextcloud.decode_ocs(r)
+                # print(json.dumps(reply.data, indent=4, sort_keys=True))
+                logger.info(reply.data["id"])
+                logger.info(reply.data["version"])
 
             except Exception as error:
                 logger.info(f"No JSON reply received from {fullnode}:{error}")
                 logger.info(r.text)
-                g_testPassed[fullnode] = False
-                g_testThreadsRunning -= 1
-                return
+                return False
 
             try:
                 self.TestOcsCalls.assertTrue(userSamlFound)
-                self.TestOcsCalls.assertEqual(j["ocs"]["data"]["id"], "user_saml")
+                self.TestOcsCalls.assertEqual(reply.data["id"], "user_saml")
                 self.TestOcsCalls.assertTrue(
-                    j["ocs"]["data"]["version"]
+                    reply.data["version"]
                     in expectedResults["apps"]["user_saml"][drv.target]["version"]
                 )
             except Exception as error:
                 logger.error(f"{error}")
-                g_testPassed[fullnode] = False
-                g_testThreadsRunning -= 1
-                return
+                return False
 
         if "auto_groups" not in apps:
             logger.error(f"Autogroups not found for {fullnode}")
-            g_testPassed[fullnode] = False
-            g_testThreadsRunning -= 1
-            return
+            return False
         else:
             try:
                 rawurl = drv.get_app_url(fullnode, "auto_groups")
@@ -160,15 +137,11 @@ class AppVersions(threading.Thread):
                 logger.error(
                     f"Error ensuring auto_groups active on {fullnode}: {error}"
                 )
-                g_testPassed[fullnode] = False
-                g_testThreadsRunning -= 1
-                return
+                return False
 
         if "stepupauth" not in apps:
             logger.error(f"stepupauth not found for {fullnode}")
-            g_testPassed[fullnode] = False
-            g_testThreadsRunning -= 1
-            return
+            return False
         else:
             try:
                 rawurl = drv.get_app_url(fullnode, "stepupauth")
@@ -177,35 +150,23 @@ class AppVersions(threading.Thread):
                 r = session.post(url, headers=ocsheaders)
             except Exception as error:
                 logger.error(f"Error ensuring stepupauth active on {fullnode}: {error}")
-                g_testPassed[fullnode] = False
-                g_testThreadsRunning -= 1
-                return
-
-        g_testPassed[fullnode] = True
-        g_testThreadsRunning -= 1
-        logger.info(
-            f"AppVersion thread done for node {self.name}, test passed: {g_testPassed[fullnode]}"
-        )
-        return
+                return False
+
+        logger.info(f"AppVersion check done for node {self.name}")
+        return True
 
 
-class NodeUsers(threading.Thread):
+class NodeUsers:
     def __init__(self, name, TestOcsCalls, verify=True):
-        threading.Thread.__init__(self)
         self.name = name
         self.TestOcsCalls = TestOcsCalls
         self.verify = verify
 
     def run(self):
         global logger
-        global g_testPassed
-        global g_testThreadsRunning
-        g_testThreadsRunning += 1
-        logger.info(f"NodeUsers thread started for node {self.name}")
+        logger.info(f"NodeUsers check started for node {self.name}")
         drv = sunetnextcloud.TestTarget()
         fullnode = self.name
-        g_testPassed[fullnode] = False
-        logger.info(f"Setting passed for {fullnode} to {g_testPassed.get(fullnode)}")
 
         try:
             rawurl = drv.get_users_url(fullnode)
@@ -216,21 +177,19 @@ class NodeUsers(threading.Thread):
             url = url.replace("$PASSWORD$", nodepwd)
         except Exception as error:
             logger.error(f"Error getting credentials for {rawurl}:{error}")
-            g_testThreadsRunning -= 1
-            return
+            return False
 
         try:
-            r = requests.get(
+            r = drv.get_session(fullnode).get(
                 url, headers=ocsheaders, timeout=g_requestTimeout, verify=self.verify
             )
         except Exception as error:
             logger.error(f"Error getting {rawurl}:{error}")
-            g_testThreadsRunning -= 1
-            return
+            return False
         try:
-            j = json.loads(r.text)
-            # logger.info(json.dumps(j, indent=4, sort_keys=True))
-            users = j["ocs"]["data"]["users"]
+            reply = sunetnextcloud.decode_ocs(r)
+            # logger.info(json.dumps(reply.data, indent=4, sort_keys=True))
+            users = reply.data["users"]
             logger.info(f"Received {len(users)} from {self.name}")
             # for user in users:
             #     rawurl = drv.get_user_url(fullnode, user)
@@ -243,35 +202,23 @@ class NodeUsers(threading.Thread):
         except Exception as error:
             logger.info(f"No JSON reply received from {fullnode}:{error}")
             logger.info(r.text)
-            g_testPassed[fullnode] = False
-            g_testThreadsRunning -= 1
-            return
-
-        g_testPassed[fullnode] = True
-        g_testThreadsRunning -= 1
-        logger.info(
-            f"NodeUsers thread done for node {self.name}, test passed: {g_testPassed[fullnode]}"
-        )
-        return
+            return False
+
+        logger.info(f"NodeUsers check done for node {self.name}")
+        return True
 
 
-class NodeGroups(threading.Thread):
+class NodeGroups:
     def __init__(self, name, TestOcsCalls, verify=True):
-        threading.Thread.__init__(self)
         self.name = name
         self.TestOcsCalls = TestOcsCalls
         self.verify = verify
 
     def run(self):
         global logger
-        global g_testPassed
-        global g_testThreadsRunning
-        g_testThreadsRunning += 1
-        logger.info(f"NodeGroups thread started for node {self.name}")
+        logger.info(f"NodeGroups check started for node {self.name}")
         drv = sunetnextcloud.TestTarget()
         fullnode = self.name
-        g_testPassed[fullnode] = False
-        logger.info(f"Setting passed for {fullnode} to {g_testPassed.get(fullnode)}")
 
         try:
             # rawurl = drv.get_groups_url(fullnode)
@@ -283,21 +230,19 @@ class NodeGroups(threading.Thread):
             url = url.replace("$PASSWORD$", nodepwd)
         except Exception as error:
             logger.error(f"Error getting credentials for {rawurl}:{error}")
-            g_testThreadsRunning -= 1
-            return
+            return False
 
         try:
-            r = requests.get(
+            r = drv.get_session(fullnode).get(
                 url, headers=ocsheaders, timeout=g_requestTimeout, verify=self.verify
             )
         except Exception as error:
             logger.error(f"Error getting {rawurl}:{error}")
-            g_testThreadsRunning -= 1
-            return
+            return False
         try:
-            j = json.loads(r.text)
-            logger.info(json.dumps(j, indent=4, sort_keys=True))
-            groups = j["ocs"]["data"]["groups"]
+            reply = sunetnextcloud.decode_ocs(r)
+            logger.info(json.dumps(reply.data, indent=4, sort_keys=True))
+            groups = reply.data["groups"]
             logger.info(f"Received {len(groups)} groups from {self.name}")
             # for group in groups:
             #     groupid = group["id"]
@@ -312,14 +257,12 @@ class NodeGroups(threading.Thread):
         except Exception as error:
             logger.info(f"No JSON reply received from {fullnode}:{error}")
             logger.info(r.text)
-            g_testPassed[fullnode] = False
-            g_testThreadsRunning -= 1
-            return
+            return False
 
         # Test for forcemfa group
-        # logger.info(json.dumps(j, indent=4, sort_keys=True))
+        # logger.info(json.dumps(reply.data, indent=4, sort_keys=True))
         forceMfaFound = False
-        for group in j["ocs"]["data"]["groups"]:
+        for group in reply.data["groups"]:
             if group["displayname"].lower() == "forcemfa":
                 forceMfaFound = True
 
@@ -329,168 +272,124 @@ class NodeGroups(threading.Thread):
             logger.info(f"Group forcemfa does not exist on {fullnode}")
             if fullnode == "kau":
                 logger.warning("Excluding kau from test")
-                g_testPassed[fullnode] = True
-            else:
-                g_testPassed[fullnode] = False
-                logger.info(r.text)
-            g_testThreadsRunning -= 1
-            return
+                return True
+            logger.info(r.text)
+            return False
 
-        g_testPassed[fullnode] = True
-        g_testThreadsRunning -= 1
-        logger.info(
-            f"NodeUsers thread done for node {self.name}, test passed: {g_testPassed[fullnode]}"
-        )
-        return
+        logger.info(f"NodeGroups check done for node {self.name}")
+        return True
 
 
-class CapabilitiesNoUser(threading.Thread):
+class CapabilitiesNoUser:
     def __init__(self, name, TestOcsCalls, verify=True):
-        threading.Thread.__init__(self)
         self.name = name
         self.TestOcsCalls = TestOcsCalls
         self.verify = verify
 
     def run(self):
-        global g_testPassed
-        global g_testThreadsRunning
         global logger
         global expectedResults
-        g_testThreadsRunning += 1
-        logger.info(f"Capabilities no user thread started for node {self.name}")
+        logger.info(f"Capabilities no user check started for node {self.name}")
         drv = sunetnextcloud.TestTarget()
         fullnode = self.name
-        g_testPassed[fullnode] = False
-        logger.info(f"Setting passed for {fullnode} to {g_testPassed.get(fullnode)}")
 
         rawurl = drv.get_ocs_capabilities_url(fullnode)
         logger.info(f"{self.TestOcsCalls._testMethodName} {rawurl}")
         try:
-            r = requests.get(
+            r = drv.get_session(fullnode).get(
                 rawurl, headers=ocsheaders, timeout=g_requestTimeout, verify=self.verify
             )
         except Exception as error:
             logger.error(f"Error getting {rawurl}: {error}")
-            g_testThreadsRunning -= 1
-            return
+            return False
         try:
-            j = json.loads(r.text)
+            reply = sunetnextcloud.decode_ocs(r, check=False)
         except Exception as error:
             logger.info(f"No JSON reply received from {fullnode}: {error}")
             logger.info(r.text)
-            g_testPassed[fullnode] = False
-            g_testThreadsRunning -= 1
-            return
+            return False
 
         try:
             self.TestOcsCalls.assertEqual(
-                j["ocs"]["meta"]["status"],
+                reply.meta["status"],
                 expectedResults[drv.target]["ocs_capabilities"]["ocs_meta_status"],
             )
             self.TestOcsCalls.assertEqual(
-                j["ocs"]["meta"]["statuscode"],
+                reply.statuscode,
                 expectedResults[drv.target]["ocs_capabilities"][
                     "ocs_meta_statuscode_2"
                 ],
             )
             self.TestOcsCalls.assertEqual(
-                j["ocs"]["meta"]["message"],
+                reply.meta["message"],
                 expectedResults[drv.target]["ocs_capabilities"]["ocs_meta_message"],
             )
             self.TestOcsCalls.assertTrue(
-                j["ocs"]["data"]["version"]["string"]
+                reply.data["version"]["string"]
                 in expectedResults[drv.target]["ocs_capabilities"][
                     "ocs_data_version_string"
                 ]
             )
         except Exception as error:
-            logger.error(f"Error with OCS capabilities assertion: {error} - {j}")
-            g_testPassed[fullnode] = False
-            g_testThreadsRunning -= 1
-            return
-
-        g_testPassed[fullnode] = True
-        g_testThreadsRunning -= 1
-        logger.info(
-            f"Capabilities no user thread done for node {self.name}, test passed: {g_testPassed[fullnode]}"
-        )
-        return
+            logger.error(f"Error with OCS capabilities assertion: {error} - {reply.meta}")
+            return False
+
+        logger.info(f"Capabilities no user check done for node {self.name}")
+        return True
 
 
-class Capabilities(threading.Thread):
+class Capabilities:
     def __init__(self, name, TestOcsCalls, verify=True):
-        threading.Thread.__init__(self)
         self.name = name
         self.TestOcsCalls = TestOcsCalls
         self.verify = verify
 
     def run(self):
-        global g_testPassed
-        global g_testThreadsRunning
         global logger
-        g_testThreadsRunning += 1
-        logger.info(f"Capabilities thread started for node {self.name}")
+        logger.info(f"Capabilities check started for node {self.name}")
         drv = sunetnextcloud.TestTarget()
         fullnode = self.name
-        g_testPassed[fullnode] = False
-        logger.info(f"Setting passed for {fullnode} to {g_testPassed.get(fullnode)}")
 
         rawurl = drv.get_ocs_capabilities_url(fullnode)
         logger.info(f"{self.TestOcsCalls._testMethodName} {rawurl}")
 
         try:
-            r = requests.get(
+            r = drv.get_session(fullnode).get(
                 rawurl, headers=ocsheaders, timeout=g_requestTimeout, verify=self.verify
             )
         except Exception as error:
             logger.error(f"Error getting {rawurl}: {error}")
-            g_testThreadsRunning -= 1
-            return
+            return False
         try:
-            j = json.loads(r.text)
-            logger.info(f"Node capabilities: {json.dumps(j, indent=4, sort_keys=True)}")
+            reply = sunetnextcloud.decode_ocs(r)
+            logger.info(f"Node capabilities: {json.dumps(reply.data, indent=4, sort_keys=True)}")
 
         except Exception as error:
             logger.info(f"No JSON reply received from {fullnode}: {error}")
             logger.info(r.text)
-            g_testPassed[fullnode] = False
-            g_testThreadsRunning -= 1
-            return
-
-        g_testPassed[fullnode] = True
-        g_testThreadsRunning -= 1
-        logger.info(
-            f"Capabilities thread done for node {self.name}, test passed: {g_testPassed[fullnode]}"
-        )
-        return
+            return False
+
+        logger.info(f"Capabilities check done for node {self.name}")
+        return True
 
 
-class UserLifeCycle(threading.Thread):
+class UserLifeCycle:
     def __init__(self, name, TestOcsCalls, verify=True):
-        threading.Thread.__init__(self)
         self.name = name
         self.TestOcsCalls = TestOcsCalls
         self.verify = verify
 
     def run(self):
-        global g_testPassed
-        global g_testThreadsRunning
         global expectedResults
-        g_testThreadsRunning += 1
 
         start_delay = random.randint(0,g_maxRandSleep)
-        logger.info(f"UserLifeCycle thread for node {self.name} starting in {start_delay} seconds")
+        logger.info(f"UserLifeCycle check for node {self.name} starting in {start_delay} seconds")
         time.sleep(start_delay)
 
         drv = sunetnextcloud.TestTarget()
         fullnode = self.name
-        g_testPassed[fullnode] = False
-        logger.info(f"Setting passed for {fullnode} to {g_testPassed.get(fullnode)}")
         r = None
-        session = requests.Session()
-        retries = Retry(total=5, backoff_factor=0.1, status_forcelist=[500, 502, 503, 504])
-        session.mount('http://', HTTPAdapter(max_retries=retries))
-        session.mount('https://', HTTPAdapter(max_retries=retries))
+        session = drv.get_session(fullnode)
 
         # Confirm app password for session
 
@@ -500,8 +399,7 @@ class UserLifeCycle(threading.Thread):
             nodepwd = drv.get_ocsuserpassword(fullnode)
         except Exception as error:
             logger.error(f"Error getting credentials for {rawurl}:{error}")
-            g_testThreadsRunning -= 1
-            return
+            return False
 
         cliuser = "__cli_user_" + g_userprefix + "_" + fullnode
         clipwd = sunetnextcloud.Helper().get_random_string(12)
@@ -527,9 +425,7 @@ class UserLifeCycle(threading.Thread):
             logger.info(r.text)
         except Exception as error:
             logger.error(f"Error confirming app password: {error}")
-            g_testPassed[fullnode] = False
-            g_testThreadsRunning -= 1
-            return
+            return False
 
         logger.info(f"Create cli user {cliuser}")
         data = {"userid": cliuser, "password": clipwd}
@@ -543,30 +439,26 @@ class UserLifeCycle(threading.Thread):
             time.sleep(g_userCooldown)
         except Exception as error:
             logger.error(f"Error posting to create cli user: {error}")
-            g_testPassed[fullnode] = False
-            g_testThreadsRunning -= 1
-            return
+            return False
 
         try:
-            j = json.loads(r.text)
-            logger.info(json.dumps(j, indent=4, sort_keys=True))
+            reply = sunetnextcloud.decode_ocs(r, check=False)
+            logger.info(json.dumps(reply.meta, indent=4, sort_keys=True))
 
-            if j["ocs"]["meta"]["statuscode"] == 102:
+            if reply.statuscode == 102:
                 logger.info(f"User already exists, skip retry creating the user")
-            elif j["ocs"]["meta"]["statuscode"] != 200:
+            elif reply.statuscode != 200:
                 logger.info(
-                    f"Retry once to create cli user {cliuser} after error {j['ocs']['meta']['statuscode']}"
+                    f"Retry once to create cli user {cliuser} after error {reply.statuscode}"
                 )
                 r = session.post(url, headers=ocsheaders, data=data, verify=self.verify)
-                j = json.loads(r.text)
-                logger.info(json.dumps(j, indent=4, sort_keys=True))
+                reply = sunetnextcloud.decode_ocs(r, check=False)
+                logger.info(json.dumps(reply.meta, indent=4, sort_keys=True))
                 time.sleep(g_userCooldown)
         except Exception as error:
             logger.info(f"No JSON reply received from {fullnode}: {error}")
             logger.info(r.text)
-            g_testPassed[fullnode] = False
-            g_testThreadsRunning -= 1
-            return
+            return False
 
         logger.info(f"Get user info for {cliuser}")
         userinfourl = drv.get_user_url(fullnode, cliuser)
@@ -574,8 +466,8 @@ class UserLifeCycle(threading.Thread):
         userinfourl = userinfourl.replace("$PASSWORD$", nodeapppwd)
         try:
             r = session.get(userinfourl, headers=ocsheaders, verify=self.verify)
-            j = json.loads(r.text)
-            if "forcemfa" not in j["ocs"]["data"]["groups"]:
+            reply = sunetnextcloud.decode_ocs(r)
+            if "forcemfa" not in reply.data["groups"]:
                 logger.warning(
                     f"focemfa not in user groups (yet?), sleeping for a second"
                 )
@@ -587,9 +479,7 @@ class UserLifeCycle(threading.Thread):
                 logger.error(f"Last response: {r.text}")
             else:
                 logger.error(f"No last response received")
-            g_testPassed[fullnode] = False
-            g_testThreadsRunning -= 1
-            return
+            return False
 
         # self.assertEqual(j["ocs"]["meta"]["status"], expectedResults[drv.target]['ocs_capabilities']['ocs_meta_status'])
         # self.assertEqual(j["ocs"]["meta"]["statuscode"], expectedResults[drv.target]['ocs_capabilities']['ocs_meta_statuscode'])
@@ -601,31 +491,31 @@ class UserLifeCycle(threading.Thread):
         disableuserurl = disableuserurl.replace("$PASSWORD$", nodeapppwd)
         try:
             r = session.put(disableuserurl, headers=ocsheaders, verify=self.verify)
-            j = json.loads(r.text)
-            logger.info(json.dumps(j, indent=4, sort_keys=True))
+            reply = sunetnextcloud.decode_ocs(r, check=False)
+            logger.info(json.dumps(reply.meta, indent=4, sort_keys=True))
             time.sleep(g_userCooldown)
 
-            if j["ocs"]["meta"]["statuscode"] != 200:
+            if reply.statuscode != 200:
                 logger.info(
-                    f"Retry to disable cli user {cliuser} after error {j['ocs']['meta']['statuscode']}"
+                    f"Retry to disable cli user {cliuser} after error {reply.statuscode}"
                 )
                 r = session.put(disableuserurl, headers=ocsheaders, verify=self.verify)
-                j = json.loads(r.text)
-                logger.info(json.dumps(j, indent=4, sort_keys=True))
+                reply = sunetnextcloud.decode_ocs(r, check=False)
+                logger.info(json.dumps(reply.meta, indent=4, sort_keys=True))
                 time.sleep(g_userCooldown)
 
             self.TestOcsCalls.assertEqual(
-                j["ocs"]["meta"]["status"],
+                reply.meta["status"],
                 expectedResults[drv.target]["ocs_capabilities"]["ocs_meta_status"],
             )
             self.TestOcsCalls.assertEqual(
-                j["ocs"]["meta"]["statuscode"],
+                reply.statuscode,
                 expectedResults[drv.target]["ocs_capabilities"][
                     "ocs_meta_statuscode_2"
                 ],
             )
             self.TestOcsCalls.assertEqual(
-                j["ocs"]["meta"]["message"],
+                reply.meta["message"],
                 expectedResults[drv.target]["ocs_capabilities"]["ocs_meta_message"],
             )
 
@@ -634,31 +524,31 @@ class UserLifeCycle(threading.Thread):
             url = rawurl.replace("$USERNAME$", nodeuser)
             url = url.replace("$PASSWORD$", nodeapppwd)
             r = session.delete(url, headers=ocsheaders, verify=drv.verify)
-            j = json.loads(r.text)
-            logger.info(json.dumps(j, indent=4, sort_keys=True))
+            reply = sunetnextcloud.decode_ocs(r, check=False)
+            logger.info(json.dumps(reply.meta, indent=4, sort_keys=True))
             time.sleep(g_userCooldown)
 
-            if j["ocs"]["meta"]["statuscode"] != 200:
+            if reply.statuscode != 200:
                 logger.info(
-                    f"Retry to delete cli user after {cliuser} after error {j['ocs']['meta']['statuscode']}"
+                    f"Retry to delete cli user after {cliuser} after error {reply.statuscode}"
                 )
                 r = session.delete(url, headers=ocsheaders, verify=self.verify)
-                j = json.loads(r.text)
-                logger.info(json.dumps(j, indent=4, sort_keys=True))
+                reply = sunetnextcloud.decode_ocs(r, check=False)
+                logger.info(json.dumps(reply.meta, indent=4, sort_keys=True))
                 time.sleep(g_userCooldown)
 
             self.TestOcsCalls.assertEqual(
-                j["ocs"]["meta"]["status"],
+                reply.meta["status"],
                 expectedResults[drv.target]["ocs_capabilities"]["ocs_meta_status"],
             )
             self.TestOcsCalls.assertEqual(
-                j["ocs"]["meta"]["statuscode"],
+                reply.statuscode,
                 expectedResults[drv.target]["ocs_capabilities"][
                     "ocs_meta_statuscode_2"
                 ],
             )
             self.TestOcsCalls.assertEqual(
-                j["ocs"]["meta"]["message"],
+                reply.meta["message"],
                 expectedResults[drv.target]["ocs_capabilities"]["ocs_meta_message"],
             )
         except Exception as error:
@@ -667,16 +557,10 @@ class UserLifeCycle(threading.Thread):
                 logger.error(f"Last response: {r.text}")
             else:
                 logger.error(f"No last response received")
-            g_testPassed[fullnode] = False
-            g_testThreadsRunning -= 1
-            return
+            return False
 
-        g_testPassed[fullnode] = True
-        logger.info(
-            f"User lifecycle thread done for node {self.name}, test passed: {g_testPassed[fullnode]}"
-        )
-        g_testThreadsRunning -= 1
-        return
+        logger.info(f"User lifecycle check done for node {self.name}")
+        return True
 
 
 class TestOcsCalls(unittest.TestCase):
@@ -686,95 +570,67 @@ class TestOcsCalls(unittest.TestCase):
 
     def test_capabilities_nouser(self):
         drv = sunetnextcloud.TestTarget()
-        for fullnode in drv.nodestotest:
-            with self.subTest(mynode=fullnode):
-                logger.info(f"TestID: {fullnode}")
-                capabilitiesNoUserThread = CapabilitiesNoUser(
-                    fullnode, self, verify=drv.verify
-                )
-                capabilitiesNoUserThread.start()
-
-        while g_testThreadsRunning > 0:
-            time.sleep(1)
-
-        for fullnode in drv.nodestotest:
-            with self.subTest(mynode=fullnode):
-                self.assertTrue(g_testPassed[fullnode])
+        results = sunetnextcloud.run_node_checks(
+            lambda fullnode: CapabilitiesNoUser(fullnode, self, verify=drv.verify).run(),
+            drv.nodestotest,
+        )
+        for result in results:
+            with self.subTest(mynode=result.node):
+                self.assertTrue(result.passed, result.error)
 
     def test_capabilities(self):
         drv = sunetnextcloud.TestTarget()
-        for fullnode in drv.nodestotest:
-            with self.subTest(mynode=fullnode):
-                logger.info(f"TestID: {fullnode}")
-                capabilitiesThread = Capabilities(fullnode, self, verify=drv.verify)
-                capabilitiesThread.start()
-
-        while g_testThreadsRunning > 0:
-            time.sleep(1)
-
-        for fullnode in drv.nodestotest:
-            with self.subTest(mynode=fullnode):
-                self.assertTrue(g_testPassed[fullnode])
+        results = sunetnextcloud.run_node_checks(
+            lambda fullnode: Capabilities(fullnode, self, verify=drv.verify).run(),
+            drv.nodestotest,
+        )
+        for result in results:
+            with self.subTest(mynode=result.node):
+                self.assertTrue(result.passed, result.error)
 
     def test_nodeusers(self):
         drv = sunetnextcloud.TestTarget()
-        for fullnode in drv.nodestotest:
-            with self.subTest(mynode=fullnode):
-                logger.info(f"TestID: {fullnode}")
-                nodeUsersThread = NodeUsers(fullnode, self, verify=drv.verify)
-                nodeUsersThread.start()
-
-        while g_testThreadsRunning > 0:
-            time.sleep(1)
-
-        for fullnode in drv.nodestotest:
-            with self.subTest(mynode=fullnode):
-                self.assertTrue(g_testPassed[fullnode])
+        drv.prefetch_credentials(g_ocsCredentials)
+        results = sunetnextcloud.run_node_checks(
+            lambda fullnode: NodeUsers(fullnode, self, verify=drv.verify).run(),
+            drv.nodestotest,
+        )
+        for result in results:
+            with self.subTest(mynode=result.node):
+                self.assertTrue(result.passed, result.error)
 
     def test_nodegroups(self):
         drv = sunetnextcloud.TestTarget()
-        for fullnode in drv.nodestotest:
-            with self.subTest(mynode=fullnode):
-                logger.info(f"TestID: {fullnode}")
-                nodeGroupsThread = NodeGroups(fullnode, self, verify=drv.verify)
-                nodeGroupsThread.start()
-
-        while g_testThreadsRunning > 0:
-            time.sleep(1)
-
-        for fullnode in drv.nodestotest:
-            with self.subTest(mynode=fullnode):
-                self.assertTrue(g_testPassed[fullnode])
+        drv.prefetch_credentials(g_ocsCredentials)
+        results = sunetnextcloud.run_node_checks(
+            lambda fullnode: NodeGroups(fullnode, self, verify=drv.verify).run(),
+            drv.nodestotest,
+        )
+        for result in results:
+            with self.subTest(mynode=result.node):
+                self.assertTrue(result.passed, result.error)
 
     def test_userlifecycle(self):
         drv = sunetnextcloud.TestTarget()
-        for fullnode in drv.nodestotest:
-            with self.subTest(mynode=fullnode):
-                logger.info(f"TestID: {fullnode}")
-                userLifecycleThread = UserLifeCycle(fullnode, self, verify=drv.verify)
-                userLifecycleThread.start()
-
-        while g_testThreadsRunning > 0:
-            time.sleep(1)
-
-        for fullnode in drv.nodestotest:
-            with self.subTest(mynode=fullnode):
-                self.assertTrue(g_testPassed[fullnode])
+        drv.prefetch_credentials(g_ocsCredentials + ["ocsuserpassword"])
+        results = sunetnextcloud.run_node_checks(
+            lambda fullnode: UserLifeCycle(fullnode, self, verify=drv.verify).run(),
+            drv.nodestotest,
+        )
+        for result in results:
+            with self.subTest(mynode=result.node):
+                self.assertTrue(result.passed, result.error)
 
     def test_app_versions(self):
         drv = sunetnextcloud.TestTarget()
-        for fullnode in drv.nodestotest:
-            with self.subTest(mynode=fullnode):
-                logger.info(f"TestID: {fullnode}")
-                appVersionsThread = AppVersions(fullnode, self, verify=drv.verify)
-                appVersionsThread.start()
-
-        while g_testThreadsRunning > 0:
-            time.sleep(1)
-
-        for fullnode in drv.nodestotest:
-            with self.subTest(mynode=fullnode):
-                self.assertTrue(g_testPassed[fullnode])
+        drv.prefetch_credentials(g_ocsCredentials)
+        results = sunetnextcloud.run_node_checks(
+            lambda fullnode: AppVersions(fullnode, self, verify=drv.verify).run(),
+            drv.nodestotest,
+        )
+        for result in results:
+            with self.subTest(mynode=result.node):
+                self.assertTrue(result.passed, result.error)
 
 
 # if __name__ == "__main__":
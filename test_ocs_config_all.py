@@ -8,10 +8,10 @@ import os
 import threading
 import time
 import unittest
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from urllib.parse import quote
 from pathlib import Path
 
-import requests
 import xmlrunner
 import HtmlTestRunner
 
@@ -25,6 +25,14 @@ g_testPassed = {}
 g_testThreadsRunning = 0
 g_requestTimeout = 10
 g_localDirectory = "./provisioning_config"
+g_ocsCredentials = ["ocsuser", "ocsuserapppassword"]
+# Nodes snapshotted at the same time and apps read at the same time on every node, each node has its own pooled session
+g_snapshotNodes = int(os.environ.get("NextcloudConfigSnapshotNodes", 8))
+g_snapshotApps = int(os.environ.get("NextcloudConfigSnapshotApps", 4))
+# Times an app is read before its error is recorded in the configuration file instead,
+# and the seconds to wait before the second attempt, doubled for every further one
+g_snapshotAttempts = int(os.environ.get("NextcloudConfigSnapshotAttempts", 3))
+g_snapshotBackoff = float(os.environ.get("NextcloudConfigSnapshotBackoff", 1))
 
 logger = logging.getLogger("TestLogger")
 logging.basicConfig(
@@ -33,6 +41,145 @@ logging.basicConfig(
     level=logging.INFO,
 )
 
+class ConfigSnapshotter(object):
+    """Save the app configuration of nodes to {node}.{target}.json in directory
+    Nodes are snapshotted concurrently and on every node several apps are read at the same time over one pooled session.
+    Every app is appended to {node}.{target}.json.partial as a JSON line as soon as all its values are read,
+    so an interrupted snapshot continues with the missing apps on the next run. An app that cannot be read is tried
+    up to attempts times with a growing backoff, counting the attempts of an interrupted run, and its last error is
+    then saved under '_errors'. The configuration file is written once every app was read or gave up. If apps gave up,
+    the node counts as incomplete and keeps its partial file, so the next run retries them with fresh attempts.
+    Nodes with a configuration file and no partial file are skipped.
+    """
+
+    def __init__(self, directory, nodeConcurrency=None, appConcurrency=None, attempts=None, backoff=None):
+        self.directory = directory
+        self.nodeConcurrency = nodeConcurrency if nodeConcurrency is not None else g_snapshotNodes
+        self.appConcurrency = appConcurrency if appConcurrency is not None else g_snapshotApps
+        self.attempts = attempts if attempts is not None else g_snapshotAttempts
+        self.backoff = backoff if backoff is not None else g_snapshotBackoff
+        self.requests = 0
+        self.resumed = 0
+        self.errors = 0
+        self.failed = []
+        self.lock = threading.Lock()
+
+    def config_path(self, node):
+        return f'{self.directory}/{node}.{drv.target}.json'
+
+    def read_partial(self, node):
+        """Return the apps already saved by an earlier, interrupted snapshot of node and the errors of the others"""
+        apps = {}
+        failures = {}
+        partialFile = Path(self.config_path(node) + '.partial')
+        if not partialFile.is_file():
+            return apps, failures
+        with open(partialFile) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # The last line is cut off if the snapshot was killed while writing it
+                    continue
+                if 'error' in entry:
+                    failures.setdefault(entry['app'], []).append(entry['error'])
+                else:
+                    apps[entry['app']] = entry['config']
+        return apps, failures
+
+    def get(self, session, url):
+        with self.lock:
+            self.requests += 1
+        return sunetnextcloud.decode_ocs(session.get(url, headers=ocsheaders, timeout=g_requestTimeout)).data
+
+    def read_app(self, session, endpoints, node, app, delay=0):
+        time.sleep(delay)
+        config = {}
+        for key in self.get(session, endpoints.app_config_keys(app))['data']:
+            config[key] = self.get(session, endpoints.app_config_value(app, key))['data']
+        logger.info(f'Read {len(config)} configuration values of {app} on {node}')
+        return config
+
+    def snapshot_node(self, node):
+        """Snapshot node, returns True if its configuration file is complete"""
+        if Path(self.config_path(node)).is_file() and not Path(self.config_path(node) + '.partial').is_file():
+            logger.info(f'Configuration file already exists, skipping {node}')
+            return True
+        endpoints = drv.get_endpoints(node)
+        session = drv.get_session(node)
+        session.auth = drv.get_ocs_auth(node)
+        try:
+            apps = self.get(session, endpoints.apps)['apps']
+        except Exception as error:
+            logger.error(f"No or invalid apps JSON reply received from {node}:{error}")
+            return False
+
+        configuration, failures = self.read_partial(node)
+        if len(configuration) > 0:
+            logger.info(f'Resuming snapshot of {node}, {len(configuration)} of {len(apps)} apps already saved')
+            with self.lock:
+                self.resumed += len(configuration)
+        missing = [
+            app for app in apps if app not in configuration and len(failures.get(app, [])) < self.attempts
+        ]
+        with open(self.config_path(node) + '.partial', 'a') as partial:
+            with ThreadPoolExecutor(max_workers=self.appConcurrency) as executor:
+                futures = {executor.submit(self.read_app, session, endpoints, node, app): app for app in missing}
+                while len(futures) > 0:
+                    done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        app = futures.pop(future)
+                        try:
+                            configuration[app] = future.result()
+                            entry = {'app': app, 'config': configuration[app]}
+                        except Exception as error:
+                            logger.error(f"No or invalid JSON reply received from node: {node} - app: {app}:{error}")
+                            failures.setdefault(app, []).append(str(error))
+                            entry = {'app': app, 'error': str(error)}
+                            if len(failures[app]) < self.attempts:
+                                delay = self.backoff * 2 ** (len(failures[app]) - 1)
+                                futures[executor.submit(self.read_app, session, endpoints, node, app, delay)] = app
+                        partial.write(json.dumps(entry) + '\n')
+                        partial.flush()
+
+        nodeConfiguration = {node: configuration}
+        errors = {app: failures[app][-1] for app in apps if app not in configuration}
+        if len(errors) > 0:
+            logger.warning(f'Gave up on {len(errors)} apps of {node} after {self.attempts} attempts: {sorted(errors)}')
+            nodeConfiguration['_errors'] = errors
+            with self.lock:
+                self.errors += len(errors)
+        temporaryPath = self.config_path(node) + '.tmp'
+        with open(temporaryPath, 'w') as f:
+            json.dump(nodeConfiguration, f, indent=4, sort_keys=True)
+        os.replace(temporaryPath, self.config_path(node))
+        logger.info(f'Save node configuration file to {self.config_path(node)}')
+        if len(errors) > 0:
+            # Keep only the apps that were read, the next run retries the others with fresh attempts
+            with open(temporaryPath, 'w') as f:
+                for app, config in configuration.items():
+                    f.write(json.dumps({'app': app, 'config': config}) + '\n')
+            os.replace(temporaryPath, self.config_path(node) + '.partial')
+            logger.warning(f'Snapshot of {node} is incomplete, run again to retry {sorted(errors)}')
+            return False
+        os.remove(self.config_path(node) + '.partial')
+        return True
+
+    def snapshot(self, nodes):
+        """Snapshot all nodes, returns the nodes whose snapshot is incomplete"""
+        Path(self.directory).mkdir(parents=True, exist_ok=True)
+        with ThreadPoolExecutor(max_workers=self.nodeConcurrency) as executor:
+            results = dict(zip(nodes, executor.map(self.snapshot_node, nodes)))
+        self.failed = [node for node, complete in results.items() if not complete]
+        return self.failed
+
+    def report(self):
+        return (
+            f'{self.requests} requests - {self.resumed} apps resumed - {self.errors} apps failed - '
+            f'{len(self.failed)} nodes incomplete {self.failed}'
+        )
+
+
 class TestOcsConfigAll(unittest.TestCase):
     def test_logger(self):
         logger.info(f"TestID: {self._testMethodName}")
@@ -41,93 +188,18 @@ class TestOcsConfigAll(unittest.TestCase):
     def test_get_configuration(self):
         logger.info(f"TestID: {self._testMethodName}")
 
-        Path(g_localDirectory).mkdir(parents=True, exist_ok=True)
-
-        node_configuration = {}
-        for node in drv.allnodes:
-            node_config_path = f'{g_localDirectory}/{node}.{drv.target}.json'
-            node_config_file = Path(node_config_path)
-            if node_config_file.is_file():
-                logger.info(f'Configuration file already exists, skipping {node}')
-                continue
-                # file exists
-
-            key = 'none'
-            logger.info(f'Execute for {node}')
-            nodeuser = drv.get_ocsuser(node)
-            nodepwd = drv.get_ocsuserapppassword(node)
-
-            rawurl = drv.get_all_apps_url(node)
-            url = rawurl.replace("$USERNAME$", nodeuser)
-            url = url.replace("$PASSWORD$", nodepwd)
-            session = requests.Session()
-            r = session.get(url, headers=ocsheaders)
-
-            try:
-                j = json.loads(r.text)
-                apps = j["ocs"]["data"]["apps"]
-            except Exception as error:
-                logger.error(f"No or invalid apps JSON reply received from {node}:{error}")
-                continue
-
-            for app in apps:
-                logger.info(f'Get configuration for {app}')
-
-                try:
-                    rawurl = drv.get_app_url(node, app)
-                    url = rawurl.replace("$USERNAME$", nodeuser)
-                    url = url.replace("$PASSWORD$", nodepwd)
-                    r = session.get(url, headers=ocsheaders)
-                    j = json.loads(r.text)
-                    # logger.info(json.dumps(j, indent=4))
-
-                    logger.info(f'Get configuration keys for {app}')
-
-                    rawurl = drv.get_app_config_keys_url(node, app)
-                    url = rawurl.replace("$USERNAME$", nodeuser)
-                    url = url.replace("$PASSWORD$", nodepwd)
-                    r = session.get(url, headers=ocsheaders)
-                    j = json.loads(r.text)
-                    # logger.info(json.dumps(j, indent=4))
-
-                    for key in j['ocs']['data']['data']:
-                        logger.info(f'Get app config value for node: {node} - app: {app} - key: {key}')
-                        # key = 'auto_groups'
-                        # app = 'stepupauth'
-                        rawurl = drv.get_app_config_value_url(node, app, key)
-
-                        url = rawurl.replace("$USERNAME$", nodeuser)
-                        url = url.replace("$PASSWORD$", nodepwd)
-                        r = session.get(url, headers=ocsheaders)
-                        j = json.loads(r.text)
-
-                        # logger.info(f'Append node configuration ')
-                        node_configuration.setdefault(node, {}).setdefault(app, {})[key] = j['ocs']['data']['data']
-
-                    # r = session.post(url, headers=ocsheaders)
-                    # j = json.loads(r.text)
-                    # logger.info(json.dumps(j, indent=4))
-                except Exception as error:
-                    logger.error(f"No or invalid JSON reply received from node: {node} - app: {app} - {key}:{error}")
-                    continue
-
-
-            # logger.info(f'Full node configuration: {json.dumps(node_configuration, indent=4)}')
-
-            # Check if the file exists and write configuration into it
-            node_config_file = Path(node_config_path)
-            if node_config_file.is_file():
-                logger.info(f'Do not overwrite existing configuration file')
-                # file exists
-            else:
-                with open(node_config_path, 'w') as f:
-                    logger.info(f'Save node configuration file to {node_config_path}')
-                    json.dump(node_configuration, f, indent=4, sort_keys=True)
+        drv.prefetch_credentials(g_ocsCredentials, drv.allnodes)
+        startTime = time.perf_counter()
+        snapshotter = ConfigSnapshotter(g_localDirectory)
+        incomplete = snapshotter.snapshot(drv.allnodes)
+        logger.info(f'Configuration snapshot took {time.perf_counter() - startTime:.1f}s - {snapshotter.report()}')
+        self.assertEqual(incomplete, [])
 
     def test_check_configuration(self):
         logger.info(f"TestID: {self._testMethodName}")
 
         Path(g_localDirectory).mkdir(parents=True, exist_ok=True)
+        drv.prefetch_credentials(g_ocsCredentials, drv.allnodes)
 
         for node in drv.allnodes:
             node_config_path = f'{g_localDirectory}/{node}.{drv.target}.json'
@@ -143,57 +215,46 @@ class TestOcsConfigAll(unittest.TestCase):
 
             key = 'none'
             logger.info(f'Execute for {node}')
-            nodeuser = drv.get_ocsuser(node)
-            nodepwd = drv.get_ocsuserapppassword(node)
-
-            rawurl = drv.get_all_apps_url(node)
-            url = rawurl.replace("$USERNAME$", nodeuser)
-            url = url.replace("$PASSWORD$", nodepwd)
-            session = requests.Session()
-            r = session.get(url, headers=ocsheaders)
+            endpoints = drv.get_endpoints(node)
+            session = drv.get_session(node)
+            session.auth = drv.get_ocs_auth(node)
+            r = session.get(endpoints.apps, headers=ocsheaders)
 
             try:
-                j = json.loads(r.text)
-                apps = j["ocs"]["data"]["apps"]
+                apps = sunetnextcloud.decode_ocs(r).data["apps"]
             except Exception as error:
                 logger.error(f"No or invalid apps JSON reply received from {node}:{error}")
                 continue
 
             for app in apps:
+                if app not in node_reference_configuration[node]:
+                    error = node_reference_configuration.get('_errors', {}).get(app)
+                    logger.warning(f'No reference configuration of {app} for {node}: {error}')
+                    continue
                 logger.info(f'Get configuration for {app}')
 
                 try:
-                    rawurl = drv.get_app_url(node, app)
-                    url = rawurl.replace("$USERNAME$", nodeuser)
-                    url = url.replace("$PASSWORD$", nodepwd)
-                    r = session.get(url, headers=ocsheaders)
-                    j = json.loads(r.text)
+                    r = session.get(endpoints.app(app), headers=ocsheaders)
+                    sunetnextcloud.decode_ocs(r)
                     # logger.info(json.dumps(j, indent=4))
 
                     logger.info(f'Get configuration keys for {app}')
 
-                    rawurl = drv.get_app_config_keys_url(node, app)
-                    url = rawurl.replace("$USERNAME$", nodeuser)
-                    url = url.replace("$PASSWORD$", nodepwd)
-                    r = session.get(url, headers=ocsheaders)
-                    j = json.loads(r.text)
+                    r = session.get(endpoints.app_config_keys(app), headers=ocsheaders)
+                    keys = sunetnextcloud.decode_ocs(r).data['data']
                     # logger.info(json.dumps(j, indent=4))
 
                     key = 'none'
-                    for key in j['ocs']['data']['data']:
+                    for key in keys:
                         logger.info(f'Get app config value for node: {node} - app: {app} - key: {key}')
                         # key = 'auto_groups'
                         # app = 'stepupauth'
-                        rawurl = drv.get_app_config_value_url(node, app, key)
-
-                        url = rawurl.replace("$USERNAME$", nodeuser)
-                        url = url.replace("$PASSWORD$", nodepwd)
-                        r = session.get(url, headers=ocsheaders)
-                        j = json.loads(r.text)
+                        r = session.get(endpoints.app_config_value(app, key), headers=ocsheaders)
+                        value = sunetnextcloud.decode_ocs(r).data['data']
 
                         with self.subTest(keychecktest=f'{node}.{app}.{key}'):
                             logger.info(f'Compare node configuration element: {node} - app: {app} - key: {key}')
-                            self.assertEqual(j['ocs']['data']['data'], node_reference_configuration[node][app][key])
+                            self.assertEqual(value, node_reference_configuration[node][app][key])
 
                 except AssertionError:
                     raise
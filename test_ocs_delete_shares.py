@@ -10,7 +10,6 @@ import time
 import unittest
 
 import HtmlTestRunner
-import requests
 import xmlrunner
 from webdav3.client import Client
 
@@ -196,23 +195,24 @@ class TestOcsFederatedShares(unittest.TestCase):
         for fullnode in drv.nodestotest:
             with self.subTest(mynode=fullnode):
                 logger.info(f"Delete shares for {fullnode}")
+                session = drv.get_session(fullnode)
                 nodeuser = drv.get_seleniumuser(fullnode)
                 nodepwd = drv.get_seleniumuserapppassword(fullnode)
                 url = drv.get_pending_shares_url(fullnode)
                 url = url.replace("$USERNAME$", nodeuser)
                 url = url.replace("$PASSWORD$", nodepwd)
-                r = requests.get(url, headers=ocsheaders, timeout=g_requestTimeout)
-                j = json.loads(r.text)
-                logger.info(json.dumps(j, indent=4, sort_keys=True))
+                r = session.get(url, headers=ocsheaders, timeout=g_requestTimeout)
+                reply = sunetnextcloud.decode_ocs(r)
+                logger.info(json.dumps(reply.data, indent=4, sort_keys=True))
 
-                for share in j["ocs"]["data"]:
+                for share in reply.data:
                     filename = share["name"]
                     logger.info(f"Deleting share {filename}")
                     url = drv.get_pending_shares_id_url(fullnode, share["id"])
                     logger.info(f"Delete share: {share['id']} - {url}")
                     url = url.replace("$USERNAME$", nodeuser)
                     url = url.replace("$PASSWORD$", nodepwd)
-                    r = requests.delete(url, headers=ocsheaders)
+                    r = session.delete(url, headers=ocsheaders)
                     # logger.info(f'Pending share accepted: {r.text}')
 
 
@@ -12,7 +12,6 @@ import HtmlTestRunner
 
 import threading
 import time
-import requests
 import json
 
 drv = sunetnextcloud.TestTarget()
@@ -63,7 +62,7 @@ class ExternalMounts(threading.Thread):
             return
 
         try:
-            r = requests.get(
+            r = drv.get_session(fullnode).get(
                 url, headers=ocsheaders, timeout=g_requestTimeout, verify=self.verify
             )
         except Exception as error:
@@ -71,8 +70,8 @@ class ExternalMounts(threading.Thread):
             g_testThreadsRunning -= 1
             return
         try:
-            j = json.loads(r.text)
-            logger.info(f"Node capabilities: {json.dumps(j, indent=4, sort_keys=True)}")
+            reply = sunetnextcloud.decode_ocs(r)
+            logger.info(f"Node capabilities: {json.dumps(reply.data, indent=4, sort_keys=True)}")
 
         except Exception as error:
             logger.info(f"No JSON reply received from {fullnode}: {error}")
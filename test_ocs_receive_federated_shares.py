@@ -2,7 +2,6 @@
 Author: Richard Freitag <freitag@sunet.se>
 """
 
-import json
 import logging
 import tempfile
 import threading
@@ -10,7 +9,6 @@ import time
 import unittest
 
 import HtmlTestRunner
-import requests
 import xmlrunner
 from webdav3.client import Client
 
@@ -48,28 +46,29 @@ class TestOcsFederatedShares(unittest.TestCase):
         for fullnode in drv.nodestotest:
             with self.subTest(mynode=fullnode):
                 logger.info(f"Accept shares for {fullnode}")
+                session = drv.get_session(fullnode)
 
                 nodeuser = drv.get_seleniumuser(fullnode)
                 nodepwd = drv.get_seleniumuserapppassword(fullnode)
                 url = drv.get_pending_shares_url(fullnode)
                 url = url.replace("$USERNAME$", nodeuser)
                 url = url.replace("$PASSWORD$", nodepwd)
-                r = requests.get(url, headers=ocsheaders, timeout=g_requestTimeout)
-                j = json.loads(r.text)
-                # logger.info(json.dumps(j, indent=4, sort_keys=True))
+                r = session.get(url, headers=ocsheaders, timeout=g_requestTimeout)
+                reply = sunetnextcloud.decode_ocs(r)
+                # logger.info(json.dumps(reply.data, indent=4, sort_keys=True))
 
-                if len(j["ocs"]["data"]) == 0:
+                if len(reply.data) == 0:
                     logger.info(f"No pending shares to accept for {fullnode}")
                     continue  # with next node
 
-                for share in j["ocs"]["data"]:
+                for share in reply.data:
                     filename = share["name"]
                     logger.info(f"Accepting share {filename}")
                     url = drv.get_pending_shares_id_url(fullnode, share["id"])
                     logger.info(f"Accept share: {share['id']} - {url}")
                     url = url.replace("$USERNAME$", nodeuser)
                     url = url.replace("$PASSWORD$", nodepwd)
-                    r = requests.post(url, headers=ocsheaders)
+                    r = session.post(url, headers=ocsheaders)
                     logger.info(f"Pending share accepted: {filename}")
 
     def test_list_federated_shares(self):
@@ -77,15 +76,16 @@ class TestOcsFederatedShares(unittest.TestCase):
         for fullnode in drv.nodestotest:
             with self.subTest(mynode=fullnode):
                 logger.info(f"List federated shares for {fullnode}")
+                session = drv.get_session(fullnode)
 
                 nodeuser = drv.get_seleniumuser(fullnode)
                 nodepwd = drv.get_seleniumuserapppassword(fullnode)
                 url = drv.get_remote_shares_url(fullnode)
                 url = url.replace("$USERNAME$", nodeuser)
                 url = url.replace("$PASSWORD$", nodepwd)
-                r = requests.get(url, headers=ocsheaders, timeout=g_requestTimeout)
-                j = json.loads(r.text)
-                # logger.info(json.dumps(j, indent=4, sort_keys=True))
+                r = session.get(url, headers=ocsheaders, timeout=g_requestTimeout)
+                reply = sunetnextcloud.decode_ocs(r)
+                # logger.info(json.dumps(reply.data, indent=4, sort_keys=True))
 
                 url = drv.get_webdav_url(fullnode, nodeuser)
                 logger.info(f"URL: {url}")
@@ -97,8 +97,9 @@ class TestOcsFederatedShares(unittest.TestCase):
                 }
                 client = Client(options)
                 client.verify = drv.verify
+                client.session = session
 
-                for share in j["ocs"]["data"]:
+                for share in reply.data:
                     try:
                         filename = share["name"]
                         logger.info(f"List share {filename}")
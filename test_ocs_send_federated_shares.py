@@ -2,7 +2,6 @@
 Author: Richard Freitag <freitag@sunet.se>
 """
 
-import json
 import logging
 import tempfile
 import threading
@@ -10,7 +9,6 @@ import time
 import unittest
 
 import HtmlTestRunner
-import requests
 import xmlrunner
 from webdav3.client import Client
 
@@ -57,6 +55,7 @@ class OcsMakeFederatedShare(threading.Thread):
         g_testThreadsRunning += 1
         logger.info(f"{self.name} - OcsMakeFederatedShare thread started")
         drv = sunetnextcloud.TestTarget()
+        session = drv.get_session(fullnode)
 
         nodeuser = drv.get_seleniumuser(fullnode)
         if self.basicAuth:
@@ -76,6 +75,7 @@ class OcsMakeFederatedShare(threading.Thread):
 
         client = Client(options)
         client.verify = drv.verify
+        client.session = session
 
         try:
             logger.info(f"{self.name} - Before mkdir: {client.list()}")
@@ -106,6 +106,7 @@ class OcsMakeFederatedShare(threading.Thread):
         try:
             client = Client(options)
             client.verify = drv.verify
+            client.session = session
             client.mkdir(g_sharedTestFolder)
             targetfile = f"{g_sharedTestFolder}/{filename}"
             # deleteoriginal=False # TODO: Implement delete original file
@@ -131,18 +132,18 @@ class OcsMakeFederatedShare(threading.Thread):
         url = url.replace("$PASSWORD$", nodepwd)
 
         try:
-            r = requests.get(
+            r = session.get(
                 url, headers=ocsheaders, timeout=g_requestTimeout, verify=self.verify
             )
-            j = json.loads(r.text)
-            # logger.info(f'Found shares: {json.dumps(j, indent=4, sort_keys=True)}')
+            reply = sunetnextcloud.decode_ocs(r)
+            # logger.info(f'Found shares: {reply.data}')
 
-            for share in j["ocs"]["data"]:
+            for share in reply.data:
                 clean_url = drv.get_share_id_url(fullnode, share["id"])
                 logger.info(f"{self.name} - Delete share: {share['id']} - {clean_url}")
                 url = clean_url.replace("$USERNAME$", nodeuser)
                 url = url.replace("$PASSWORD$", nodepwd)
-                r = requests.delete(url, headers=ocsheaders, verify=self.verify)
+                r = session.delete(url, headers=ocsheaders, verify=self.verify)
                 logger.info(f"{self.name} - Share deleted: {r.text}")
         except Exception as error:
             logger.error(f"{self.name} - Error getting {clean_url}: {error}")
@@ -168,7 +169,6 @@ class OcsMakeFederatedShare(threading.Thread):
             logger.info(f"{self.name} - Share url: {url}")
             url = url.replace("$USERNAME$", nodeuser)
             url = url.replace("$PASSWORD$", nodepwd)
-            session = requests.Session()
             payload = {
                 "path": f"{targetfile}",
                 "shareWith": shareWith,
@@ -183,9 +183,9 @@ class OcsMakeFederatedShare(threading.Thread):
                     url, headers=ocsheaders, data=payload, verify=self.verify
                 )
 
-                j = json.loads(r.text)
+                reply = sunetnextcloud.decode_ocs(r, check=False)
                 logger.info(
-                    f"{self.name} - Result of sharing to {clean_url}: {j} - WebDAV List: {client.list(targetfile)} - Payload: {payload}"
+                    f"{self.name} - Result of sharing to {clean_url}: {reply.meta} - WebDAV List: {client.list(targetfile)} - Payload: {payload}"
                 )
             except Exception as error:
                 logger.warning(
@@ -196,16 +196,16 @@ class OcsMakeFederatedShare(threading.Thread):
 
             try:
                 self.TestOcsFederatedShares.assertEqual(
-                    j["ocs"]["meta"]["status"], "ok"
+                    reply.meta["status"], "ok"
                 )
                 self.TestOcsFederatedShares.assertEqual(
-                    j["ocs"]["meta"]["statuscode"], 200
+                    reply.statuscode, 200
                 )
             except Exception as error:
                 logger.warning(
                     f"{self.name} - Sharing result not okay {targetfile}:{error}"
                 )
-                logger.warning(f"{self.name} - {j}")
+                logger.warning(f"{self.name} - {reply.meta}")
                 g_testPassed[fullnode] = False
                 g_testThreadsRunning -= 1
                 return
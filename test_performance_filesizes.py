@@ -10,7 +10,6 @@ import socket
 import sys
 import tempfile
 import threading
-import time
 import unittest
 from datetime import datetime
 from pathlib import Path
@@ -19,6 +18,8 @@ import xmlrunner
 from webdav3.client import Client
 
 import sunetnextcloud
+import sunetperformance
+import sunetwebdav
 
 g_maxCheck = 10
 g_WebDavPerformance_timeout = 3600
@@ -31,6 +32,10 @@ g_filename = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
 g_davPerformanceResults = []
 g_testPassed = {}
 g_testThreadsRunning = 0
+g_seleniumCredentials = ["seleniumuser", "seleniumuserapppassword"]
+# Working set of test_nextcloudcmd_incremental, number of files and size of each file in bytes
+g_syncFiles = int(os.environ.get("NextcloudSyncFiles", 500))
+g_syncFileSize = int(os.environ.get("NextcloudSyncFileSize", 100 * 1024))
 ocsheaders = {"OCS-APIRequest": "true"}
 logger = logging.getLogger(__name__)
 logging.basicConfig(
@@ -133,9 +138,37 @@ def generateTestData():
         filename = f"{str(fileSize)}{fileSizeSuffix}.bin"
         pathname = f"{targetDirectory}/{filename}"
         logger.info(f"Generating file {pathname}")
-        cmd = f"head -c {fileSize}{fileSizeSuffix} /dev/urandom > {pathname}"
-        logger.info(f"Running subprocess {cmd}")
-        os.system(cmd)
+        # Seeded content is identical on every runner, so results and checksums are comparable between runs
+        sizeInBytes = fileSize * {"M": MB, "G": GB}[fileSizeSuffix]
+        sunetwebdav.RandomUploadSource(sizeInBytes, seed=filename).write(pathname)
+
+
+def localSize(directory):
+    # Size of the files a sync of directory uploads, without the hidden sync journal
+    return sum(
+        entry.stat().st_size
+        for entry in os.scandir(directory)
+        if entry.is_file() and not entry.name.startswith(".")
+    )
+
+
+def storeSyncResult(test, node, scenario, result):
+    # Save wall clock time and throughput of a sync and log regressions against earlier runs
+    store = sunetperformance.get_result_store()
+    regressions = [store.add(test, node, f"nextcloudcmd {scenario} time", result.elapsed)]
+    if result.transferred > 0:
+        regressions.append(
+            store.add(
+                test,
+                node,
+                f"nextcloudcmd {scenario} MB/s",
+                result.megabytesPerSecond,
+                lowerIsBetter=False,
+            )
+        )
+    for regression in regressions:
+        if regression is not None:
+            logger.warning(f"Performance regression: {regression}")
 
 
 def decreaseUploadCount():
@@ -143,30 +176,22 @@ def decreaseUploadCount():
     g_testThreadsRunning -= 1
 
 
-def webdavMakeDirectories(client, remote_path):
+def webdavMakeDirectories(directoryCache, remote_path):
     global logger, g_testThreadsRunning
     logger.info(f"Make remote directory: {remote_path}")
-    if client is None:
-        logger.error("No client provided")
+    if directoryCache is None:
+        logger.error("No directory cache provided")
         decreaseUploadCount()
         return
     if remote_path is None:
         logger.error("No target filename provided")
         return
     try:
-        targetfolder = ""
-        directories = remote_path.split("/")
-        base_directory = directories[0]
-        client.mkdir(
-            base_directory
-        )  # mkdir does not fail if the directory already exists
-        for i in range(1, len(directories)):
-            base_directory = f"{base_directory}/{directories[i]}"
-            logger.info(f"Check and make directory: {base_directory}")
-            client.mkdir(base_directory)
-        logger.info(f"Done creating target folder: {remote_path}")
+        # Folders created or listed before for the same node and user cost no request
+        directoryCache.ensure(remote_path)
+        logger.info(f"Done creating target folder: {remote_path} - {directoryCache.report()}")
     except Exception as error:
-        logger.error(f"Error making directory {remote_path} - {targetfolder}:{error}")
+        logger.error(f"Error making directory {remote_path}:{error}")
         return
 
 
@@ -552,8 +577,9 @@ class TestLargeFilePerformance(unittest.TestCase):
     #     logger.info(f'Done')
     #     pass
 
-    def test_nextcloudcmd_home(self):
-        serverTargetFolder = f"selenium-home/{socket.gethostname()}/nextcloudcmd"
+    def nextcloudcmd_sync(self, bucket):
+        # Sync the local test data into bucket with nextcloudcmd and check that the server has the same files
+        serverTargetFolder = f"{bucket}/{socket.gethostname()}/nextcloudcmd"
 
         # Command to run for a basic sync
         # rm /tmp/largefiles/.sync_*
@@ -569,6 +595,7 @@ class TestLargeFilePerformance(unittest.TestCase):
         maxDeletes = 1
 
         drv = sunetnextcloud.TestTarget()
+        drv.prefetch_credentials(g_seleniumCredentials)
         for fullnode in drv.nodestotest:
             with self.subTest(mynode=fullnode):
                 # for fe in range(1,2):
@@ -588,24 +615,23 @@ class TestLargeFilePerformance(unittest.TestCase):
 
                 client = Client(options)
                 # client.session.cookies.set('SERVERID', serverid)
+                session = sunetwebdav.get_webdav_session(drv, fullnode, nodeuser, nodepwd)
+                deleteEngine = sunetwebdav.DeleteEngine(session, url, maxDeletes)
+                directoryCache = sunetwebdav.get_directory_cache(session, url)
 
-                webdavMakeDirectories(client, serverTargetFolder)
-                davElements = client.list(serverTargetFolder)
-                davElements.pop(0)
+                webdavMakeDirectories(directoryCache, serverTargetFolder)
+                entries = sunetwebdav.TreeWalker(session, url).list(serverTargetFolder)
+                directoryCache.add(entries)
+                davElements = [entry.path.strip("/").rsplit("/", 1)[-1] for entry in entries]
 
                 logger.info(f"Precleaning target folder {davElements}")
 
-                for i in range(0, len(davElements), maxDeletes):
-                    x = i
-                    logger.info(f"Batch delete {davElements[x : x + maxDeletes]}")
-                    for element in davElements[x : x + maxDeletes]:
-                        t = threading.Thread(
-                            target=client.clean,
-                            args=[f"{serverTargetFolder}/" + element],
-                        )
-                        t.start()
-                    while threading.active_count() > 1:
-                        time.sleep(0.01)
+                deleteEngine.delete(
+                    [f"{serverTargetFolder}/" + element for element in davElements]
+                )
+                for element in davElements:
+                    directoryCache.forget(f"{serverTargetFolder}/{element}")
+                logger.info(deleteEngine.report())
 
                 logger.info(
                     f"Deleting local temp files in {targetDirectory} before sync"
@@ -619,10 +645,17 @@ class TestLargeFilePerformance(unittest.TestCase):
                 cmd = f"rm {targetDirectory}/*conflicted*"
                 os.system(cmd)
 
-                cmd = f"nextcloudcmd --non-interactive --path {serverTargetFolder} -u ${{NEXTCLOUD_SELENIUM_USER_{fullnode.upper()}_{drv.target.upper()}}} -p ${{NEXTCLOUD_SELENIUM_APP_PASSWORD_{fullnode.upper()}_{drv.target.upper()}}} {targetDirectory} https://{drv.get_node_base_url(fullnode)}"
-                logger.info(f"Executing {cmd}")
-                os.system(cmd)
-                time.sleep(3)
+                syncClient = sunetwebdav.SyncClient(
+                    targetDirectory,
+                    drv.get_endpoints(fullnode).url,
+                    nodeuser,
+                    nodepwd,
+                    serverTargetFolder,
+                )
+                result = syncClient.sync(localSize(targetDirectory))
+                logger.info(f"nextcloudcmd sync to {bucket} on {fullnode}: {result.report()}")
+                storeSyncResult(self._testMethodName, fullnode, "initial", result)
+                self.assertTrue(result.passed, result.report())
 
                 logger.info(
                     f"Deleting local temp files in {targetDirectory} after sync"
@@ -689,327 +722,99 @@ class TestLargeFilePerformance(unittest.TestCase):
                 logger.info(
                     f"Local and remote directories contain the same files {davElements} and {os.listdir(targetDirectory)}"
                 )
-                logger.info(f"Deleting remote files: {davElements}")
 
-                for i in range(0, len(davElements), maxDeletes):
-                    x = i
-                    logger.info(f"Batch delete {davElements[x : x + maxDeletes]}")
-                    for element in davElements[x : x + maxDeletes]:
-                        t = threading.Thread(
-                            target=client.clean,
-                            args=[f"{serverTargetFolder}/" + element],
+                checker = sunetwebdav.IntegrityChecker(session, url)
+                if checker.mode != "none":
+                    for element in localElements:
+                        checker.verify(
+                            f"{serverTargetFolder}/{element}", f"{targetDirectory}/{element}"
                         )
-                        t.start()
-                    while threading.active_count() > 1:
-                        time.sleep(0.01)
-
-                logger.info("Done")
-
-    def test_nextcloudcmd_system(self):
-        serverTargetFolder = f"selenium-system/{socket.gethostname()}/nextcloudcmd"
-
-        # Command to run for a basic sync
-        # rm /tmp/largefiles/.sync_*
-        # nextcloudcmd --non-interactive --silent --path selenium-home/nextcloudcmd -u ${NEXTCLOUD_SELENIUM_USER_SUNET_TEST} -p ${NEXTCLOUD_SELENIUM_APP_PASSWORD_SUNET_TEST} /tmp/largefiles https://sunet.drive.test.sunet.se
-        global logger, g_testThreadsRunning, g_davPerformanceResults
-        g_davPerformanceResults.clear()
-
-        if not checkTestData():
-            logger.warning("File size check failed, regenerating test data")
-            deleteTestData()
-            generateTestData()
-
-        maxDeletes = 1
-
-        drv = sunetnextcloud.TestTarget()
-        for fullnode in drv.nodestotest:
-            with self.subTest(mynode=fullnode):
-                # for fe in range(1,2):
-                # nodebaseurl = drv.get_node_base_url(fullnode)
-                # serverid = f'node{fe}.{nodebaseurl}'
-                logger.info(f"TestID: {fullnode}")
-                nodeuser = drv.get_seleniumuser(fullnode)
-                nodepwd = drv.get_seleniumuserapppassword(fullnode)
-                url = drv.get_webdav_url(fullnode, nodeuser)
-                logger.info(f"URL: {url}")
-                options = {
-                    "webdav_hostname": url,
-                    "webdav_login": nodeuser,
-                    "webdav_password": nodepwd,
-                    "webdav_timeout": g_WebDavPerformance_timeout,
-                }
-
-                client = Client(options)
-                # client.session.cookies.set('SERVERID', serverid)
-
-                webdavMakeDirectories(client, serverTargetFolder)
-                davElements = client.list(serverTargetFolder)
-                davElements.pop(0)
-
-                logger.info(f"Precleaning target folder {davElements}")
-
-                for i in range(0, len(davElements), maxDeletes):
-                    x = i
-                    logger.info(f"Batch delete {davElements[x : x + maxDeletes]}")
-                    for element in davElements[x : x + maxDeletes]:
-                        t = threading.Thread(
-                            target=client.clean,
-                            args=[f"{serverTargetFolder}/" + element],
-                        )
-                        t.start()
-                    while threading.active_count() > 1:
-                        time.sleep(0.01)
-
-                logger.info(
-                    f"Deleting local temp files in {targetDirectory} before sync"
-                )
-                cmd = f"rm {targetDirectory}/.*"
-                os.system(cmd)
-
-                logger.info(
-                    f"Deleting local conflicted copies in {targetDirectory} before sync"
-                )
-                cmd = f"rm {targetDirectory}/*conflicted*"
-                os.system(cmd)
-
-                cmd = f"nextcloudcmd --non-interactive --path {serverTargetFolder} -u ${{NEXTCLOUD_SELENIUM_USER_{fullnode.upper()}_{drv.target.upper()}}} -p ${{NEXTCLOUD_SELENIUM_APP_PASSWORD_{fullnode.upper()}_{drv.target.upper()}}} {targetDirectory} https://{drv.get_node_base_url(fullnode)}"
-                logger.info(f"Executing {cmd}")
-                os.system(cmd)
-                time.sleep(3)
-
-                logger.info(
-                    f"Deleting local temp files in {targetDirectory} after sync"
-                )
-                cmd = f"rm {targetDirectory}/.*"
-                os.system(cmd)
-
-                logger.info(
-                    f"Deleting local conflicted copies in {targetDirectory} after sync"
-                )
-                cmd = f"rm {targetDirectory}/*conflicted*"
-                os.system(cmd)
-
-                # cmd = ['nextcloudcmd','--non-interactive','--path',serverTargetFolder,'-u',nodeuser,'-p',nodepwd,targetDirectory,f'https://{drv.get_node_base_url(fullnode)}']
-
-                # print(cmd)
-
-                # process = subprocess.Popen(
-                #     cmd,
-                #     encoding='utf-8',
-                #     stdin=subprocess.PIPE,
-                #     stdout=subprocess.PIPE,
-                # )
-
-                # while(True):
-                #     returncode = process.poll()
-                #     if returncode is None:
-                #         # You describe what is going on.
-                #         # You can describe the process every time the time elapses as needed.
-                #         # print("running process")
-                #         time.sleep(0.01)
-                #         data = process.stdout
-                #         if data:
-                #             # If there is any response, describe it here.
-                #             # You need to use readline () or readlines () properly, depending on how the process responds.
-                #             msg_line = data.readline()
-                #             print(msg_line)
-                #         err = process.stderr
-                #         if err:
-                #             # If there is any error response, describe it here.
-                #             msg_line = err.readline()
-                #             print(msg_line)
-                #     else:
-                #         print(returncode)
-                #         break
-
-                # # Describes the processing after the process ends.
-                # logger.info("Nextcloudcmd terminated")
-
-                davElements = client.list(serverTargetFolder)
-                davElements.pop(0)
-                davElements.sort()
-
-                localElements = [f for f in os.listdir(targetDirectory) if not f.startswith('.')] # no hidden files
-                localElements.sort()
-                logger.info(
-                    f"Checking davElements and localElements: {davElements} - {localElements}"
-                )
-                self.assertEqual(len(davElements), len(localElements))
-                # Compare the elements
-                for index in range(0, len(davElements)):
-                    self.assertEqual(davElements[index], localElements[index])
-
-                logger.info(
-                    f"Local and remote directories contain the same files {davElements} and {os.listdir(targetDirectory)}"
-                )
+                    self.assertEqual(checker.failed, [])
                 logger.info(f"Deleting remote files: {davElements}")
 
-                for i in range(0, len(davElements), maxDeletes):
-                    x = i
-                    logger.info(f"Batch delete {davElements[x : x + maxDeletes]}")
-                    for element in davElements[x : x + maxDeletes]:
-                        t = threading.Thread(
-                            target=client.clean,
-                            args=[f"{serverTargetFolder}/" + element],
-                        )
-                        t.start()
-                    while threading.active_count() > 1:
-                        time.sleep(0.01)
+                deleteEngine.delete(
+                    [f"{serverTargetFolder}/" + element for element in davElements]
+                )
+                for element in davElements:
+                    directoryCache.forget(f"{serverTargetFolder}/{element}")
+                logger.info(deleteEngine.report())
 
                 logger.info("Done")
 
-    def test_nextcloudcmd_personal(self):
-        serverTargetFolder = f"selenium-home/{socket.gethostname()}/nextcloudcmd"
-
-        # Command to run for a basic sync
-        # rm /tmp/largefiles/.sync_*
-        # nextcloudcmd --non-interactive --silent --path selenium-home/nextcloudcmd -u ${NEXTCLOUD_SELENIUM_USER_SUNET_TEST} -p ${NEXTCLOUD_SELENIUM_APP_PASSWORD_SUNET_TEST} /tmp/largefiles https://sunet.drive.test.sunet.se
-        global logger, g_testThreadsRunning, g_davPerformanceResults
-        g_davPerformanceResults.clear()
-
-        if not checkTestData():
-            logger.warning("File size check failed, regenerating test data")
-            deleteTestData()
-            generateTestData()
-
-        maxDeletes = 1
+    def test_nextcloudcmd_incremental(self):
+        # Initial sync of a working set of small files, then re-syncs without changes,
+        # with 1% of the files changed and after renaming every file
+        serverTargetFolder = f"selenium-home/{socket.gethostname()}/nextcloudcmd-incremental"
+        localDirectory = f"{targetDirectory}-incremental"
+        changedFiles = max(1, g_syncFiles // 100)
 
         drv = sunetnextcloud.TestTarget()
+        drv.prefetch_credentials(g_seleniumCredentials)
         for fullnode in drv.nodestotest:
             with self.subTest(mynode=fullnode):
-                # for fe in range(1,2):
-                # nodebaseurl = drv.get_node_base_url(fullnode)
-                # serverid = f'node{fe}.{nodebaseurl}'
-                logger.info(f"TestID: {fullnode}")
                 nodeuser = drv.get_seleniumuser(fullnode)
                 nodepwd = drv.get_seleniumuserapppassword(fullnode)
                 url = drv.get_webdav_url(fullnode, nodeuser)
-                logger.info(f"URL: {url}")
-                options = {
-                    "webdav_hostname": url,
-                    "webdav_login": nodeuser,
-                    "webdav_password": nodepwd,
-                    "webdav_timeout": g_WebDavPerformance_timeout,
-                }
-
-                client = Client(options)
-                # client.session.cookies.set('SERVERID', serverid)
-
-                webdavMakeDirectories(client, serverTargetFolder)
-                davElements = client.list(serverTargetFolder)
-                davElements.pop(0)
-
-                logger.info(f"Precleaning target folder {davElements}")
-
-                for i in range(0, len(davElements), maxDeletes):
-                    x = i
-                    logger.info(f"Batch delete {davElements[x : x + maxDeletes]}")
-                    for element in davElements[x : x + maxDeletes]:
-                        t = threading.Thread(
-                            target=client.clean,
-                            args=[f"{serverTargetFolder}/" + element],
-                        )
-                        t.start()
-                    while threading.active_count() > 1:
-                        time.sleep(0.01)
-
-                logger.info(
-                    f"Deleting local temp files in {targetDirectory} before sync"
-                )
-                cmd = f"rm {targetDirectory}/.*"
-                os.system(cmd)
-
-                logger.info(
-                    f"Deleting local conflicted copies in {targetDirectory} before sync"
-                )
-                cmd = f"rm {targetDirectory}/*conflicted*"
-                os.system(cmd)
-
-                cmd = f"nextcloudcmd --non-interactive --path {serverTargetFolder} -u ${{NEXTCLOUD_SELENIUM_USER_{fullnode.upper()}_{drv.target.upper()}}} -p ${{NEXTCLOUD_SELENIUM_APP_PASSWORD_{fullnode.upper()}_{drv.target.upper()}}} {targetDirectory} https://{drv.get_node_base_url(fullnode)}"
-                logger.info(f"Executing {cmd}")
-                os.system(cmd)
-                time.sleep(3)
-
-                logger.info(
-                    f"Deleting local temp files in {targetDirectory} after sync"
+                session = sunetwebdav.get_webdav_session(drv, fullnode, nodeuser, nodepwd)
+                deleteEngine = sunetwebdav.DeleteEngine(session, url)
+                directoryCache = sunetwebdav.get_directory_cache(session, url)
+                deleteEngine.delete([serverTargetFolder])
+                directoryCache.forget(serverTargetFolder)
+                webdavMakeDirectories(directoryCache, serverTargetFolder)
+
+                shutil.rmtree(localDirectory, ignore_errors=True)
+                Path(localDirectory).mkdir(parents=True)
+                names = [f"{index}.bin" for index in range(g_syncFiles)]
+                for name in names:
+                    sunetwebdav.RandomUploadSource(g_syncFileSize, seed=f"{fullnode}/{name}").write(
+                        f"{localDirectory}/{name}"
+                    )
+
+                syncClient = sunetwebdav.SyncClient(
+                    localDirectory,
+                    drv.get_endpoints(fullnode).url,
+                    nodeuser,
+                    nodepwd,
+                    serverTargetFolder,
                 )
-                cmd = f"rm {targetDirectory}/.*"
-                os.system(cmd)
+                results = []
+                results.append(("initial", syncClient.sync(g_syncFiles * g_syncFileSize)))
+                results.append(("nochange", syncClient.sync()))
+
+                for name in names[:changedFiles]:
+                    sunetwebdav.RandomUploadSource(g_syncFileSize, seed=f"{fullnode}/{name}/changed").write(
+                        f"{localDirectory}/{name}"
+                    )
+                results.append(("changed", syncClient.sync(changedFiles * g_syncFileSize)))
+
+                for name in names:
+                    os.rename(f"{localDirectory}/{name}", f"{localDirectory}/renamed-{name}")
+                results.append(("rename", syncClient.sync()))
+
+                for scenario, result in results:
+                    logger.info(f"{fullnode} - {scenario : <10}{result.report()}")
+                    storeSyncResult(self._testMethodName, fullnode, scenario, result)
+
+                remoteNames = [
+                    entry.path.rsplit("/", 1)[-1]
+                    for entry in sunetwebdav.TreeWalker(session, url).list(serverTargetFolder)
+                ]
+                deleteEngine.delete([serverTargetFolder])
+                directoryCache.forget(serverTargetFolder)
+                shutil.rmtree(localDirectory, ignore_errors=True)
+
+                for scenario, result in results:
+                    self.assertTrue(result.passed, f"{scenario}: {result.report()}")
+                self.assertEqual(sorted(remoteNames), sorted(f"renamed-{name}" for name in names))
 
-                logger.info(
-                    f"Deleting local conflicted copies in {targetDirectory} after sync"
-                )
-                cmd = f"rm {targetDirectory}/*conflicted*"
-                os.system(cmd)
-
-                # cmd = ['nextcloudcmd','--non-interactive','--path',serverTargetFolder,'-u',nodeuser,'-p',nodepwd,targetDirectory,f'https://{drv.get_node_base_url(fullnode)}']
-
-                # print(cmd)
-
-                # process = subprocess.Popen(
-                #     cmd,
-                #     encoding='utf-8',
-                #     stdin=subprocess.PIPE,
-                #     stdout=subprocess.PIPE,
-                # )
-
-                # while(True):
-                #     returncode = process.poll()
-                #     if returncode is None:
-                #         # You describe what is going on.
-                #         # You can describe the process every time the time elapses as needed.
-                #         # print("running process")
-                #         time.sleep(0.01)
-                #         data = process.stdout
-                #         if data:
-                #             # If there is any response, describe it here.
-                #             # You need to use readline () or readlines () properly, depending on how the process responds.
-                #             msg_line = data.readline()
-                #             print(msg_line)
-                #         err = process.stderr
-                #         if err:
-                #             # If there is any error response, describe it here.
-                #             msg_line = err.readline()
-                #             print(msg_line)
-                #     else:
-                #         print(returncode)
-                #         break
-
-                # # Describes the processing after the process ends.
-                # logger.info("Nextcloudcmd terminated")
-
-                davElements = client.list(serverTargetFolder)
-                davElements.pop(0)
-                davElements.sort()
-
-                localElements = [f for f in os.listdir(targetDirectory) if not f.startswith('.')] # no hidden files
-                localElements.sort()
-                logger.info(
-                    f"Checking davElements and localElements: {davElements} - {localElements}"
-                )
-                self.assertEqual(len(davElements), len(localElements))
-                # Compare the elements
-                for index in range(0, len(davElements)):
-                    self.assertEqual(davElements[index], localElements[index])
-
-                logger.info(
-                    f"Local and remote directories contain the same files {davElements} and {os.listdir(targetDirectory)}"
-                )
-                logger.info(f"Deleting remote files: {davElements}")
+    def test_nextcloudcmd_home(self):
+        self.nextcloudcmd_sync("selenium-home")
 
-                for i in range(0, len(davElements), maxDeletes):
-                    x = i
-                    logger.info(f"Batch delete {davElements[x : x + maxDeletes]}")
-                    for element in davElements[x : x + maxDeletes]:
-                        t = threading.Thread(
-                            target=client.clean,
-                            args=[f"{serverTargetFolder}/" + element],
-                        )
-                        t.start()
-                    while threading.active_count() > 1:
-                        time.sleep(0.01)
+    def test_nextcloudcmd_system(self):
+        self.nextcloudcmd_sync(g_systemBucket)
 
-                logger.info("Done")
+    def test_nextcloudcmd_personal(self):
+        self.nextcloudcmd_sync(g_personalBucket)
 
 
 if __name__ == "__main__":
@@ -2,12 +2,12 @@
 Author: Richard Freitag <freitag@sunet.se>
 """
 
-import json
 import logging
 import os
 import threading
 import time
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 import HtmlTestRunner
@@ -19,8 +19,8 @@ import xmlrunner
 import random
 
 import sunetnextcloud
+import sunetperformance
 
-nodes = 1
 users = 10
 offset = 0
 createusers = True
@@ -31,6 +31,7 @@ calls = 100
 
 g_testThreadsRunning = 0
 g_ocsPerformanceResults = []
+g_ocsHistogram = sunetperformance.LatencyHistogram()
 g_testPassed = {}
 
 g_requestTimeout = os.environ.get("NextcloudRequestTimeout")
@@ -39,7 +40,25 @@ if g_requestTimeout is None:
 else:
     g_requestTimeout = int(g_requestTimeout)
 
-g_userCooldown = 3      # Seconds to cool down between create, deactivate, delete
+# The user lifecycle test runs users through these stages, each with its own number of workers and
+# rate limit in users per second, a rate of 0 does not limit the stage
+g_provisionUsers = int(os.environ.get("NextcloudOcsProvisionUsers", users))
+g_provisionStages = [
+    stage
+    for stage, enabled in [("create", createusers), ("check", checkusers), ("disable", disableusers), ("delete", deleteusers)]
+    if enabled
+]
+g_provisionConcurrency = {
+    stage: int(os.environ.get(f"NextcloudOcsProvision{stage.capitalize()}Concurrency", 4)) for stage in g_provisionStages
+}
+# Only failed connections are retried, a 5xx reply counts against its stage instead of hiding in the latency
+g_provisionRetries = Retry(total=2, connect=2, read=0, status=0, backoff_factor=0.1, status_forcelist=(), raise_on_status=False)
+# OCS status codes of a user that does not exist, 101 for OCS v1 and 998 for v2
+g_userNotFound = [101, 404, 998]
+g_provisionRate = {
+    stage: float(os.environ.get(f"NextcloudOcsProvision{stage.capitalize()}Rate", 0)) for stage in g_provisionStages
+}
+g_ocsCredentials = ["ocsuser", "ocsuserapppassword"]
 
 g_maxRandSleep = os.environ.get("NextcloudRandSleep")
 if g_maxRandSleep is None:
@@ -63,157 +82,118 @@ logging.basicConfig(
 )
 
 
-class NodeOcsUserLifecycle(threading.Thread):
-    def __init__(self, name):
-        threading.Thread.__init__(self)
-        self.name = name
-
-    def run(self):
-        global logger, g_testPassed, g_testThreadsRunning, g_ocsPerformanceResults, g_maxRandSleep
-        g_testThreadsRunning += 1
-
-        start_delay = random.randint(0,g_maxRandSleep)
-        logger.info(f"NodeOcsUserLifecycle thread for node {self.name} starting in {start_delay} seconds")
-        time.sleep(start_delay)
-        drv = sunetnextcloud.TestTarget()
-        fullnode = self.name
-        if drv.is_multinode(fullnode):
-            testid = f'{fullnode} - {drv.get_multinode(fullnode)}'
-        else:
-            testid = fullnode
-
-        url = drv.get_users_url(fullnode)
-        # logger.info(self._testMethodName, url)
-        startTime = datetime.now()
-        coolDownTime = 0
-
-        for nodeindex in range(1, nodes + 1):
-            logger.info(f"Node: {str(nodeindex)}")
-
-            try:
-                nodeuser = drv.get_ocsuser(fullnode)
-                nodeapppwd = drv.get_ocsuserapppassword(fullnode)
-                nodepwd = drv.get_ocsuserpassword(fullnode)
-                session = requests.Session()
-                retries = Retry(total=5, backoff_factor=0.1, status_forcelist=[500, 502, 503, 504])
-                session.mount('http://', HTTPAdapter(max_retries=retries))
-                session.mount('https://', HTTPAdapter(max_retries=retries))
-
-            except Exception as error:
-                logger.error(f"Error getting credentials for {self.name}:{error}")
-                g_testThreadsRunning -= 1
+def store_histogram(test, node, info, histogram, frontend=None):
+    """Save the percentiles of a block of calls in the result store and log regressions against earlier runs"""
+    version = drv.expectedResults[drv.target]["status"]["version"][-1]
+    regressions = sunetperformance.get_result_store().add_histogram(
+        test, node, info, histogram, frontend, version
+    )
+    for regression in regressions:
+        logger.warning(f"Performance regression: {regression}")
+
+
+class UserProvisioningPipeline(object):
+    """Create, check, disable and delete users in a pipeline of stages
+    Every stage has its own pool of workers and rate limiter and a user moves on to the next stage as soon as
+    the previous stage is done with it, so all stages run at the same time. Latency is recorded per stage.
+    A user that fails a stage leaves the pipeline and is deleted by cleanup, also after a failed create,
+    which the server may have carried out before the client gave up.
+    """
+
+    def __init__(self, session, endpoints, stages=None, concurrency=None, rates=None):
+        self.session = session
+        self.endpoints = endpoints
+        self.stages = stages if stages is not None else g_provisionStages
+        self.concurrency = concurrency if concurrency is not None else g_provisionConcurrency
+        rates = rates if rates is not None else g_provisionRate
+        self.limiters = {stage: sunetperformance.RateLimiter(rates.get(stage)) for stage in self.stages}
+        self.histograms = {stage: sunetperformance.LatencyHistogram() for stage in self.stages}
+        self.errors = {stage: 0 for stage in self.stages}
+        self.windows = {}
+        self.failed = []
+        self.completed = 0
+        self.elapsed = 0.0
+        self.executors = []
+        self.lock = threading.Lock()
+
+    def request(self, stage, user):
+        if stage == "create":
+            data = {"userid": user, "password": sunetnextcloud.Helper().get_random_string(12)}
+            return self.session.post(self.endpoints.users, headers=ocsheaders, data=data, timeout=g_requestTimeout)
+        if stage == "check":
+            return self.session.get(self.endpoints.user(user), headers=ocsheaders, timeout=g_requestTimeout)
+        if stage == "disable":
+            return self.session.put(self.endpoints.disable_user(user), headers=ocsheaders, timeout=g_requestTimeout)
+        if stage == "delete":
+            return self.session.delete(self.endpoints.user(user), headers=ocsheaders, timeout=g_requestTimeout)
+        raise Exception(f"Unknown provisioning stage {stage}")
+
+    def run_stage(self, index, user):
+        stage = self.stages[index]
+        self.limiters[stage].wait()
+        startTime = time.perf_counter()
+        failure = None
+        try:
+            sunetnextcloud.decode_ocs(self.request(stage, user))
+        except Exception as error:
+            failure = f"{error}"
+        endTime = time.perf_counter()
+        self.histograms[stage].record(endTime - startTime)
+        with self.lock:
+            first, last = self.windows.get(stage, (startTime, endTime))
+            self.windows[stage] = (min(first, startTime), max(last, endTime))
+            if failure is not None:
+                logger.error(f"{stage} of {user} failed: {failure}")
+                self.errors[stage] += 1
+                self.failed.append(user)
                 return
-
-            logger.info(f"Confirm app password for {nodeuser}")
+            if index + 1 == len(self.stages):
+                self.completed += 1
+                return
+        self.executors[index + 1].submit(self.run_stage, index + 1, user)
+
+    def run(self, usernames):
+        """Send usernames through all stages, returns the number of users that passed every stage"""
+        self.executors = [ThreadPoolExecutor(max_workers=self.concurrency[stage]) for stage in self.stages]
+        startTime = time.perf_counter()
+        for user in usernames:
+            self.executors[0].submit(self.run_stage, 0, user)
+        # A stage only hands users to later stages, so shutting down in order waits for every user
+        for executor in self.executors:
+            executor.shutdown(wait=True)
+        self.elapsed = time.perf_counter() - startTime
+        return self.completed
+
+    def cleanup(self):
+        """Delete the users that failed a stage, users that do not exist are skipped"""
+        for user in self.failed:
             try:
-                rawurl = drv.get_confirm_apppassword_url(fullnode)
-                logger.info(f"Confirm app password using {rawurl}")
-                url = rawurl.replace("$USERNAME$", nodeuser)
-                url = url.replace("$PASSWORD$", nodeapppwd)
-
-                data = {
-                    "password": nodepwd  # Replace with the user's password
-                }
-
-                r = session.put(
-                    url,
-                    headers=ocsheaders,
-                    json=data,
-                    timeout=g_requestTimeout,
-                    verify=True,
-                )
-                logger.info(r.text)
+                r = self.session.delete(self.endpoints.user(user), headers=ocsheaders, timeout=g_requestTimeout)
+                reply = sunetnextcloud.decode_ocs(r, check=False)
+                if reply.status == 404 or reply.statuscode in g_userNotFound:
+                    continue
+                if reply.meta.get("status") != "ok":
+                    raise Exception(f"OCS status {reply.statuscode}")
             except Exception as error:
-                logger.error(f"Error confirming app password: {error}")
-                g_testPassed[testid] = False
-                g_testThreadsRunning -= 1
-                return
-
-            for userindex in range(offset, offset + users + 1):
-                try:
-                    logger.info(f"{drv.target} - User: {str(userindex)}")
-                    usersuffix = g_userprefix + "_" + str(nodeindex) + "_" + str(userindex)
-                    cliuser = "__performance_user_" + usersuffix + "_" + fullnode
-
-                    if createusers:
-                        rawurl = drv.get_users_url(fullnode)
-                        url = rawurl.replace("$USERNAME$", nodeuser)
-                        url = url.replace("$PASSWORD$", nodeapppwd)
-                        clipwd = sunetnextcloud.Helper().get_random_string(12)
-
-                        data = {"userid": cliuser, "password": clipwd}
-
-                        r = session.post(url, headers=ocsheaders, data=data)
-                        j = json.loads(r.text)
-                        logger.info(j["ocs"]["meta"]["status"])
-                        time.sleep(g_userCooldown)
-                        coolDownTime += g_userCooldown
-
-                    if checkusers:
-                        logger.info(f"Check user info {cliuser}")
-                        userinfourl = drv.get_user_url(fullnode, cliuser)
-                        userinfourl = userinfourl.replace("$USERNAME$", nodeuser)
-                        userinfourl = userinfourl.replace("$PASSWORD$", nodeapppwd)
-                        r = session.get(userinfourl, headers=ocsheaders)
-                        j = json.loads(r.text)
-                        logger.info(j["ocs"]["meta"]["status"])
-                        if "forcemfa" not in j["ocs"]["data"]["groups"]:
-                            logger.warning(
-                                f"focemfa not in user groups (yet?), sleeping for a second"
-                            )
-                            time.sleep(1)
-                        time.sleep(g_userCooldown)
-                        coolDownTime += g_userCooldown
-
-                    if disableusers:
-                        logger.info("Disable cli user " + cliuser)
-                        disableuserurl = drv.get_disable_user_url(fullnode, cliuser)
-                        disableuserurl = disableuserurl.replace("$USERNAME$", nodeuser)
-                        disableuserurl = disableuserurl.replace(
-                            "$PASSWORD$", nodeapppwd
-                        )
-                        r = session.put(disableuserurl, headers=ocsheaders)
-                        j = json.loads(r.text)
-                        logger.info(j["ocs"]["meta"]["status"])
-                        time.sleep(g_userCooldown)
-                        coolDownTime += g_userCooldown
-
-                    if deleteusers:
-                        # For deleting users, we cool down before any action
-                        time.sleep(g_userCooldown)
-                        coolDownTime += g_userCooldown
-
-                        logger.info("Delete cli user " + cliuser)
-                        userurl = drv.get_user_url(fullnode, cliuser)
-                        userurl = userurl.replace("$USERNAME$", nodeuser)
-                        userurl = userurl.replace("$PASSWORD$", nodeapppwd)
-                        r = session.delete(userurl, headers=ocsheaders)
-                        j = json.loads(r.text)
-                        logger.info(j["ocs"]["meta"]["status"])
-
-                except Exception as error:
-                    if r is not None:
-                        logger.error(
-                            f"Unable to test user lifecycle for {fullnode}: {error} \n {r.text}"
-                        )
-                    else:
-                        logger.error(
-                            f"Unable to test user lifecycle for {fullnode}: {error}"
-                        )
-                    g_testPassed[testid] = False
-                    g_testThreadsRunning -= 1
-                    return
-        totalTime = (datetime.now() - startTime).total_seconds() - coolDownTime
-        g_ocsPerformanceResults.append(
-            f"{fullnode:<15} - Handling {nodes * users} users took {totalTime:<3.1f}s"
-        )
-
-        g_testPassed[testid] = True
-        g_testThreadsRunning -= 1
-        logger.info(
-            f"NodeOcsUserLifecycle thread done for node {self.name}, test passed: {g_testPassed[testid]}, remaining: {g_testThreadsRunning}"
-        )
-        return
+                logger.error(f"Unable to delete {user}: {error}")
+
+    def throughput(self, stage):
+        """Users per second handled by stage while it was active"""
+        first, last = self.windows.get(stage, (0.0, 0.0))
+        if last <= first:
+            return 0.0
+        return self.histograms[stage].count / (last - first)
+
+    def report(self):
+        """Summary of the last run, one line per stage"""
+        rate = self.completed / self.elapsed if self.elapsed > 0 else 0.0
+        lines = [f"{self.completed} users through {', '.join(self.stages)} in {self.elapsed:.1f}s - {rate:.2f} users/s"]
+        for stage in self.stages:
+            lines.append(
+                f"   {stage:<8}{self.concurrency[stage]:>3} workers - {self.throughput(stage):.2f} users/s - "
+                f"{self.errors[stage]} failed - {self.histograms[stage].summary()}"
+            )
+        return "\n".join(lines)
 
 
 class NodeOcsUserPerformance(threading.Thread):
@@ -241,43 +221,51 @@ class NodeOcsUserPerformance(threading.Thread):
             else:
                 testid = fullnode
 
-            nodeuser = drv.get_ocsuser(fullnode)
-            nodepwd = drv.get_ocsuserapppassword(fullnode)
+            auth = drv.get_ocs_auth(fullnode)
             g_testPassed[testid] = False
             logger.info(
                 f"Setting passed for {fullnode} to {g_testPassed.get(testid)}"
             )
 
-            url = drv.get_status_url(fullnode)
-            nodebaseurl = drv.get_node_base_url(fullnode)
-            url = drv.get_users_url(fullnode)
-            url = url.replace("$USERNAME$", nodeuser)
-            url = url.replace("$PASSWORD$", nodepwd)
+            endpoints = drv.get_endpoints(fullnode)
+            nodebaseurl = endpoints.host
+            url = endpoints.users
             message = f"{calls} calls to {nodebaseurl:<30}"
+            nodeHistogram = sunetperformance.LatencyHistogram()
 
             if self.newSession:
                 info = "Main URL without cookie, new session"
                 totalTime = 0.0
+                histogram = sunetperformance.LatencyHistogram()
                 for call in range(0, calls):
                     s = requests.Session()
                     retries = Retry(total=5, backoff_factor=0.1, status_forcelist=[500, 502, 503, 504])
                     s.mount('http://', HTTPAdapter(max_retries=retries))
                     s.mount('https://', HTTPAdapter(max_retries=retries))
                     s.headers.update(ocsheaders)
+                    s.auth = auth
                     startTime = datetime.now()
                     s.get(url, headers=ocsheaders)
-                    totalTime += (datetime.now() - startTime).total_seconds()
+                    elapsed = (datetime.now() - startTime).total_seconds()
+                    totalTime += elapsed
+                    histogram.record(elapsed)
                     # logger.info(f'SERVERID cookie: {s.cookies.get_dict()["SERVERID"]}')
 
                 message += f" - {totalTime:<3.1f}s"
                 logger.info(
-                    f"{calls} requests to {nodebaseurl} took {totalTime:<3.1f}s - {info}"
+                    f"{calls} requests to {nodebaseurl} took {totalTime:<3.1f}s - {info} - {histogram.summary()}"
+                )
+                nodeHistogram.merge(histogram)
+                store_histogram(
+                    self.TestOcsCalls._testMethodName, fullnode, info, histogram
                 )
             else:
                 info = "Main URL without cookie, same session"
                 totalTime = 0.0
+                histogram = sunetperformance.LatencyHistogram()
                 s = requests.Session()
                 s.headers.update(ocsheaders)
+                s.auth = auth
                 retries = Retry(total=5, backoff_factor=0.1, status_forcelist=[500, 502, 503, 504])
                 s.mount('http://', HTTPAdapter(max_retries=retries))
                 s.mount('https://', HTTPAdapter(max_retries=retries))
@@ -285,7 +273,9 @@ class NodeOcsUserPerformance(threading.Thread):
                 for call in range(0, calls):
                     startTime = datetime.now()
                     s.get(url, headers=ocsheaders)
-                    totalTime += (datetime.now() - startTime).total_seconds()
+                    elapsed = (datetime.now() - startTime).total_seconds()
+                    totalTime += elapsed
+                    histogram.record(elapsed)
                     logger.info(f"List all cookies {s.cookies.get_dict()}")
                     if call == 0:
                         lastServerId = s.cookies.get_dict()["SERVERID"]
@@ -298,34 +288,48 @@ class NodeOcsUserPerformance(threading.Thread):
 
                 message += f" - {totalTime:<3.1f}s"
                 logger.info(
-                    f"{calls} requests to {nodebaseurl} took {totalTime:<3.1f}s - {info}"
+                    f"{calls} requests to {nodebaseurl} took {totalTime:<3.1f}s - {info} - {histogram.summary()}"
+                )
+                nodeHistogram.merge(histogram)
+                store_histogram(
+                    self.TestOcsCalls._testMethodName, fullnode, info, histogram
                 )
 
             if self.newSession:
                 info = "Main URL with cookie, new session"
                 if isMultinode:
                     totalTime = 0.0
+                    histogram = sunetperformance.LatencyHistogram()
                     serverid = f"{drv.get_multinode(fullnode)}.{drv.get_base_url()}"
                     for call in range(0, calls):
                         s = requests.Session()
                         s.headers.update(ocsheaders)
+                        s.auth = auth
                         s.cookies.set("SERVERID", serverid)
                         retries = Retry(total=5, backoff_factor=0.1, status_forcelist=[500, 502, 503, 504])
                         s.mount('http://', HTTPAdapter(max_retries=retries))
                         s.mount('https://', HTTPAdapter(max_retries=retries))
                         startTime = datetime.now()
                         s.get(url, headers=ocsheaders)
-                        totalTime += (datetime.now() - startTime).total_seconds()
+                        elapsed = (datetime.now() - startTime).total_seconds()
+                        totalTime += elapsed
+                        histogram.record(elapsed)
                     message += f" - {totalTime:<3.1f}s"
                     logger.info(
-                        f"{calls} requests to {serverid} took {totalTime:<3.1f}s - {info}"
+                        f"{calls} requests to {serverid} took {totalTime:<3.1f}s - {info} - {histogram.summary()}"
+                    )
+                    nodeHistogram.merge(histogram)
+                    store_histogram(
+                        self.TestOcsCalls._testMethodName, fullnode, info, histogram, serverid
                     )
                 else:
                     for fe in range(1, 4):
                         totalTime = 0.0
+                        histogram = sunetperformance.LatencyHistogram()
                         for call in range(0, calls):
                             s = requests.Session()
                             s.headers.update(ocsheaders)
+                            s.auth = auth
                             serverid = f"node{fe}.{nodebaseurl}"
                             s.cookies.set("SERVERID", serverid)
                             retries = Retry(total=5, backoff_factor=0.1, status_forcelist=[500, 502, 503, 504])
@@ -333,10 +337,16 @@ class NodeOcsUserPerformance(threading.Thread):
                             s.mount('https://', HTTPAdapter(max_retries=retries))
                             startTime = datetime.now()
                             s.get(url, headers=ocsheaders)
-                            totalTime += (datetime.now() - startTime).total_seconds()
+                            elapsed = (datetime.now() - startTime).total_seconds()
+                            totalTime += elapsed
+                            histogram.record(elapsed)
                         message += f" - {totalTime:<3.1f}s"
                         logger.info(
-                            f"{calls} requests to {serverid} took {totalTime:<3.1f}s - {info}"
+                            f"{calls} requests to {serverid} took {totalTime:<3.1f}s - {info} - {histogram.summary()}"
+                        )
+                        nodeHistogram.merge(histogram)
+                        store_histogram(
+                            self.TestOcsCalls._testMethodName, fullnode, info, histogram, serverid
                         )
             else:
                 info = "Main URL with cookie, same session"
@@ -344,8 +354,10 @@ class NodeOcsUserPerformance(threading.Thread):
                     serverid = f"{drv.get_multinode(fullnode)}.{drv.get_base_url()}"
                     logger.info(f"Test multinode {fullnode} on {serverid}")
                     totalTime = 0.0
+                    histogram = sunetperformance.LatencyHistogram()
                     s = requests.Session()
                     s.headers.update(ocsheaders)
+                    s.auth = auth
                     s.cookies.set("SERVERID", serverid)
                     retries = Retry(total=5, backoff_factor=0.1, status_forcelist=[500, 502, 503, 504])
                     s.mount('http://', HTTPAdapter(max_retries=retries))
@@ -353,16 +365,24 @@ class NodeOcsUserPerformance(threading.Thread):
                     for call in range(0, calls):
                         startTime = datetime.now()
                         s.get(url, headers=ocsheaders)
-                        totalTime += (datetime.now() - startTime).total_seconds()
+                        elapsed = (datetime.now() - startTime).total_seconds()
+                        totalTime += elapsed
+                        histogram.record(elapsed)
                     message += f" - {totalTime:<3.1f}s"
                     logger.info(
-                        f"{calls} requests to {serverid} took {totalTime:<3.1f}s - {info}"
+                        f"{calls} requests to {serverid} took {totalTime:<3.1f}s - {info} - {histogram.summary()}"
+                    )
+                    nodeHistogram.merge(histogram)
+                    store_histogram(
+                        self.TestOcsCalls._testMethodName, fullnode, info, histogram, serverid
                     )
                 else:
                     for fe in range(1, 4):
                         totalTime = 0.0
+                        histogram = sunetperformance.LatencyHistogram()
                         s = requests.Session()
                         s.headers.update(ocsheaders)
+                        s.auth = auth
                         retries = Retry(total=5, backoff_factor=0.1, status_forcelist=[500, 502, 503, 504])
                         s.mount('http://', HTTPAdapter(max_retries=retries))
                         s.mount('https://', HTTPAdapter(max_retries=retries))
@@ -371,10 +391,16 @@ class NodeOcsUserPerformance(threading.Thread):
                             s.cookies.set("SERVERID", serverid)
                             startTime = datetime.now()
                             s.get(url, headers=ocsheaders)
-                            totalTime += (datetime.now() - startTime).total_seconds()
+                            elapsed = (datetime.now() - startTime).total_seconds()
+                            totalTime += elapsed
+                            histogram.record(elapsed)
                         message += f" - {totalTime:<3.1f}s"
                         logger.info(
-                            f"{calls} requests to {serverid} took {totalTime:<3.1f}s - {info}"
+                            f"{calls} requests to {serverid} took {totalTime:<3.1f}s - {info} - {histogram.summary()}"
+                        )
+                        nodeHistogram.merge(histogram)
+                        store_histogram(
+                            self.TestOcsCalls._testMethodName, fullnode, info, histogram, serverid
                         )
 
             if self.newSession:
@@ -382,48 +408,58 @@ class NodeOcsUserPerformance(threading.Thread):
                 if isMultinode:
                     info = "Multinode url, new session"
                     totalTime = 0.0
-                    url = drv.get_add_user_multinode_url(fullnode)
+                    histogram = sunetperformance.LatencyHistogram()
+                    url = endpoints.multinodeusers
                     logger.info(f"Test direct call to {fullnode} - {url}")
 
-                    url = url.replace("$USERNAME$", nodeuser)
-                    url = url.replace("$PASSWORD$", nodepwd)
-
                     for call in range(0, calls):
                         s = requests.Session()
                         s.headers.update(ocsheaders)
+                        s.auth = auth
                         retries = Retry(total=5, backoff_factor=0.1, status_forcelist=[500, 502, 503, 504])
                         s.mount('http://', HTTPAdapter(max_retries=retries))
                         s.mount('https://', HTTPAdapter(max_retries=retries))
                         startTime = datetime.now()
                         s.get(url, headers=ocsheaders, verify=False)
-                        totalTime += (datetime.now() - startTime).total_seconds()
+                        elapsed = (datetime.now() - startTime).total_seconds()
+                        totalTime += elapsed
+                        histogram.record(elapsed)
                     message += f" - {totalTime:<3.1f}s"
                     logger.info(
-                        f"{calls} requests to {serverid} took {totalTime:<3.1f}s - {info}"
+                        f"{calls} requests to {serverid} took {totalTime:<3.1f}s - {info} - {histogram.summary()}"
+                    )
+                    nodeHistogram.merge(histogram)
+                    store_histogram(
+                        self.TestOcsCalls._testMethodName, fullnode, info, histogram, f"{drv.get_multinode(fullnode)}.{drv.get_base_url()}"
                     )
 
                 else:
                     info = "Full node fe urls, new session"
                     for fe in range(1, 4):
                         totalTime = 0.0
-                        url = drv.get_add_user_fe_url(fullnode, fe)
+                        histogram = sunetperformance.LatencyHistogram()
+                        url = endpoints.frontend_users(fe)
                         logger.info(f"Test direct call to {fullnode} FE{fe} - {url}")
 
-                        url = url.replace("$USERNAME$", nodeuser)
-                        url = url.replace("$PASSWORD$", nodepwd)
-
                         for call in range(0, calls):
                             s = requests.Session()
                             s.headers.update(ocsheaders)
+                            s.auth = auth
                             retries = Retry(total=5, backoff_factor=0.1, status_forcelist=[500, 502, 503, 504])
                             s.mount('http://', HTTPAdapter(max_retries=retries))
                             s.mount('https://', HTTPAdapter(max_retries=retries))
                             startTime = datetime.now()
                             s.get(url, headers=ocsheaders, verify=False)
-                            totalTime += (datetime.now() - startTime).total_seconds()
+                            elapsed = (datetime.now() - startTime).total_seconds()
+                            totalTime += elapsed
+                            histogram.record(elapsed)
                         message += f" - {totalTime:<3.1f}s"
                         logger.info(
-                            f"{calls} requests to {serverid} took {totalTime:<3.1f}s - {info}"
+                            f"{calls} requests to {serverid} took {totalTime:<3.1f}s - {info} - {histogram.summary()}"
+                        )
+                        nodeHistogram.merge(histogram)
+                        store_histogram(
+                            self.TestOcsCalls._testMethodName, fullnode, info, histogram, f"node{fe}.{nodebaseurl}"
                         )
 
             else:  # Same session
@@ -431,47 +467,59 @@ class NodeOcsUserPerformance(threading.Thread):
                 if isMultinode:
                     info = "Multinode url, same session"
                     totalTime = 0.0
+                    histogram = sunetperformance.LatencyHistogram()
                     s = requests.Session()
                     s.headers.update(ocsheaders)
+                    s.auth = auth
                     retries = Retry(total=5, backoff_factor=0.1, status_forcelist=[500, 502, 503, 504])
                     s.mount('http://', HTTPAdapter(max_retries=retries))
                     s.mount('https://', HTTPAdapter(max_retries=retries))
-                    url = drv.get_add_user_multinode_url(fullnode)
+                    url = endpoints.multinodeusers
                     logger.info(f"Test direct call to {fullnode} - {url}")
 
-                    url = url.replace("$USERNAME$", nodeuser)
-                    url = url.replace("$PASSWORD$", nodepwd)
-
                     for call in range(0, calls):
                         startTime = datetime.now()
                         s.get(url, headers=ocsheaders, verify=False)
-                        totalTime += (datetime.now() - startTime).total_seconds()
+                        elapsed = (datetime.now() - startTime).total_seconds()
+                        totalTime += elapsed
+                        histogram.record(elapsed)
                     message += f" - {totalTime:<3.1f}s"
                     logger.info(
-                        f"{calls} requests to {serverid} took {totalTime:<3.1f}s - {info}"
+                        f"{calls} requests to {serverid} took {totalTime:<3.1f}s - {info} - {histogram.summary()}"
+                    )
+                    nodeHistogram.merge(histogram)
+                    store_histogram(
+                        self.TestOcsCalls._testMethodName, fullnode, info, histogram, f"{drv.get_multinode(fullnode)}.{drv.get_base_url()}"
                     )
                 else:
                     info = "Full node fe urls, same session"
                     for fe in range(1, 4):
                         totalTime = 0.0
+                        histogram = sunetperformance.LatencyHistogram()
                         s = requests.Session()
                         s.headers.update(ocsheaders)
-                        url = drv.get_add_user_fe_url(fullnode, fe)
+                        s.auth = auth
+                        url = endpoints.frontend_users(fe)
                         logger.info(f"Test direct call to {fullnode} FE{fe} - {url}")
 
-                        url = url.replace("$USERNAME$", nodeuser)
-                        url = url.replace("$PASSWORD$", nodepwd)
-
                         for call in range(0, calls):
                             startTime = datetime.now()
                             s.get(url, headers=ocsheaders, verify=False)
-                            totalTime += (datetime.now() - startTime).total_seconds()
+                            elapsed = (datetime.now() - startTime).total_seconds()
+                            totalTime += elapsed
+                            histogram.record(elapsed)
                         message += f" - {totalTime:<3.1f}s"
                         logger.info(
-                            f"{calls} requests to {serverid} took {totalTime:<3.1f}s - {info}"
+                            f"{calls} requests to {serverid} took {totalTime:<3.1f}s - {info} - {histogram.summary()}"
+                        )
+                        nodeHistogram.merge(histogram)
+                        store_histogram(
+                            self.TestOcsCalls._testMethodName, fullnode, info, histogram, f"node{fe}.{nodebaseurl}"
                         )
 
+            message += f" - {nodeHistogram.summary()}"
             g_ocsPerformanceResults.append(message)
+            g_ocsHistogram.merge(nodeHistogram)
         except Exception as error:
             logger.error(f"Problem in NodeOcsUserPerformance for {self.name}: {error}")
             g_testPassed[testid] = False
@@ -487,11 +535,13 @@ class NodeOcsUserPerformance(threading.Thread):
 
 class TestPerformanceOcs(unittest.TestCase):
     def test_performance_ocs_userlist_samesession(self):
-        global g_ocsPerformanceResults
+        global g_ocsPerformanceResults, g_ocsHistogram
+        g_ocsHistogram = sunetperformance.LatencyHistogram()
         g_ocsPerformanceResults.append(
             "Result of test_performance_ocs_userlist_samesession"
         )
         drv = sunetnextcloud.TestTarget()
+        drv.prefetch_credentials(g_ocsCredentials)
         for fullnode in drv.nodestotest:
             if drv.is_multinode(fullnode):
                 testid = f'{fullnode} - {drv.get_multinode(fullnode)}'
@@ -520,13 +570,16 @@ class TestPerformanceOcs(unittest.TestCase):
         logger.info("Result of test_performance_ocs_userlist_samesession")
         for message in g_ocsPerformanceResults:
             logger.info(f"{message}")
+        logger.info(f"All calls: {g_ocsHistogram.summary()}")
 
     def test_performance_ocs_userlist_newsession(self):
-        global g_ocsPerformanceResults
+        global g_ocsPerformanceResults, g_ocsHistogram
+        g_ocsHistogram = sunetperformance.LatencyHistogram()
         g_ocsPerformanceResults.append(
             "Result of test_performance_ocs_userlist_newsession"
         )
         drv = sunetnextcloud.TestTarget()
+        drv.prefetch_credentials(g_ocsCredentials)
         for fullnode in drv.nodestotest:
             if drv.is_multinode(fullnode):
                 testid = f'{fullnode} - {drv.get_multinode(fullnode)}'
@@ -556,11 +609,15 @@ class TestPerformanceOcs(unittest.TestCase):
         logger.info("Result of test_performance_ocs_userlist_newsession")
         for message in g_ocsPerformanceResults:
             logger.info(f"{message}")
+        logger.info(f"All calls: {g_ocsHistogram.summary()}")
 
     def test_performance_ocs_userlifecycle(self):
-        global g_ocsPerformanceResults
+        global g_ocsPerformanceResults, g_ocsHistogram
+        g_ocsHistogram = sunetperformance.LatencyHistogram()
         g_ocsPerformanceResults.append("Result of test_performance_ocs_userlifecycle")
         drv = sunetnextcloud.TestTarget()
+        drv.prefetch_credentials(g_ocsCredentials + ["ocsuserpassword"])
+        version = drv.expectedResults[drv.target]["status"]["version"][-1]
         for fullnode in drv.nodestotest:
             if drv.is_multinode(fullnode):
                 testid = f'{fullnode} - {drv.get_multinode(fullnode)}'
@@ -569,24 +626,52 @@ class TestPerformanceOcs(unittest.TestCase):
 
             with self.subTest(mynode=testid):
                 logger.info(f"TestID: {testid}")
-                userLifecycleThread = NodeOcsUserLifecycle(fullnode)
-                userLifecycleThread.start()
-
-        while g_testThreadsRunning > 0:
-            time.sleep(1)
-
-        for fullnode in drv.nodestotest:
-            if drv.is_multinode(fullnode):
-                testid = f'{fullnode} - {drv.get_multinode(fullnode)}'
-            else:
-                testid = fullnode
+                endpoints = drv.get_endpoints(fullnode)
+                # Keep a connection for every worker, otherwise stage latencies include new TLS handshakes
+                session = drv.get_session(
+                    fullnode, retries=g_provisionRetries, poolsize=sum(g_provisionConcurrency.values())
+                )
+                session.auth = drv.get_ocs_auth(fullnode)
 
-            with self.subTest(mynode=testid):
-                self.assertTrue(g_testPassed[testid])
+                # User administration needs a recently confirmed password
+                r = session.put(
+                    endpoints.apppassword + "/confirm",
+                    headers=ocsheaders,
+                    json={"password": drv.get_ocsuserpassword(fullnode)},
+                    timeout=g_requestTimeout,
+                )
+                logger.info(f"Confirm app password: {r.status_code}")
+
+                usernames = [
+                    f"__performance_user_{g_userprefix}_{userindex}_{fullnode}"
+                    for userindex in range(offset, offset + g_provisionUsers)
+                ]
+                pipeline = UserProvisioningPipeline(session, endpoints)
+                completed = pipeline.run(usernames)
+                pipeline.cleanup()
+                logger.info(pipeline.report())
+
+                g_ocsPerformanceResults.append(f"{fullnode:<15} - {pipeline.report()}")
+                for stage, histogram in pipeline.histograms.items():
+                    g_ocsHistogram.merge(histogram)
+                    store_histogram("test_performance_ocs_userlifecycle", fullnode, f"user {stage}", histogram)
+                regression = sunetperformance.get_result_store().add(
+                    "test_performance_ocs_userlifecycle",
+                    fullnode,
+                    "users per second",
+                    completed / pipeline.elapsed if pipeline.elapsed > 0 else 0.0,
+                    version=version,
+                    count=completed,
+                    lowerIsBetter=False,
+                )
+                if regression is not None:
+                    logger.warning(f"Performance regression: {regression}")
+                self.assertEqual(completed, len(usernames))
 
         logger.info("Result of test_performance_ocs_userlifecycle")
         for message in g_ocsPerformanceResults:
             logger.info(f"{message}")
+        logger.info(f"All calls: {g_ocsHistogram.summary()}")
 
 
 if __name__ == "__main__":
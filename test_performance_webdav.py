@@ -3,7 +3,6 @@ Author: Richard Freitag <freitag@sunet.se>
 """
 
 import unittest
-import tempfile
 import os
 from webdav3.client import Client
 from webdav3.exceptions import WebDavException
@@ -16,6 +15,8 @@ import xmlrunner
 import HtmlTestRunner
 
 import sunetnextcloud
+import sunetperformance
+import sunetwebdav
 
 g_maxCheck = 10
 g_WebDavPerformance_timeout = 30
@@ -26,8 +27,19 @@ g_personalBucket = 'selenium-personal'
 g_systemBucket = 'selenium-system'
 g_filename=datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
 g_davPerformanceResults = []
+# single: one PUT per file through webdav3, chunked: Nextcloud chunking v2 with parallel chunk uploads
+g_uploadMode = os.environ.get("NextcloudWebdavUploadMode", "single")
+# Seconds to wait before test_basic_performance starts, e.g. to let the frontends settle after a deployment
+g_startDelay = int(os.environ.get("NextcloudWebdavStartDelay", 0))
+# Benchmark matrix from benchmarks.yaml used by test_benchmark_matrix
+g_benchmarkFile = os.path.join(sunetnextcloud.g_basedir, 'benchmarks.yaml')
+g_benchmarkMatrix = os.environ.get("NextcloudWebdavMatrix", "webdav")
+g_downloadMatrix = os.environ.get("NextcloudWebdavDownloadMatrix", "download")
+g_storageMatrix = os.environ.get("NextcloudWebdavStorageMatrix", "storage")
+g_sizeUnits = { 'K': 1024, 'M': 1024 * 1024, 'G': 1024 * 1024 * 1024 }
 g_testPassed = {}
 g_testThreadsRunning = 0
+g_seleniumCredentials = ['seleniumuser', 'seleniumuserapppassword']
 ocsheaders = { "OCS-APIRequest" : "true" }
 drv = sunetnextcloud.TestTarget()
 
@@ -35,6 +47,31 @@ logger = logging.getLogger(__name__)
 logging.basicConfig(format = '%(asctime)s - %(module)s.%(funcName)s - %(levelname)s: %(message)s',
                 datefmt = '%Y-%m-%d %H:%M:%S', level = logging.INFO)
 
+def storeResult(test, node, frontend, name, histogram=None, value=None):
+    # Save a result in the result store and log regressions against earlier runs
+    store = sunetperformance.get_result_store()
+    version = drv.expectedResults[drv.target]['status']['version'][-1]
+    if histogram is not None:
+        regressions = store.add_histogram(test, node, name, histogram, frontend, version)
+    else:
+        regressions = [store.add(test, node, name, value, frontend, version)]
+    for regression in regressions:
+        if regression is not None:
+            logger.warning(f'Performance regression: {regression}')
+
+def parseSize(size):
+    # Sizes in benchmarks.yaml are bytes with an optional K, M or G suffix
+    size = str(size)
+    if size[-1] in g_sizeUnits:
+        return int(size[:-1]) * g_sizeUnits[size[-1]]
+    return int(size)
+
+def relativeDelta(value, baseline):
+    # Difference to the baseline in percent, e.g. +25% for a latency that is a quarter higher
+    if baseline == 0:
+        return 'n/a'
+    return f'{(value - baseline) / baseline * 100:+.0f}%'
+
 def excepthook(args):
     logger.error(f'Threading exception: {args}')
     decreaseUploadCount()
@@ -81,6 +118,20 @@ def webdavClean(client, filename):
     logger.info(f'Cleaning {filename}')
     client.clean(filename)
 
+def timedUploadCallback(histogram, startTime):
+    # upload_async calls the callback without arguments once the upload is done
+    def callback():
+        histogram.record(time.perf_counter() - startTime)
+        decreaseUploadCount()
+    return callback
+
+def uploadSourceAsync(client, source, remote_path, callback):
+    # Like client.upload_async, but streams generated content instead of reading a local file
+    def upload():
+        sunetwebdav.upload_source(client, source, remote_path)
+        callback()
+    threading.Thread(target=upload).start()
+
 class TestWebDavPerformance(unittest.TestCase):
     def test_logger(self):
         global logger
@@ -109,8 +160,11 @@ class TestWebDavPerformance(unittest.TestCase):
             maxDeletes = int(maxDeletes)
 
         logger.info(f'Testing with {numFiles} - {maxUploads} max uploads - {maxDeletes} max deletes')
-        time.sleep(900)
+        if g_startDelay > 0:
+            logger.info(f'Waiting {g_startDelay}s before starting')
+            time.sleep(g_startDelay)
 
+        drv.prefetch_credentials(g_seleniumCredentials)
         for fullnode in drv.nodestotest:
             with self.subTest(mynode=fullnode):
                 for fe in range(1,4):
@@ -136,16 +190,17 @@ class TestWebDavPerformance(unittest.TestCase):
                     logger.info(client.list())
                     client.mkdir('performance')
 
-                    logger.info('Generate local files')
                     files = []
+                    sources = {}
                     for i in range(0,numFiles):
                         filename = f'{fullnode}{str(i)}.bin'
-                        pathname = f'{tempfile.gettempdir()}/{filename}'
                         fileSizeInBytes = 102400
-                        with open(pathname, 'wb') as fout:
-                            fout.write(os.urandom(fileSizeInBytes))
+                        sources[filename] = sunetwebdav.RandomUploadSource(fileSizeInBytes, seed=f'{serverid}/{filename}')
+                        # Checksum the content for the OC-Checksum header before the upload is timed
+                        sunetwebdav.checksum_headers(sources[filename])
                         files.append(filename)
 
+                    uploadHistogram = sunetperformance.LatencyHistogram()
                     startTime = datetime.now()
                     logger.info(f'Async upload of {maxUploads} files concurrently')
                     try:
@@ -155,7 +210,7 @@ class TestWebDavPerformance(unittest.TestCase):
                             for file in files[x:x+maxUploads]:
                                 try:
                                     g_testThreadsRunning += 1
-                                    client.upload_async(remote_path=f'performance/{file}',local_path=f'{tempfile.gettempdir()}/{file}', callback=decreaseUploadCount)
+                                    uploadSourceAsync(client, sources[file], f'performance/{file}', timedUploadCallback(uploadHistogram, time.perf_counter()))
                                 except WebDavException as exception:
                                     logger.info(f'Error uploading {filename}: {exception}')
                                     g_testThreadsRunning -= 1
@@ -168,25 +223,22 @@ class TestWebDavPerformance(unittest.TestCase):
                     # Calculate time to upload
                     uploadTime = (endTime - startTime).total_seconds()
 
-                    # Remove the temporary files
-                    logger.info('Remove temporary files')
-                    for i in range(0,numFiles):
-                        filename = f'{tempfile.gettempdir()}/{fullnode}{str(i)}.bin'
-                        os.remove(filename)
+                    session = sunetwebdav.get_webdav_session(drv, fullnode, nodeuser, nodepwd, fe)
+                    checker = sunetwebdav.IntegrityChecker(session, url)
+                    if checker.mode != 'none':
+                        logger.info(f'Verify {numFiles} files with {checker.mode} {checker.algorithm}')
+                        for file in files:
+                            checker.verify(f'performance/{file}', sources[file])
 
                     davElements = client.list('performance')
                     logger.info(f'{davElements}')
                     davElements.pop(0)
                     startTime = datetime.now()
 
-                    for i in range(0,len(davElements),maxDeletes):
-                        x = i
-                        logger.info(f'Batch delete {davElements[x:x+maxDeletes]}')
-                        for element in davElements[x:x+maxDeletes]:
-                            t = threading.Thread(target=client.clean, args=['performance/' + element])
-                            t.start()
-                        while threading.active_count() > 1:
-                            time.sleep(0.01)
+                    deleteEngine = sunetwebdav.DeleteEngine(session, url, maxDeletes)
+                    deleteEngine.delete(['performance/' + element for element in davElements])
+                    logger.info(deleteEngine.report())
+                    deleteHistogram = deleteEngine.histogram
 
                     # This works for single threaded delete
                     # for element in davElements:
@@ -202,10 +254,13 @@ class TestWebDavPerformance(unittest.TestCase):
                     mText = f'Node {fe} - Up: {uploadTime:.1f}s at {uploadTime/numFiles:.2f} s/file'
                     rText = f'Node {fe} - Del: {deleteTime:.1f}s at {deleteTime/numFiles:.2f} s/file'
 
-                    message = f'{lText : <16}{mText : <40}{rText : <40}'
+                    message = f'{lText : <16}{mText : <40}{rText : <40}- Up: {uploadHistogram.summary()} - Del: {deleteHistogram.summary()}'
                     # message = f'{fullnode} - Upload: {uploadTime:.1f}s at {uploadTime/numFiles:.2f} s/file - Delete: {deleteTime:.1f}s at {deleteTime/numFiles:.2f} s/file'
                     logger.info(f'{message}')
                     g_davPerformanceResults.append(message)
+                    storeResult(self._testMethodName, fullnode, serverid, 'upload', histogram=uploadHistogram)
+                    storeResult(self._testMethodName, fullnode, serverid, 'delete', histogram=deleteHistogram)
+                    self.assertEqual(checker.failed, [])
 
         logger.info(f'Results for {numFiles} with max {maxUploads} concurrent uploads and max {maxDeletes} concurrent deletes')
         for message in g_davPerformanceResults:
@@ -233,20 +288,20 @@ class TestWebDavPerformance(unittest.TestCase):
         logger.info(f'{header}')
 
         drv = sunetnextcloud.TestTarget()
+        drv.prefetch_credentials(g_seleniumCredentials)
         for fullnode in drv.nodestotest:
             with self.subTest(mynode=fullnode):
-                logger.info('Generate local files')
                 files = []
+                sources = {}
                 for i in range(0,numFiles):
                     for fileSize in fileSizes:
                         filename = f'{fullnode}{str(i)}_{str(fileSize)}.bin'
-                        pathname = f'{tempfile.gettempdir()}/{filename}'
-                        fileSizeInBytes = fileSize
-                        with open(pathname, 'wb') as fout:
-                            fout.write(os.urandom(fileSizeInBytes))
+                        sources[filename] = sunetwebdav.RandomUploadSource(fileSize, seed=filename)
+                        # Checksum the content for the OC-Checksum header before the upload is timed
+                        sunetwebdav.checksum_headers(sources[filename])
                         files.append(filename)
 
-                logger.info(f'Generated files: {files}')
+                logger.info(f'Files to upload: {files}')
 
                 for fe in range(1,4):
                     nodebaseurl = drv.get_node_base_url(fullnode)
@@ -272,19 +327,28 @@ class TestWebDavPerformance(unittest.TestCase):
                     targetDir='selenium-system/TestWebDavPerformance_file_sizes'
                     client.mkdir(targetDir)
 
+                    session = sunetwebdav.get_webdav_session(drv, fullnode, nodeuser, nodepwd, fe)
+                    checker = sunetwebdav.IntegrityChecker(session, url)
+                    if g_uploadMode == 'chunked':
+                        uploader = sunetwebdav.ChunkedUploader(session, drv.get_endpoints(fullnode).url, nodeuser)
+
                     for file in files:
                         startTime = datetime.now()
-                        logger.info(f'Async upload of {file} to node{fe}')
+                        logger.info(f'{g_uploadMode} upload of {file} to node{fe}')
                         try:
-                            try:
-                                g_testThreadsRunning += 1
-                                client.upload_async(remote_path=f'{targetDir}/{file}',local_path=f'{tempfile.gettempdir()}/{file}', callback=decreaseUploadCount)
-                                # client.upload_sync(remote_path=f'{targetDir}/{file}',local_path=f'{tempfile.gettempdir()}/{file}', callback=decreaseUploadCount)
-                            except WebDavException as exception:
-                                logger.error(f'Error uploading {filename}: {exception}')
-                                g_testThreadsRunning -= 1
-                            while g_testThreadsRunning > 0:
-                                time.sleep(0.01)
+                            if g_uploadMode == 'chunked':
+                                if not uploader.upload(sources[file], f'{targetDir}/{file}'):
+                                    logger.error(f'Chunked upload of {file} failed')
+                                logger.info(uploader.report())
+                            else:
+                                try:
+                                    g_testThreadsRunning += 1
+                                    uploadSourceAsync(client, sources[file], f'{targetDir}/{file}', decreaseUploadCount)
+                                except WebDavException as exception:
+                                    logger.error(f'Error uploading {filename}: {exception}')
+                                    g_testThreadsRunning -= 1
+                                while g_testThreadsRunning > 0:
+                                    time.sleep(0.01)
 
 
 
@@ -309,7 +373,9 @@ class TestWebDavPerformance(unittest.TestCase):
                         # Calculate time to upload
                         uploadTime = (endTime - startTime).total_seconds()
 
-
+                        if checker.mode != 'none':
+                            verification = checker.verify(f'{targetDir}/{file}', sources[file])
+                            logger.info(f'Verified {file} with {verification.method} {verification.algorithm}: {verification.passed}')
 
                         davElements = client.list(targetDir)
                         logger.info(f'{davElements}')
@@ -337,6 +403,7 @@ class TestWebDavPerformance(unittest.TestCase):
                         # deleteTime = (datetime.now() - startTime).total_seconds()
 
                         result += f'{uploadTime:<10.1f}'
+                        storeResult(self._testMethodName, fullnode, serverid, f'{g_uploadMode} upload {file}', value=uploadTime)
 
                         # lText = f'{fullnode} '
                         # mText = f'Size: {fileSize}'
@@ -347,15 +414,7 @@ class TestWebDavPerformance(unittest.TestCase):
                         # logger.info(f'{message}')
 
                     g_davPerformanceResults.append(result)
-
-                # Remove the temporary files
-                try:
-                    logger.info('Remove temporary files')
-                    for i in range(0,numFiles):
-                        filename = f'{tempfile.gettempdir()}/{fullnode}{str(i)}_{str(fileSize)}.bin'
-                        os.remove(filename)
-                except Exception as error:
-                    logger.error(f'Error deleting local file: {error}')
+                    self.assertEqual(checker.failed, [])
 
         logger.info(f'Results for {numFiles} with max {maxUploads} concurrent uploads and max {maxDeletes} concurrent deletes')
         for message in g_davPerformanceResults:
@@ -364,6 +423,136 @@ class TestWebDavPerformance(unittest.TestCase):
         logger.info('Done')
         pass
 
+    def test_benchmark_matrix(self):
+        matrix = sunetnextcloud.load_yaml(g_benchmarkFile)[g_benchmarkMatrix]
+        numFiles = matrix['files']
+        operations = [operation.upper() for operation in matrix['operations']]
+        logger.info(f'Benchmark matrix {g_benchmarkMatrix}: {matrix}')
+
+        header = f'{"Node" : <16}{"FE" : <4}{"Size" : >8}{"Conc" : >6}  {"Op" : <10}{"ops/s" : >9}{"MB/s" : >9}{"Failed" : >8}  Latency'
+        results = [header]
+        drv.prefetch_credentials(g_seleniumCredentials)
+        for fullnode in drv.nodestotest:
+            with self.subTest(mynode=fullnode):
+                nodeuser = drv.get_seleniumuser(fullnode)
+                nodepwd = drv.get_seleniumuserapppassword(fullnode)
+                url = drv.get_webdav_url(fullnode, nodeuser)
+                failed = 0
+                for fe in matrix['frontends']:
+                    serverid = drv.get_serverid(fullnode, fe)
+                    session = sunetwebdav.get_webdav_session(drv, fullnode, nodeuser, nodepwd, fe)
+                    for size in matrix['sizes']:
+                        for concurrency in matrix['concurrency']:
+                            benchmark = sunetwebdav.WebdavBenchmark(session, url, 'WebDavBenchmark', concurrency)
+                            for result in benchmark.run(parseSize(size), numFiles, operations):
+                                message = f'{fullnode : <16}{fe : <4}{size : >8}{concurrency : >6}  {result.operation : <10}{result.operationsPerSecond : >9.1f}{result.megabytesPerSecond : >9.1f}{result.failed : >8}  {result.histogram.summary()}'
+                                logger.info(message)
+                                results.append(message)
+                                failed += result.failed
+                                storeResult(self._testMethodName, fullnode, serverid, f'{result.operation} {size} x{concurrency}', histogram=result.histogram)
+                self.assertEqual(failed, 0)
+
+        logger.info(f'Results for {numFiles} files per cell')
+        for message in results:
+            logger.info(f'{message}')
+
+    def test_download_performance(self):
+        matrix = sunetnextcloud.load_yaml(g_benchmarkFile)[g_downloadMatrix]
+        size = parseSize(matrix['size'])
+        fileSize = parseSize(matrix['filesize'])
+        logger.info(f'Download benchmark {g_downloadMatrix}: {matrix}')
+
+        header = f'{"Node" : <16}{"FE" : <4}{"Bucket" : <10}{"Mode" : <8}{"Calls" : >7}{"ops/s" : >9}{"MB/s" : >9}{"Failed" : >8}  Latency'
+        results = [header]
+        drv.prefetch_credentials(g_seleniumCredentials)
+        for fullnode in drv.nodestotest:
+            with self.subTest(mynode=fullnode):
+                nodeuser = drv.get_seleniumuser(fullnode)
+                nodepwd = drv.get_seleniumuserapppassword(fullnode)
+                url = drv.get_webdav_url(fullnode, nodeuser)
+                failed = 0
+                for fe in matrix['frontends']:
+                    serverid = drv.get_serverid(fullnode, fe)
+                    session = sunetwebdav.get_webdav_session(drv, fullnode, nodeuser, nodepwd, fe)
+                    for bucket, folder in matrix['buckets'].items():
+                        benchmark = sunetwebdav.DownloadBenchmark(session, url, f'{folder}/WebDavDownloadBenchmark', matrix['concurrency'])
+                        try:
+                            downloads = benchmark.run(size, matrix['segments'], fileSize, matrix['files'])
+                        except Exception as error:
+                            logger.error(f'Download benchmark failed for {fullnode} fe{fe} {bucket}: {error}')
+                            failed += 1
+                            continue
+                        for result in downloads:
+                            message = f'{fullnode : <16}{fe : <4}{bucket : <10}{result.operation : <8}{result.count : >7}{result.operationsPerSecond : >9.1f}{result.megabytesPerSecond : >9.1f}{result.failed : >8}  {result.histogram.summary()}'
+                            logger.info(message)
+                            results.append(message)
+                            failed += result.failed
+                            storeResult(self._testMethodName, fullnode, serverid, f'{bucket} {result.operation}', histogram=result.histogram)
+                self.assertEqual(failed, 0)
+
+        logger.info(f'Results for {matrix["size"]} streaming and ranged downloads and {matrix["files"]} files of {matrix["filesize"]}')
+        for message in results:
+            logger.info(f'{message}')
+
+    def test_storage_buckets(self):
+        matrix = sunetnextcloud.load_yaml(g_benchmarkFile)[g_storageMatrix]
+        numFiles = matrix['files']
+        operations = [operation.upper() for operation in matrix['operations']]
+        buckets = list(matrix['buckets'].items())
+        baseline = buckets[0][0]
+        logger.info(f'Storage benchmark {g_storageMatrix}: {matrix}')
+
+        header = f'{"Node" : <16}{"Size" : >8}{"Conc" : >6}  {"Op" : <10}'
+        for bucket, folder in buckets:
+            header += f'{bucket + " p50" : >16}{"MB/s" : >8}'
+        results = [header]
+        drv.prefetch_credentials(g_seleniumCredentials)
+        for fullnode in drv.nodestotest:
+            with self.subTest(mynode=fullnode):
+                nodeuser = drv.get_seleniumuser(fullnode)
+                nodepwd = drv.get_seleniumuserapppassword(fullnode)
+                url = drv.get_webdav_url(fullnode, nodeuser)
+                serverid = drv.get_serverid(fullnode, matrix['frontend'])
+                session = sunetwebdav.get_webdav_session(drv, fullnode, nodeuser, nodepwd, matrix['frontend'])
+                failed = 0
+                for size in matrix['sizes']:
+                    for concurrency in matrix['concurrency']:
+                        # The identical workload runs against every bucket, one after the other
+                        cell = {}
+                        for bucket, folder in buckets:
+                            benchmark = sunetwebdav.WebdavBenchmark(session, url, f'{folder}/WebDavStorageBenchmark', concurrency)
+                            try:
+                                cell[bucket] = { result.operation: result for result in benchmark.run(parseSize(size), numFiles, operations) }
+                            except Exception as error:
+                                logger.error(f'Storage benchmark failed for {fullnode} {bucket} {size} x{concurrency}: {error}')
+                                failed += 1
+                                continue
+                            for result in cell[bucket].values():
+                                failed += result.failed
+                                storeResult(self._testMethodName, fullnode, serverid, f'{bucket} {result.operation} {size} x{concurrency}', histogram=result.histogram)
+                        for operation in operations:
+                            message = f'{fullnode : <16}{size : >8}{concurrency : >6}  {operation : <10}'
+                            # A bucket whose benchmark failed has no result, and without the baseline there are no deltas
+                            baselineResult = cell.get(baseline, {}).get(operation)
+                            for bucket, folder in buckets:
+                                result = cell.get(bucket, {}).get(operation)
+                                if result is None:
+                                    message += f'{"failed" : >16}{"" : >8}'
+                                    continue
+                                latency = result.histogram.percentile(50)
+                                if bucket == baseline or baselineResult is None:
+                                    delta = ''
+                                else:
+                                    delta = f' {relativeDelta(latency, baselineResult.histogram.percentile(50))}'
+                                message += f'{f"{latency * 1000:.0f}ms{delta}" : >16}{result.megabytesPerSecond : >8.1f}'
+                            logger.info(message)
+                            results.append(message)
+                self.assertEqual(failed, 0)
+
+        logger.info(f'Results for {numFiles} files per cell, deltas against {baseline}')
+        for message in results:
+            logger.info(f'{message}')
+
 if __name__ == '__main__':
     if drv.testrunner == "xml":
         unittest.main(testRunner=xmlrunner.XMLTestRunner(output="test-reports"))
@@ -7,15 +7,12 @@ import hashlib
 import json
 import logging
 import os
-import threading
 import time
 import unittest
 from xml.etree.ElementTree import fromstring
 
 import requests
 from requests.exceptions import RequestException
-import xmlrunner
-import HtmlTestRunner
 
 import xmltodict
 
@@ -24,8 +21,6 @@ import sunetnextcloud
 drv = sunetnextcloud.TestTarget()
 expectedResults = drv.expectedResults
 
-testThreadsRunning = 0
-g_failedNodes = []
 g_requestTimeout = 3
 logger = logging.getLogger(__name__)
 logging.basicConfig(
@@ -64,9 +59,10 @@ class NumbersTestResult(unittest.TextTestResult):
         self.testsRun += 1
 
 
-class FrontendStatusInfo(threading.Thread):
-    def __init__(self, url, TestStatus, verify=True, useHttps=True):
-        threading.Thread.__init__(self)
+class FrontendStatusInfo:
+    def __init__(self, node, TestStatus, verify=True, useHttps=True):
+        self.node = node
+        url = drv.get_status_url(node)
         if useHttps:
             self.url = url
         else:
@@ -77,23 +73,21 @@ class FrontendStatusInfo(threading.Thread):
         self.useHttps = useHttps
 
     def run(self):
-        global testThreadsRunning
         global logger
         global expectedResults
-        global g_failedNodes
-        testThreadsRunning += 1
+        failedUrls = []
         drv = sunetnextcloud.TestTarget()
         logger.info(
-            f"FrontendStatusInfo thread {testThreadsRunning} started for node {self.url}"
+            f"FrontendStatusInfo thread started for node {self.url}"
         )
 
         try:
-            r = get(self.url, timeout=g_requestTimeout, verify=self.verify)
+            session = drv.get_session(self.node)
+            r = get(self.url, session=session, timeout=g_requestTimeout, verify=self.verify)
         except Exception as error:
             logger.error(f"Error getting frontend status data from {self.url}: {error}")
-            g_failedNodes.append(self.url)
-            testThreadsRunning -= 1
-            return
+            failedUrls.append(self.url)
+            return failedUrls
 
         try:
             j = json.loads(r.text)
@@ -121,59 +115,51 @@ class FrontendStatusInfo(threading.Thread):
             )
             logger.info(f"Status information tested: {self.url}")
         except Exception as error:
-            g_failedNodes.append(self.url)
+            failedUrls.append(self.url)
             logger.info(f"No valid JSON reply received for {self.url}: {error}")
-            testThreadsRunning -= 1
             logger.info(r.text)
-            self.TestStatus.assertTrue(False)
-            return
+            return failedUrls
 
         logger.info(f"Status thread done for node {self.url}")
-        testThreadsRunning -= 1
-        logger.info(f"FrontendStatusInfo threads remaining: {testThreadsRunning}")
+        return failedUrls
 
 
-class NodeStatusInfo(threading.Thread):
+class NodeStatusInfo:
     def __init__(self, node, TestStatus, verify=True):
-        threading.Thread.__init__(self)
         self.node = node
         self.TestStatus = TestStatus
         self.verify = verify
 
     def run(self):
-        global testThreadsRunning
         global logger
         global expectedResults
-        global g_failedNodes
-        testThreadsRunning += 1
+        failedUrls = []
         drv = sunetnextcloud.TestTarget()
         logger.info(
-            f"NodeStatusInfo thread {testThreadsRunning} started for node {self.node}"
+            f"NodeStatusInfo thread started for node {self.node}"
         )
 
+        session = drv.get_session(self.node)
         x = range(1, 4)
         for i in x:
             url = drv.get_node_status_url(self.node, i)
             try:
                 logger.info(f"Getting status from: {url}")
-                r = get(url, timeout=g_requestTimeout, verify=False)
+                r = get(url, session=session, timeout=g_requestTimeout, verify=False)
             except Exception as error:
                 logger.error(
                     f"Error getting node status data from {self.node}: {error}"
                 )
-                g_failedNodes.append(url)
-                testThreadsRunning -= 1
-                return
+                failedUrls.append(url)
+                return failedUrls
 
             try:
                 j = json.loads(r.text)
             except Exception as error:
-                g_failedNodes.append(url)
+                failedUrls.append(url)
                 logger.info(f"No valid JSON reply received for {url}: {error}")
-                testThreadsRunning -= 1
                 logger.info(r.text)
-                self.TestStatus.assertTrue(False)
-                return
+                return failedUrls
 
             try:
                 self.TestStatus.assertEqual(
@@ -201,46 +187,40 @@ class NodeStatusInfo(threading.Thread):
                 )
                 logger.info(f"Status information tested: {url}")
             except Exception as error:
-                g_failedNodes.append(url)
+                failedUrls.append(url)
                 logger.info(f"Assertion error for {url}: {error}")
-                testThreadsRunning -= 1
                 logger.info(r.text)
-                self.TestStatus.assertTrue(False)
-                return
+                return failedUrls
 
         logger.info(f"Status thread done for node {url}")
-        testThreadsRunning -= 1
-        logger.info(f"NodeStatusInfo threads remaining: {testThreadsRunning}")
+        return failedUrls
 
 
-class StatusInfo(threading.Thread):
+class StatusInfo:
     def __init__(self, node, TestStatus, verify=True):
-        threading.Thread.__init__(self)
         self.node = node
         self.TestStatus = TestStatus
         self.verify = verify
 
     def run(self):
-        global testThreadsRunning
         global logger
         global expectedResults
-        global g_failedNodes
-        testThreadsRunning += 1
+        failedUrls = []
         drv = sunetnextcloud.TestTarget()
         logger.info(
-            f"StatusInfo thread {testThreadsRunning} started for node {self.node}"
+            f"StatusInfo thread started for node {self.node}"
         )
 
         url = drv.get_status_url(self.node)
         try:
             logger.info(f"Getting status from: {url}")
-            r = get(url, timeout=g_requestTimeout, verify=self.verify)
+            session = drv.get_session(self.node)
+            r = get(url, session=session, timeout=g_requestTimeout, verify=self.verify)
 
         except Exception as error:
             logger.error(f"Error getting status info data from {self.node}: {error}")
-            g_failedNodes.append(url)
-            testThreadsRunning -= 1
-            return
+            failedUrls.append(url)
+            return failedUrls
 
         try:
             j = json.loads(r.text)
@@ -268,34 +248,28 @@ class StatusInfo(threading.Thread):
             )
             logger.info(f"Status information tested: {url}")
         except Exception as error:
-            g_failedNodes.append(url)
+            failedUrls.append(url)
             logger.info(f"No valid JSON reply received for {url}: {error}")
-            testThreadsRunning -= 1
             logger.info(r.text)
-            self.TestStatus.assertTrue(False)
-            return
+            return failedUrls
 
         logger.info(f"Status thread done for node {url}")
-        testThreadsRunning -= 1
-        logger.info(f"NodeStatusInfo threads remaining: {testThreadsRunning}")
+        return failedUrls
 
 
-class SeamlessAccessInfo(threading.Thread):
+class SeamlessAccessInfo:
     def __init__(self, node, TestStatus, verify=True):
-        threading.Thread.__init__(self)
         self.node = node
         self.TestStatus = TestStatus
         self.verify = verify
 
     def run(self):
-        global testThreadsRunning
         global logger
         global expectedResults
-        global g_failedNodes
-        testThreadsRunning += 1
+        failedUrls = []
         drv = sunetnextcloud.TestTarget()
         logger.info(
-            f"SeamlessAccessInfo thread {testThreadsRunning} started for node {self.node}"
+            f"SeamlessAccessInfo thread started for node {self.node}"
         )
 
         url = drv.get_node_login_url(self.node, direct=False)
@@ -305,9 +279,7 @@ class SeamlessAccessInfo(threading.Thread):
             failed = False
             for fe in range(1, 4):
                 logger.info(f"Getting seamless access info from: {url} node {fe}")
-                s = requests.Session()
-                serverid = f"node{fe}.{nodebaseurl}"
-                s.cookies.set("SERVERID", serverid)
+                s = drv.get_session(self.node, fe)
                 r = get(url, session=s, timeout=g_requestTimeout, verify=self.verify)
 
                 if (
@@ -317,40 +289,33 @@ class SeamlessAccessInfo(threading.Thread):
                     logger.error(
                         f"Error getting seamless access info from: {self.node}. Received text: {r.text}"
                     )
-                    g_failedNodes.append(f"{url} - Node {fe}")
+                    failedUrls.append(f"{url} - Node {fe}")
                     failed = True
             if failed:
-                testThreadsRunning -= 1
-                return
+                return failedUrls
         except Exception as error:
             logger.error(
                 f"Error getting seamless access info from {self.node} node {fe}: {error}"
             )
-            g_failedNodes.append(url)
-            testThreadsRunning -= 1
-            return
+            failedUrls.append(url)
+            return failedUrls
 
         logger.info(f"SeamlessAccessInfo thread done for node {nodebaseurl}")
-        testThreadsRunning -= 1
-        logger.info(f"SeamlessAccessInfo threads remaining: {testThreadsRunning}")
-        return
+        return failedUrls
 
-class OcmInfo(threading.Thread):
+class OcmInfo:
     def __init__(self, node, TestStatus, verify=True):
-        threading.Thread.__init__(self)
         self.node = node
         self.TestStatus = TestStatus
         self.verify = verify
 
     def run(self):
-        global testThreadsRunning
         global logger
         global expectedResults
-        global g_failedNodes
-        testThreadsRunning += 1
+        failedUrls = []
         drv = sunetnextcloud.TestTarget()
         logger.info(
-            f"OcmInfo thread {testThreadsRunning} started for node {self.node}"
+            f"OcmInfo thread started for node {self.node}"
         )
 
         fe = None
@@ -361,9 +326,7 @@ class OcmInfo(threading.Thread):
             failed = False
             for fe in range(1, 4):
                 logger.info(f"Getting ocm info from: {well_known_ocm_url} through node {fe}")
-                s = requests.Session()
-                serverid = f"node{fe}.{nodebaseurl}"
-                s.cookies.set("SERVERID", serverid)
+                s = drv.get_session(self.node, fe)
                 r = get(well_known_ocm_url, session=s, timeout=g_requestTimeout, verify=self.verify)
                 j = json.loads(r.text)
                 # print(json.dumps(j, indent=4))
@@ -396,115 +359,92 @@ class OcmInfo(threading.Thread):
                 #     failed = True
 
                 if failed:
-                    g_failedNodes.append(f"{well_known_ocm_url} - Node {fe}")
-                    testThreadsRunning -= 1
-                    return
+                    failedUrls.append(f"{well_known_ocm_url} - Node {fe}")
+                    return failedUrls
 
         except Exception as error:
             logger.error(
                 f"Error getting seamless access info from {self.node} node {fe}: {error}"
             )
-            g_failedNodes.append(well_known_ocm_url)
-            testThreadsRunning -= 1
-            return
+            failedUrls.append(well_known_ocm_url)
+            return failedUrls
 
         logger.info(f"OcmInfo thread done for node {well_known_ocm_url}")
-        testThreadsRunning -= 1
-        logger.info(f"OcmInfo threads remaining: {testThreadsRunning}")
-        return
+        return failedUrls
 
 # Test frontend status for code 200, no content check
-class FrontentStatus(threading.Thread):
-    def __init__(self, url, TestStatus, verify=True):
-        threading.Thread.__init__(self)
-        self.url = url
+class FrontentStatus:
+    def __init__(self, node, TestStatus, verify=True):
+        self.node = node
+        self.url = drv.get_status_url(node)
         self.verify = verify
         self.TestStatus = TestStatus
 
     def run(self):
-        global testThreadsRunning
         global logger
         global expectedResults
-        global g_failedNodes
-        testThreadsRunning += 1
-        logger.info(f"Status thread {testThreadsRunning} started for node {self.url}")
+        failedUrls = []
+        logger.info(f"Status thread started for node {self.url}")
 
         try:
-            r = get(self.url, timeout=g_requestTimeout, verify=self.verify)
+            session = drv.get_session(self.node)
+            r = get(self.url, session=session, timeout=g_requestTimeout, verify=self.verify)
             self.TestStatus.assertEqual(r.status_code, 200)
             logger.info(f"Status tested: {self.url}")
         except Exception as error:
             logger.error(f"An error occurred for {self.url}: {error}")
-            g_failedNodes.append(self.url)
+            failedUrls.append(self.url)
             logger.info("Status test failed")
-            testThreadsRunning -= 1
             # logger.info(r.text)
-            self.TestStatus.assertTrue(False)
-            return
+            return failedUrls
 
         logger.info(f"Status thread done for node {self.url}")
-        testThreadsRunning -= 1
+        return failedUrls
 
 
 class TestStatus(unittest.TestCase):
+    def assert_no_failed_urls(self, results, testName, numNodes):
+        failedUrls = [url for result in results for url in result.failures]
+        if len(failedUrls) > 0:
+            logger.error(
+                f"{testName} test failed for {len(failedUrls)} of {numNodes} nodes:"
+            )
+            for url in failedUrls:
+                with self.subTest(mynode=url):
+                    logger.error(f"   {url}")
+                    self.assertTrue(False)
+
     def test_logger(self):
         global logger
         logger.info(f"TestID: {self._testMethodName}")
         pass
 
     def test_frontend_status(self):
-        global g_failedNodes
         drv = sunetnextcloud.TestTarget()
-        for url in drv.get_allnode_status_urls():
-            with self.subTest(myurl=url):
-                logger.info(f"TestID: {url}")
-                statusThread = FrontentStatus(url, self, verify=drv.verify)
-                statusThread.start()
-
-        while testThreadsRunning > 0:
-            time.sleep(1)
-
-        if len(g_failedNodes) > 0:
-            logger.error(
-                f"Frontend status test failed for {len(g_failedNodes)} of {len(drv.allnodes)} nodes:"
-            )
-            for node in g_failedNodes:
-                with self.subTest(mynode=node):
-                    logger.error(f"   {node}")
-                    self.assertTrue(False)
-            g_failedNodes = []
+        results = sunetnextcloud.run_node_checks(
+            lambda node: FrontentStatus(node, self, verify=drv.verify).run(),
+            drv.allnodes,
+        )
+        self.assert_no_failed_urls(results, "Frontend status", len(drv.allnodes))
 
     def test_frontend_statusinfo(self):
-        global g_failedNodes
         drv = sunetnextcloud.TestTarget()
-        for url in drv.get_allnode_status_urls():
-            with self.subTest(myurl=url):
-                logger.info(f"TestID: {url}")
-                statusInfoThread = FrontendStatusInfo(url, self, verify=drv.verify)
-                statusInfoThread.start()
-
-        while testThreadsRunning > 0:
-            time.sleep(1)
-
-        if len(g_failedNodes) > 0:
-            logger.error(
-                f"FrontendStatusInfo test failed for {len(g_failedNodes)} of {len(drv.allnodes)} nodes:"
-            )
-            for node in g_failedNodes:
-                with self.subTest(mynode=node):
-                    logger.error(f"   {node}")
-                    self.assertTrue(False)
-            g_failedNodes = []
+        results = sunetnextcloud.run_node_checks(
+            lambda node: FrontendStatusInfo(node, self, verify=drv.verify).run(),
+            drv.allnodes,
+        )
+        self.assert_no_failed_urls(results, "FrontendStatusInfo", len(drv.allnodes))
 
     # def test_frontend_statusinfo_http(self):
     #     global g_failedNodes
     #     g_failedNodes = []
     #     drv = sunetnextcloud.TestTarget()
 
-    #     for url in drv.get_allnode_status_urls():
+    #     for node in drv.allnodes:
+    #         url = drv.get_status_url(node)
     #         with self.subTest(myurl=url):
     #             logger.info(f'TestID: {url}')
-    #             statusInfoThread = FrontendStatusInfo(url, self, verify=drv.verify, useHttps=False)
+    #             statusInfoThread = FrontendStatusInfo(node, self, verify=drv.verify, useHttps=False)
     #             statusInfoThread.start()
 
     #     while(testThreadsRunning > 0):
@@ -519,103 +459,58 @@ class TestStatus(unittest.TestCase):
 
     # Test status infor content for all individual loadbalanced nodes
     def test_node_statusinfo(self):
-        global g_failedNodes
         drv = sunetnextcloud.TestTarget()
-        for node in expectedResults["global"]["redundantnodes"]:
-            if node in drv.allnodes:
-                with self.subTest(myurl=node):
-                    logger.info(f"TestID: {node}")
-                    statusInfoThread = NodeStatusInfo(node, self, verify=drv.verify)
-                    statusInfoThread.start()
-
-        while testThreadsRunning > 0:
-            time.sleep(1)
-
-        if len(g_failedNodes) > 0:
-            logger.error(
-                f"NodeStatusInfo test failed for {len(g_failedNodes)} of {len(drv.allnodes)} nodes:"
-            )
-            for node in g_failedNodes:
-                with self.subTest(mynode=node):
-                    logger.error(f"   {node}")
-                    self.assertTrue(False)
-            g_failedNodes = []
+        nodes = [
+            node
+            for node in expectedResults["global"]["redundantnodes"]
+            if node in drv.allnodes
+        ]
+        results = sunetnextcloud.run_node_checks(
+            lambda node: NodeStatusInfo(node, self, verify=drv.verify).run(), nodes
+        )
+        self.assert_no_failed_urls(results, "NodeStatusInfo", len(drv.allnodes))
 
     # Test status.php for all nodes
     def test_statusinfo(self):
-        global g_failedNodes
         drv = sunetnextcloud.TestTarget()
-        for node in expectedResults["global"]["allnodes"]:
-            if node in drv.allnodes:
-                with self.subTest(myurl=node):
-                    logger.info(f"TestID: {node}")
-                    statusInfoThread = StatusInfo(node, self, verify=drv.verify)
-                    statusInfoThread.start()
-
-        while testThreadsRunning > 0:
-            time.sleep(1)
-
-        if len(g_failedNodes) > 0:
-            logger.error(
-                f"NodeStatusInfo test failed for {len(g_failedNodes)} of {len(drv.allnodes)} nodes:"
-            )
-            for node in g_failedNodes:
-                with self.subTest(mynode=node):
-                    logger.error(f"   {node}")
-                    self.assertTrue(False)
-            g_failedNodes = []
+        nodes = [
+            node
+            for node in expectedResults["global"]["allnodes"]
+            if node in drv.allnodes
+        ]
+        results = sunetnextcloud.run_node_checks(
+            lambda node: StatusInfo(node, self, verify=drv.verify).run(), nodes
+        )
+        self.assert_no_failed_urls(results, "NodeStatusInfo", len(drv.allnodes))
 
     def test_seamlessaccessinfo(self):
-        global g_failedNodes
         drv = sunetnextcloud.TestTarget()
 
         if drv.target == "localhost":
             logger.warning("We are not testing SeamlessAccess for localhost")
             return
 
-        for node in expectedResults["global"]["allnodes"]:
-            if node in drv.allnodes and node not in expectedResults[drv.target]['loginexceptions']:
-                with self.subTest(myurl=node):
-                    logger.info(f"TestID: {node}")
-                    saInfoThread = SeamlessAccessInfo(node, self)
-                    saInfoThread.start()
-
-        while testThreadsRunning > 0:
-            time.sleep(1)
-
-        if len(g_failedNodes) > 0:
-            logger.error(
-                f"SeamlessAccessInfo test failed for {len(g_failedNodes)} of {len(drv.allnodes)} nodes:"
-            )
-            for node in g_failedNodes:
-                with self.subTest(mynode=node):
-                    logger.error(f"   {node}")
-                    self.assertTrue(False)
-            g_failedNodes = []
+        nodes = [
+            node
+            for node in expectedResults["global"]["allnodes"]
+            if node in drv.allnodes and node not in expectedResults[drv.target]['loginexceptions']
+        ]
+        results = sunetnextcloud.run_node_checks(
+            lambda node: SeamlessAccessInfo(node, self).run(), nodes
+        )
+        self.assert_no_failed_urls(results, "SeamlessAccessInfo", len(drv.allnodes))
 
     def test_ocminfo(self):
-        global g_failedNodes
         drv = sunetnextcloud.TestTarget()
-
-        for node in expectedResults["global"]["allnodes"]:
-            if node in drv.allnodes and node not in expectedResults[drv.target]['loginexceptions']:
-                with self.subTest(myurl=node):
-                    logger.info(f"TestID: {node}")
-                    ocmInfoThread = OcmInfo(node, self)
-                    ocmInfoThread.start()
-
-        while testThreadsRunning > 0:
-            time.sleep(1)
-
-        if len(g_failedNodes) > 0:
-            logger.error(
-                f"OCM test failed for {len(g_failedNodes)} of {len(drv.allnodes)} nodes:"
-            )
-            for node in g_failedNodes:
-                with self.subTest(mynode=node):
-                    logger.error(f"   {node}")
-                    self.assertTrue(False)
-            g_failedNodes = []
+        nodes = [
+            node
+            for node in expectedResults["global"]["allnodes"]
+            if node in drv.allnodes and node not in expectedResults[drv.target]['loginexceptions']
+        ]
+        results = sunetnextcloud.run_node_checks(
+            lambda node: OcmInfo(node, self).run(), nodes
+        )
+        self.assert_no_failed_urls(results, "OCM", len(drv.allnodes))
 
     def test_saml_metadata(self):
         global logger
@@ -637,7 +532,7 @@ class TestStatus(unittest.TestCase):
                     certMd5 = ""
                     logger.info(f"Verify metadata for {url}")
                     try:
-                        r = get(url, timeout=g_requestTimeout)
+                        r = get(url, session=drv.get_session(node), timeout=g_requestTimeout)
                     except Exception as error:
                         logger.error(f"Error getting {url}: {error}")
                         continue
@@ -679,11 +574,12 @@ class TestStatus(unittest.TestCase):
 
         numCollaboraNodes = expectedResults[drv.target]["collabora"]["nodes"]
         logger.info(f"Collabora nodes: {numCollaboraNodes}")
+        session = drv.get_session("collabora")
         for i in range(1, numCollaboraNodes + 1):
             with self.subTest(mynode=i):
                 url = drv.get_collabora_node_url(i)
                 logger.info(f"Testing Collabora Node: {url}")
-                r = get(url, timeout=g_requestTimeout)
+                r = get(url, session=session, timeout=g_requestTimeout)
                 logger.info(f"Status: {r.text}")
                 self.assertEqual(
                     expectedResults[drv.target]["collabora"]["status"], r.text
@@ -693,7 +589,10 @@ class TestStatus(unittest.TestCase):
 # if __name__ == '__main__':
 #     drv.run_tests(os.path.basename(__file__))
 if __name__ == "__main__":
+    # The report runners are only imported here, this is the smoke test and its startup time matters
     if drv.testrunner == "xml":
+        import xmlrunner
+
         unittest.main(testRunner=xmlrunner.XMLTestRunner(output="test-reports"))
     elif drv.testrunner == "txt":
         unittest.main(
@@ -702,6 +601,8 @@ if __name__ == "__main__":
             )
         )
     else:
+        import HtmlTestRunner
+
         unittest.main(
             testRunner=HtmlTestRunner.HTMLTestRunner(
                 output="test-reports-html",
@@ -3,7 +3,6 @@ Author: Richard Freitag <freitag@sunet.se>
 """
 
 import unittest
-import yaml
 import os
 import time
 
@@ -35,67 +34,65 @@ class TestTests(unittest.TestCase):
     global cosmos_rules
     def setUp(self):
         if os.path.exists(common_config_file):
-            with open(common_config_file, "r") as stream:
-                data=yaml.safe_load(stream)
-                # self.fullnodes = data['fullnodes']
-                # self.singlenodes = data['singlenodes']
-                self.allnodes=data['fullnodes'] + data['singlenodes']
-
-                self.common_metadata_prodnodes = []
-                self.common_metadata_testnodes = []
-                self.common_multinode_mapping_nodes = []
-                self.common_project_mapping_nodes = []
-                self.common_fullnodes = data['fullnodes']
-                self.common_singlenodes = data['singlenodes']
-                self.common_full_and_single_nodes = self.common_fullnodes + self.common_singlenodes
-
-                prod_dir = os.fsencode(f'{opsbase}idpproxy-prod-common/overlay/etc/satosa/metadata/')
-                test_dir = os.fsencode(f'{opsbase}idpproxy-test-common/overlay/etc/satosa/metadata/')
-
-                for file in os.listdir(prod_dir):
-                    metadata_file = os.fsdecode(file)
-                    self.common_metadata_prodnodes.append(metadata_file.replace('_saml_prod.xml', ''))
-                for file in os.listdir(test_dir):
-                    metadata_file = os.fsdecode(file)
-                    self.common_metadata_testnodes.append(metadata_file.replace('_saml_test.xml', ''))
-
-                for entry in data['multinode_mapping']:
-                    logger.info(f'Add {entry} to multinode mapping')
-                    self.common_multinode_mapping_nodes.append(entry)
-                for entry in data['project_mapping']:
-                    logger.info(f'Add {entry} to project mapping')
-                    self.common_project_mapping_nodes.append(entry)
-
-                self.common_metadata_prodnodes = sorted(self.common_metadata_prodnodes)
-                self.common_metadata_testnodes = sorted(self.common_metadata_testnodes)
+            data = sunetnextcloud.load_yaml(common_config_file)
+            # self.fullnodes = data['fullnodes']
+            # self.singlenodes = data['singlenodes']
+            self.allnodes=data['fullnodes'] + data['singlenodes']
+
+            self.common_metadata_prodnodes = []
+            self.common_metadata_testnodes = []
+            self.common_multinode_mapping_nodes = []
+            self.common_project_mapping_nodes = []
+            self.common_fullnodes = data['fullnodes']
+            self.common_singlenodes = data['singlenodes']
+            self.common_full_and_single_nodes = self.common_fullnodes + self.common_singlenodes
+
+            prod_dir = os.fsencode(f'{opsbase}idpproxy-prod-common/overlay/etc/satosa/metadata/')
+            test_dir = os.fsencode(f'{opsbase}idpproxy-test-common/overlay/etc/satosa/metadata/')
+
+            for file in os.listdir(prod_dir):
+                metadata_file = os.fsdecode(file)
+                self.common_metadata_prodnodes.append(metadata_file.replace('_saml_prod.xml', ''))
+            for file in os.listdir(test_dir):
+                metadata_file = os.fsdecode(file)
+                self.common_metadata_testnodes.append(metadata_file.replace('_saml_test.xml', ''))
+
+            for entry in data['multinode_mapping']:
+                logger.info(f'Add {entry} to multinode mapping')
+                self.common_multinode_mapping_nodes.append(entry)
+            for entry in data['project_mapping']:
+                logger.info(f'Add {entry} to project mapping')
+                self.common_project_mapping_nodes.append(entry)
+
+            self.common_metadata_prodnodes = sorted(self.common_metadata_prodnodes)
+            self.common_metadata_testnodes = sorted(self.common_metadata_testnodes)
         else:
             logger.warning(f'Global config file not found at {common_config_file}')
 
         if os.path.exists(cosmos_rules_file):
-            with open(cosmos_rules_file, "r") as stream:
-                self.cosmos_rules=yaml.safe_load(stream)
-
-
-                self.cosmos_fullnode_names = []
-                self.cosmos_multinode_names = []
-
-                # Extract full nodes and multinodes from cosmos rules
-                for key, value in self.cosmos_rules.items():
-                    if "node[" in key:
-                        node_name = key.split(".")[1].replace("\\","")
-                        if node_name not in self.cosmos_fullnode_names:
-                            self.cosmos_fullnode_names.append(node_name)
-
-                    if "multinode" in key:
-                        # logger.info(f'Check sites for {key}')
-
-                        if 'sunet::frontend::register_sites_array' in value.keys():
-                            sites = value['sunet::frontend::register_sites_array']['sites']
-                            for site in sites:
-                                # Convert keys into a list to get first entry and split to get node name
-                                node_name = list(site.keys())[0].split('.')[0]
-                                if node_name not in self.cosmos_multinode_names:
-                                    self.cosmos_multinode_names.append(node_name)
+            self.cosmos_rules = sunetnextcloud.load_yaml(cosmos_rules_file)
+
+
+            self.cosmos_fullnode_names = []
+            self.cosmos_multinode_names = []
+
+            # Extract full nodes and multinodes from cosmos rules
+            for key, value in self.cosmos_rules.items():
+                if "node[" in key:
+                    node_name = key.split(".")[1].replace("\\","")
+                    if node_name not in self.cosmos_fullnode_names:
+                        self.cosmos_fullnode_names.append(node_name)
+
+                if "multinode" in key:
+                    # logger.info(f'Check sites for {key}')
+
+                    if 'sunet::frontend::register_sites_array' in value.keys():
+                        sites = value['sunet::frontend::register_sites_array']['sites']
+                        for site in sites:
+                            # Convert keys into a list to get first entry and split to get node name
+                            node_name = list(site.keys())[0].split('.')[0]
+                            if node_name not in self.cosmos_multinode_names:
+                                self.cosmos_multinode_names.append(node_name)
 
             logger.info(f'Cosmos rules loaded')
         else:
@@ -8,14 +8,13 @@ import os
 from webdav3.client import Client
 from webdav3.exceptions import *
 import logging
-import threading
-import time
 from datetime import datetime
 import os
 import xmlrunner
 import HtmlTestRunner
 
 import sunetnextcloud
+import sunetwebdav
 
 g_maxCheck = 10
 g_webdav_timeout = 30
@@ -25,8 +24,9 @@ g_sharedTestFolder = 'SharedFolder'
 g_personalBucket = 'selenium-personal'
 g_systemBucket = 'selenium-system'
 g_filename=datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-g_testPassed = {}
-g_testThreadsRunning = 0
+g_seleniumCredentials = ['seleniumuser', 'seleniumuserapppassword']
+g_seleniumBasicCredentials = ['seleniumuser', 'seleniumuserpassword']
+g_listCredentials = ['ocsuser', 'ocsuserapppassword', 'seleniumuser', 'seleniumuserapppassword', 'seleniummfauser', 'seleniummfauserapppassword']
 ocsheaders = { "OCS-APIRequest" : "true" }
 logger = logging.getLogger(__name__)
 logging.basicConfig(format = '%(asctime)s - %(module)s.%(funcName)s - %(levelname)s: %(message)s',
@@ -34,22 +34,16 @@ logging.basicConfig(format = '%(asctime)s - %(module)s.%(funcName)s - %(levelnam
 
 drv = sunetnextcloud.TestTarget()
 
-class WebDAVDneCheck(threading.Thread):
+class WebDAVDneCheck:
     def __init__(self, name, basicAuth, TestWebDAV):
-        threading.Thread.__init__(self)
         self.name = name
         self.TestWebDAV = TestWebDAV
         self.basicAuth = basicAuth
 
     def run(self):
         global logger
-        global g_testPassed
-        global g_testThreadsRunning
         fullnode = self.name
-        g_testPassed[fullnode] = False
-        g_testThreadsRunning += 1
         logger.info(f'WebDAVDneCheck thread started for node {self.name}')
-        logger.info(f'Setting passed for {fullnode} to {g_testPassed.get(fullnode)}')
 
         nodeuser = drv.get_seleniumuser(fullnode)
         if self.basicAuth:
@@ -70,6 +64,7 @@ class WebDAVDneCheck(threading.Thread):
 
         client = Client(options)
         client.verify = drv.verify
+        client.session = drv.get_session(fullnode)
         dneName = 'THISFOLDERDOESNOTEXIST'
 
         for i in range(1,g_maxCheck):
@@ -80,39 +75,26 @@ class WebDAVDneCheck(threading.Thread):
                     logger.info(f'Check expected ResponseErrorCode {self.name}: {error.code}')
                     if error.code != 401:
                         logger.error(f'Unexpected error code {error.code} - {type(error)}')
-                        g_testPassed[fullnode] = False
-                        g_testThreadsRunning -= 1
-                        return
+                        return False
                 else:
                     logger.error(f'Unexpected webdav3 exception: {type(error)}')
-                    g_testPassed[fullnode] = False
-                    g_testThreadsRunning -= 1
-                    return
+                    return False
             except Exception as error:
                 logger.error(f'Error during client.check for {self.name}: {error}')
-                g_testPassed[fullnode] = False
-                g_testThreadsRunning -= 1
-                return
+                return False
 
         logger.info(f'WebDAVDneCheck thread done for node {self.name}')
-        g_testPassed[fullnode] = True
-        logger.info(f'Setting passed for {fullnode} to {g_testPassed.get(fullnode)}')
-        g_testThreadsRunning -= 1
+        return True
 
-class WebDAVList(threading.Thread):
+class WebDAVList:
     def __init__(self, name, basicAuth, TestWebDAV):
-        threading.Thread.__init__(self)
         self.name = name
         self.TestWebDAV = TestWebDAV
         self.basicAuth = basicAuth
 
     def run(self):
         global logger
-        global g_testPassed
-        global g_testThreadsRunning
         fullnode = self.name
-        g_testPassed[fullnode] = False
-        g_testThreadsRunning += 1
         logger.info(f'WebDAVList thread started for node {self.name}')
         drv = sunetnextcloud.TestTarget()
 
@@ -152,32 +134,25 @@ class WebDAVList(threading.Thread):
                 }
                 client = Client(options)
                 client.verify = drv.verify
+                client.session = drv.get_session(fullnode)
 
                 logger.info(client.list())
         except Exception as error:
             logger.error(f'Error in webdav listing: {error}')
-            g_testThreadsRunning -= 1
-            g_testPassed[fullnode] = False
-            return
+            return False
 
         logger.info(f'WebDAVList thread done for node {self.name}')
-        g_testPassed[fullnode] = True
-        g_testThreadsRunning -= 1
+        return True
 
-class WebDAVMultiCheckAndRemove(threading.Thread):
+class WebDAVMultiCheckAndRemove:
     def __init__(self, name, basicAuth, TestWebDAV):
-        threading.Thread.__init__(self)
         self.name = name
         self.TestWebDAV = TestWebDAV
         self.basicAuth = basicAuth
 
     def run(self):
         global logger
-        global g_threadResults
-        global g_testThreadsRunning
         fullnode = self.name
-        g_testPassed[fullnode] = False
-        g_testThreadsRunning += 1
         logger.info(f'WebDAVMultiCheckAndRemove thread started for node {self.name}')
         drv = sunetnextcloud.TestTarget()
 
@@ -199,6 +174,7 @@ class WebDAVMultiCheckAndRemove(threading.Thread):
 
         client = Client(options)
         client.verify = drv.verify
+        client.session = drv.get_session(fullnode)
 
         count = 0
         try:
@@ -215,36 +191,26 @@ class WebDAVMultiCheckAndRemove(threading.Thread):
                 logger.warning(f'Multiple tries to remove folder: {count}')
         except Exception as error:
             logger.warning(f'Error during iteration {count} of removing {g_testFolder}: {error}')
-            g_testPassed[fullnode] = False
-            g_testThreadsRunning -= 1
-            return
+            return False
 
         try:
             self.TestWebDAV.assertFalse(client.check(g_testFolder))
         except Exception as error:
             logger.error(f'Error in WebDAVMultiCheckAndRemove for node {self.name} on check {count}: {error}.')
-            g_testPassed[fullnode] = False
-            g_testThreadsRunning -= 1
-            return
+            return False
 
         logger.info(f'WebDAVMultiCheckAndRemove thread done for node {self.name}')
-        g_testPassed[fullnode] = True
-        g_testThreadsRunning -= 1
+        return True
 
-class WebDAVCleanSeleniumFolders(threading.Thread):
+class WebDAVCleanSeleniumFolders:
     def __init__(self, name, basicAuth, TestWebDAV):
-        threading.Thread.__init__(self)
         self.name = name
         self.TestWebDAV = TestWebDAV
         self.basicAuth = basicAuth
 
     def run(self):
         global logger
-        global g_testPassed
-        global g_testThreadsRunning
         fullnode = self.name
-        g_testPassed[fullnode] = False
-        g_testThreadsRunning += 1
         logger.info(f'WebDAVCleanSeleniumFolders thread started for node {self.name}')
         drv = sunetnextcloud.TestTarget()
 
@@ -266,6 +232,7 @@ class WebDAVCleanSeleniumFolders(threading.Thread):
 
         client = Client(options)
         client.verify = drv.verify
+        client.session = drv.get_session(fullnode)
 
         # for i in range(1,g_maxCheck):
         #     if (client.check(g_testFolder)):
@@ -282,28 +249,20 @@ class WebDAVCleanSeleniumFolders(threading.Thread):
             logger.info(client.list())
         except Exception as error:
             logger.error(f'Error in WebDAVCleanSeleniumFolders thread done for node {self.name}: {error}')
-            g_testPassed[fullnode] = False
-            g_testThreadsRunning -= 1
-            return
+            return False
 
         logger.info(f'WebDAVCleanSeleniumFolders thread done for node {self.name}')
-        g_testPassed[fullnode] = True
-        g_testThreadsRunning -= 1
+        return True
 
-class WebDAVCleanTrashbin(threading.Thread):
+class WebDAVCleanTrashbin:
     def __init__(self, name, basicAuth, TestWebDAV):
-        threading.Thread.__init__(self)
         self.name = name
         self.TestWebDAV = TestWebDAV
         self.basicAuth = basicAuth
 
     def run(self):
         global logger
-        global g_testPassed
-        global g_testThreadsRunning
         fullnode = self.name
-        g_testPassed[fullnode] = False
-        g_testThreadsRunning += 1
         logger.info(f'WebDAVCleanTrashbin thread started for node {self.name}')
         drv = sunetnextcloud.TestTarget()
 
@@ -317,48 +276,28 @@ class WebDAVCleanTrashbin(threading.Thread):
         url = drv.get_webdav_url(fullnode, nodeuser)
         url = url.replace('files','trashbin')
         logger.info(f'URL: {url}')
-        options = {
-        'webdav_hostname': url,
-        'webdav_login' : nodeuser,
-        'webdav_password' : nodepwd,
-        'webdav_timeout': g_webdav_timeout
-        }
 
         try:
-            client = Client(options)
-            client.verify = drv.verify
-            files = client.list('trash')
-            files.pop(0)    # Remove first that is just the folder name
-            for file in files:
-                try:
-                    targetdeletefile = f'trash/{file}'
-                    logger.info(f'Deleting file {targetdeletefile}')
-                    client.clean(targetdeletefile)
-                except Exception as error:
-                    logger.warning(f'Unable to delete {targetdeletefile} on {fullnode} due to: {error}')
+            session = sunetwebdav.get_webdav_session(drv, fullnode, nodeuser, nodepwd)
+            cleaner = sunetwebdav.TrashbinCleaner(session, url)
+            if not cleaner.empty():
+                logger.warning(f'Unable to delete {len(cleaner.engine.failed)} trashbin items on {fullnode}')
+            logger.info(cleaner.report())
         except Exception as error:
             logger.error(f'Error in WebDAVCleanTrashbin thread for node {self.name}: {error}')
-            g_testPassed[fullnode] = False
-            g_testThreadsRunning -= 1
-            return
+            return False
         logger.info(f'WebDAVCleanTrashbin thread done for node {self.name}')
-        g_testPassed[fullnode] = True
-        g_testThreadsRunning -= 1
+        return True
 
-class WebDAVMakeSharingFolder(threading.Thread):
+class WebDAVMakeSharingFolder:
     def __init__(self, name, basicAuth, TestWebDAV):
-        threading.Thread.__init__(self)
         self.name = name
         self.TestWebDAV = TestWebDAV
         self.basicAuth = basicAuth
 
     def run(self):
         global logger
-        global g_testPassed
-        global g_testThreadsRunning
         fullnode = self.name
-        g_testPassed[fullnode] = False
-        g_testThreadsRunning += 1
         logger.info(f'WebDAVMakeSharingFolder thread started for node {self.name}')
         drv = sunetnextcloud.TestTarget()
 
@@ -380,6 +319,7 @@ class WebDAVMakeSharingFolder(threading.Thread):
 
         client = Client(options)
         client.verify = drv.verify
+        client.session = drv.get_session(fullnode)
 
         try:
             logger.info(f'Before mkdir: {client.list()}')
@@ -387,36 +327,26 @@ class WebDAVMakeSharingFolder(threading.Thread):
             logger.info(f'After mkdir: {client.list()}')
         except Exception as error:
             logger.error(f'Error making folder {g_sharedTestFolder} on {self.name}: {error}')
-            g_testPassed[fullnode] = False
-            g_testThreadsRunning -= 1
-            return
+            return False
 
         try:
             self.TestWebDAV.assertEqual(client.list().count(f'{g_sharedTestFolder}/'), 1)
         except Exception as error:
             logger.error(f'Error in WebDAVMakeSharingFolder thread done for node {self.name}: {error}')
-            g_testPassed[fullnode] = False
-            g_testThreadsRunning -= 1
-            return
+            return False
 
         logger.info(f'WebDAVMakeSharingFolder thread done for node {self.name}')
-        g_testPassed[fullnode] = True
-        g_testThreadsRunning -= 1
+        return True
 
-class WebDAVPersonalBucketFolders(threading.Thread):
+class WebDAVPersonalBucketFolders:
     def __init__(self, name, basicAuth, TestWebDAV):
-        threading.Thread.__init__(self)
         self.name = name
         self.TestWebDAV = TestWebDAV
         self.basicAuth = basicAuth
 
     def run(self):
         global logger
-        global g_testPassed
-        global g_testThreadsRunning
         fullnode = self.name
-        g_testPassed[fullnode] = False
-        g_testThreadsRunning += 1
         logger.info(f'WebDAVPersonalBucketFolders thread started for node {self.name}')
         drv = sunetnextcloud.TestTarget()
 
@@ -438,6 +368,7 @@ class WebDAVPersonalBucketFolders(threading.Thread):
 
         client = Client(options)
         client.verify = drv.verify
+        client.session = drv.get_session(fullnode)
 
         try:
             folders = ''
@@ -456,28 +387,20 @@ class WebDAVPersonalBucketFolders(threading.Thread):
         except Exception as error:
             logger.info(f'Error in WebDAVPersonalBucketFolders thread done for node {self.name}: {error}')
             logger.info(f'Folders: {folder}; Count: {cnt}')
-            g_testPassed[fullnode] = False
-            g_testThreadsRunning -= 1
-            return
+            return False
 
         logger.info(f'WebDAVPersonalBucketFolders thread done for node {self.name}')
-        g_testPassed[fullnode] = True
-        g_testThreadsRunning -= 1
+        return True
 
-class WebDAVSystemBucketFolders(threading.Thread):
+class WebDAVSystemBucketFolders:
     def __init__(self, name, basicAuth, TestWebDAV):
-        threading.Thread.__init__(self)
         self.name = name
         self.TestWebDAV = TestWebDAV
         self.basicAuth = basicAuth
 
     def run(self):
         global logger
-        global g_testPassed
-        global g_testThreadsRunning
         fullnode = self.name
-        g_testPassed[fullnode] = False
-        g_testThreadsRunning += 1
         logger.info(f'WebDAVSystemBucketFolders thread started for node {self.name}')
         drv = sunetnextcloud.TestTarget()
 
@@ -499,6 +422,7 @@ class WebDAVSystemBucketFolders(threading.Thread):
 
         client = Client(options)
         client.verify = drv.verify
+        client.session = drv.get_session(fullnode)
 
         folders = ''
         folder = 'test_webdav'
@@ -520,17 +444,13 @@ class WebDAVSystemBucketFolders(threading.Thread):
         except Exception as error:
             logger.error(f'Error in WebDAVSystemBucketFolders thread done for node {self.name}: {error}')
             logger.info(f'Folders: {folder}; Count: {cnt}')
-            g_testPassed[fullnode] = False
-            g_testThreadsRunning -= 1
-            return
+            return False
 
         logger.info(f'WebDAVSystemBucketFolders thread done for node {self.name}')
-        g_testPassed[fullnode] = True
-        g_testThreadsRunning -= 1
+        return True
 
-class WebDAVCreateMoveDelete(threading.Thread):
+class WebDAVCreateMoveDelete:
     def __init__(self, name, basicAuth, target, TestWebDAV):
-        threading.Thread.__init__(self)
         self.name = name
         self.target = target
         self.TestWebDAV = TestWebDAV
@@ -538,11 +458,7 @@ class WebDAVCreateMoveDelete(threading.Thread):
 
     def run(self):
         global logger
-        global g_testPassed
-        global g_testThreadsRunning
         fullnode = self.name
-        g_testPassed[fullnode] = False
-        g_testThreadsRunning += 1
         logger.info(f'WebDAVCreateMoveDelete thread started for node {self.name}')
         drv = sunetnextcloud.TestTarget()
 
@@ -569,9 +485,7 @@ class WebDAVCreateMoveDelete(threading.Thread):
             tmpfilename = tempfile.gettempdir() + '/' + fullnode + '_' + g_filename + '.txt'
         except Exception as error:
             logger.error(f'Getting temp dir for {fullnode}: {error}')
-            g_testPassed[fullnode] = False
-            g_testThreadsRunning -= 1
-            return
+            return False
 
         try:
             with open(tmpfilename, 'w') as f:
@@ -579,29 +493,26 @@ class WebDAVCreateMoveDelete(threading.Thread):
                 f.close()
         except Exception as error:
             logger.error(f'Error writing to file {tmpfilename} for {fullnode}: {error}')
-            g_testThreadsRunning -= 1
-            return
+            return False
 
         try:
             client = Client(options)
             client.verify = drv.verify
+            client.session = drv.get_session(fullnode)
             client.mkdir(self.target)
             targetfile=self.target + '/' + filename
             targetmvfile=self.target + '/' + mvfilename
             # deleteoriginal=False # TODO: Implement delete original file
         except Exception as error:
             logger.error(f'Error preparing webdav client for {fullnode}: {error}')
-            g_testThreadsRunning -= 1
-            return
+            return False
 
         try:
             logger.info(f'Uploading {tmpfilename} to {targetfile}')
             client.upload_sync(remote_path=targetfile, local_path=tmpfilename)
         except Exception as error:
             logger.error(f'Error uploading file to {fullnode}: {error}')
-            g_testPassed[fullnode] = False
-            g_testThreadsRunning -= 1
-            return
+            return False
 
         fileMoved = False
         moveCount = 0
@@ -617,9 +528,7 @@ class WebDAVCreateMoveDelete(threading.Thread):
 
             if moveCount >= 3:
                 logger.error(f'Error moving file {targetfile} after {moveCount} tries')
-                g_testPassed[fullnode] = False
-                g_testThreadsRunning -= 1
-                return
+                return False
 
         fileDeleted = False
         deleteCount = 0
@@ -634,9 +543,7 @@ class WebDAVCreateMoveDelete(threading.Thread):
 
             if deleteCount >= 3:
                 logger.error(f'Error deleting file {targetmvfile} on {fullnode} after {deleteCount} tries')
-                g_testPassed[fullnode] = False
-                g_testThreadsRunning -= 1
-                return
+                return False
 
         try:
             logger.info(f'Removing local temp file: {tmpfilename}')
@@ -646,12 +553,9 @@ class WebDAVCreateMoveDelete(threading.Thread):
                 logger.warning(f"File {filename} not found anymore for node {fullnode}")
         except Exception as error:
             logger.error(f'Error removing the local temp file on {fullnode}: {error}')
-            g_testPassed[fullnode] = False
-            g_testThreadsRunning -= 1
-            return
+            return False
 
-        g_testPassed[fullnode] = True
-        g_testThreadsRunning -= 1
+        return True
 
 class TestWebDAV(unittest.TestCase):
     def test_logger(self):
@@ -661,211 +565,159 @@ class TestWebDAV(unittest.TestCase):
 
     def test_webdav_dne_check_basic_auth(self):
         global logger
-        global g_testThreadsRunning
         logger.info('test_webdav_dne_check')
         drv = sunetnextcloud.TestTarget()
-        for fullnode in drv.nodestotest:
-            with self.subTest(mynode=fullnode):
-                logger.info(f'TestID: {fullnode}')
-                WebDAVDneCheckThread = WebDAVDneCheck(name=fullnode, basicAuth=True, TestWebDAV=self)
-                WebDAVDneCheckThread.start()
-
-        while(g_testThreadsRunning > 0):
-            time.sleep(1)
-
-        for fullnode in drv.nodestotest:
-            with self.subTest(mynode=fullnode):
-                self.assertTrue(g_testPassed[fullnode])
+        drv.prefetch_credentials(g_seleniumBasicCredentials)
+        results = sunetnextcloud.run_node_checks(
+            lambda fullnode: WebDAVDneCheck(name=fullnode, basicAuth=True, TestWebDAV=self).run(),
+            drv.nodestotest,
+        )
+        for result in results:
+            with self.subTest(mynode=result.node):
+                self.assertTrue(result.passed, result.error)
 
     def test_webdav_dne_check_app_token(self):
         global logger
-        global g_testThreadsRunning
         logger.info('test_webdav_dne_check')
         drv = sunetnextcloud.TestTarget()
-        for fullnode in drv.nodestotest:
-            with self.subTest(mynode=fullnode):
-                logger.info(f'TestID: {fullnode}')
-                WebDAVDneCheckThread = WebDAVDneCheck(name=fullnode, basicAuth=False, TestWebDAV=self)
-                WebDAVDneCheckThread.start()
-
-        while(g_testThreadsRunning > 0):
-            time.sleep(1)
-
-        for fullnode in drv.nodestotest:
-            with self.subTest(mynode=fullnode):
-                self.assertTrue(g_testPassed[fullnode])
+        drv.prefetch_credentials(g_seleniumCredentials)
+        results = sunetnextcloud.run_node_checks(
+            lambda fullnode: WebDAVDneCheck(name=fullnode, basicAuth=False, TestWebDAV=self).run(),
+            drv.nodestotest,
+        )
+        for result in results:
+            with self.subTest(mynode=result.node):
+                self.assertTrue(result.passed, result.error)
 
     def test_webdav_list(self):
         global logger
         logger.info('test_webdav_list')
         drv = sunetnextcloud.TestTarget()
-        for fullnode in drv.nodestotest:
-            with self.subTest(mynode=fullnode):
-                logger.info(f'TestID: {fullnode}')
-                WebDAVListThread = WebDAVList(name=fullnode, basicAuth=False, TestWebDAV=self)
-                WebDAVListThread.start()
-
-        while(g_testThreadsRunning > 0):
-            time.sleep(1)
-
-        for fullnode in drv.nodestotest:
-            with self.subTest(mynode=fullnode):
-                self.assertTrue(g_testPassed[fullnode])
+        drv.prefetch_credentials(g_listCredentials)
+        results = sunetnextcloud.run_node_checks(
+            lambda fullnode: WebDAVList(name=fullnode, basicAuth=False, TestWebDAV=self).run(),
+            drv.nodestotest,
+        )
+        for result in results:
+            with self.subTest(mynode=result.node):
+                self.assertTrue(result.passed, result.error)
 
     def test_webdav_multicheckandremove(self):
         global logger
-        global g_testPassed
         logger.info('test_webdav_multicheckandremove')
         drv = sunetnextcloud.TestTarget()
-        for fullnode in drv.nodestotest:
-            logger.info(f'WebDAV multicheck for {fullnode}')
-            with self.subTest(mynode=fullnode):
-                logger.info(f'TestID: {fullnode}')
-                WebDAVMultiCheckAndRemoveThread = WebDAVMultiCheckAndRemove(name=fullnode, basicAuth=False, TestWebDAV=self)
-                WebDAVMultiCheckAndRemoveThread.start()
-
-        while(g_testThreadsRunning > 0):
-            time.sleep(1)
-
-        for fullnode in drv.nodestotest:
-            with self.subTest(mynode=fullnode):
-                self.assertTrue(g_testPassed[fullnode])
+        drv.prefetch_credentials(g_seleniumCredentials)
+        results = sunetnextcloud.run_node_checks(
+            lambda fullnode: WebDAVMultiCheckAndRemove(name=fullnode, basicAuth=False, TestWebDAV=self).run(),
+            drv.nodestotest,
+        )
+        for result in results:
+            with self.subTest(mynode=result.node):
+                self.assertTrue(result.passed, result.error)
 
     def test_clean_seleniumuserfolders(self):
         global logger
         logger.info('test_clean_seleniumuserfolders')
         drv = sunetnextcloud.TestTarget()
-        for fullnode in drv.nodestotest:
-            with self.subTest(mynode=fullnode):
-                logger.info(f'TestID: {fullnode}')
-                WebDAVCleanSeleniumFoldersThread = WebDAVCleanSeleniumFolders(name=fullnode, basicAuth=False, TestWebDAV=self)
-                WebDAVCleanSeleniumFoldersThread.start()
-
-        while(g_testThreadsRunning > 0):
-            time.sleep(1)
-
-        for fullnode in drv.nodestotest:
-            with self.subTest(mynode=fullnode):
-                self.assertTrue(g_testPassed[fullnode])
+        drv.prefetch_credentials(g_seleniumCredentials)
+        results = sunetnextcloud.run_node_checks(
+            lambda fullnode: WebDAVCleanSeleniumFolders(name=fullnode, basicAuth=False, TestWebDAV=self).run(),
+            drv.nodestotest,
+        )
+        for result in results:
+            with self.subTest(mynode=result.node):
+                self.assertTrue(result.passed, result.error)
 
     def test_sharing_folders(self):
         global logger
         logger.info('test_sharing_folders')
         drv = sunetnextcloud.TestTarget()
-        for fullnode in drv.nodestotest:
-            with self.subTest(mynode=fullnode):
-                logger.info(f'TestID: {fullnode}')
-                WebDAVMakeSharingFolderThread = WebDAVMakeSharingFolder(name=fullnode, basicAuth=False, TestWebDAV=self)
-                WebDAVMakeSharingFolderThread.start()
-
-        while(g_testThreadsRunning > 0):
-            time.sleep(1)
-
-        for fullnode in drv.nodestotest:
-            with self.subTest(mynode=fullnode):
-                self.assertTrue(g_testPassed[fullnode])
+        drv.prefetch_credentials(g_seleniumCredentials)
+        results = sunetnextcloud.run_node_checks(
+            lambda fullnode: WebDAVMakeSharingFolder(name=fullnode, basicAuth=False, TestWebDAV=self).run(),
+            drv.nodestotest,
+        )
+        for result in results:
+            with self.subTest(mynode=result.node):
+                self.assertTrue(result.passed, result.error)
 
     def test_personal_bucket_folders(self):
         global logger
         logger.info('test_personal_bucket_folders')
         drv = sunetnextcloud.TestTarget()
-        for fullnode in drv.nodestotest:
-            with self.subTest(mynode=fullnode):
-                logger.info(f'TestID: {fullnode}')
-                WebDAVPersonalBucketFoldersThread = WebDAVPersonalBucketFolders(name=fullnode, basicAuth=False, TestWebDAV=self)
-                WebDAVPersonalBucketFoldersThread.start()
-
-        while(g_testThreadsRunning > 0):
-            time.sleep(1)
-
-        for fullnode in drv.nodestotest:
-            with self.subTest(mynode=fullnode):
-                self.assertTrue(g_testPassed[fullnode])
+        drv.prefetch_credentials(g_seleniumCredentials)
+        results = sunetnextcloud.run_node_checks(
+            lambda fullnode: WebDAVPersonalBucketFolders(name=fullnode, basicAuth=False, TestWebDAV=self).run(),
+            drv.nodestotest,
+        )
+        for result in results:
+            with self.subTest(mynode=result.node):
+                self.assertTrue(result.passed, result.error)
 
     def test_system_bucket_folders(self):
         global logger
         logger.info('test_system_bucket_folders')
         drv = sunetnextcloud.TestTarget()
-        for fullnode in drv.nodestotest:
-            with self.subTest(mynode=fullnode):
-                logger.info(f'TestID: {fullnode}')
-                WebDAVSystemBucketFoldersThread = WebDAVSystemBucketFolders(name=fullnode, basicAuth=False, TestWebDAV=self)
-                WebDAVSystemBucketFoldersThread.start()
-
-        while(g_testThreadsRunning > 0):
-            time.sleep(1)
-
-        for fullnode in drv.nodestotest:
-            with self.subTest(mynode=fullnode):
-                self.assertTrue(g_testPassed[fullnode])
+        drv.prefetch_credentials(g_seleniumCredentials)
+        results = sunetnextcloud.run_node_checks(
+            lambda fullnode: WebDAVSystemBucketFolders(name=fullnode, basicAuth=False, TestWebDAV=self).run(),
+            drv.nodestotest,
+        )
+        for result in results:
+            with self.subTest(mynode=result.node):
+                self.assertTrue(result.passed, result.error)
 
     def test_cmd_in_home_folder(self):
         global logger
         logger.info('test_cmd_in_home_folder')
         drv = sunetnextcloud.TestTarget()
-        for fullnode in drv.nodestotest:
-            with self.subTest(mynode=fullnode):
-                logger.info(f'TestID: {fullnode}')
-                WebDAVSystemBucketFoldersThread = WebDAVCreateMoveDelete(name=fullnode, target='selenium-home', basicAuth=False, TestWebDAV=self)
-                WebDAVSystemBucketFoldersThread.start()
-
-        while(g_testThreadsRunning > 0):
-            time.sleep(1)
-
-        for fullnode in drv.nodestotest:
-            with self.subTest(mynode=fullnode):
-                self.assertTrue(g_testPassed[fullnode])
+        drv.prefetch_credentials(g_seleniumCredentials)
+        results = sunetnextcloud.run_node_checks(
+            lambda fullnode: WebDAVCreateMoveDelete(name=fullnode, target='selenium-home', basicAuth=False, TestWebDAV=self).run(),
+            drv.nodestotest,
+        )
+        for result in results:
+            with self.subTest(mynode=result.node):
+                self.assertTrue(result.passed, result.error)
 
     def test_cmd_in_personal_bucket(self):
         global logger
         logger.info('test_cmd_in_personal_bucket')
         drv = sunetnextcloud.TestTarget()
-        for fullnode in drv.nodestotest:
-            with self.subTest(mynode=fullnode):
-                logger.info(f'TestID: {fullnode}')
-                WebDAVSystemBucketFoldersThread = WebDAVCreateMoveDelete(name=fullnode, target=g_personalBucket, basicAuth=False, TestWebDAV=self)
-                WebDAVSystemBucketFoldersThread.start()
-
-        while(g_testThreadsRunning > 0):
-            time.sleep(1)
-
-        for fullnode in drv.nodestotest:
-            with self.subTest(mynode=fullnode):
-                self.assertTrue(g_testPassed[fullnode])
+        drv.prefetch_credentials(g_seleniumCredentials)
+        results = sunetnextcloud.run_node_checks(
+            lambda fullnode: WebDAVCreateMoveDelete(name=fullnode, target=g_personalBucket, basicAuth=False, TestWebDAV=self).run(),
+            drv.nodestotest,
+        )
+        for result in results:
+            with self.subTest(mynode=result.node):
+                self.assertTrue(result.passed, result.error)
 
     def test_cmd_in_system_bucket(self):
         global logger
         logger.info('test_cmd_in_system_bucket')
         drv = sunetnextcloud.TestTarget()
-        for fullnode in drv.nodestotest:
-            with self.subTest(mynode=fullnode):
-                logger.info(f'TestID: {fullnode}')
-                WebDAVSystemBucketFoldersThread = WebDAVCreateMoveDelete(name=fullnode, target=g_systemBucket, basicAuth=False, TestWebDAV=self)
-                WebDAVSystemBucketFoldersThread.start()
-
-        while(g_testThreadsRunning > 0):
-            time.sleep(1)
-
-        for fullnode in drv.nodestotest:
-            with self.subTest(mynode=fullnode):
-                self.assertTrue(g_testPassed[fullnode])
+        drv.prefetch_credentials(g_seleniumCredentials)
+        results = sunetnextcloud.run_node_checks(
+            lambda fullnode: WebDAVCreateMoveDelete(name=fullnode, target=g_systemBucket, basicAuth=False, TestWebDAV=self).run(),
+            drv.nodestotest,
+        )
+        for result in results:
+            with self.subTest(mynode=result.node):
+                self.assertTrue(result.passed, result.error)
 
     def test_empty_trashbin(self):
         global logger
         logger.info('test_empty_trashbin')
         drv = sunetnextcloud.TestTarget()
-        for fullnode in drv.nodestotest:
-            with self.subTest(mynode=fullnode):
-                logger.info(f'TestID: {fullnode}')
-                WebDAVCleanTrashbinThread = WebDAVCleanTrashbin(name=fullnode, basicAuth=False, TestWebDAV=self)
-                WebDAVCleanTrashbinThread.start()
-
-        while(g_testThreadsRunning > 0):
-            time.sleep(1)
-
-        for fullnode in drv.nodestotest:
-            with self.subTest(mynode=fullnode):
-                self.assertTrue(g_testPassed[fullnode])
+        drv.prefetch_credentials(g_seleniumCredentials)
+        results = sunetnextcloud.run_node_checks(
+            lambda fullnode: WebDAVCleanTrashbin(name=fullnode, basicAuth=False, TestWebDAV=self).run(),
+            drv.nodestotest,
+        )
+        for result in results:
+            with self.subTest(mynode=result.node):
+                self.assertTrue(result.passed, result.error)
 
 if __name__ == '__main__':
     if drv.testrunner == "xml":